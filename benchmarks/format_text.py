@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+
+"""
+
+Copyright (C) 2020 Powi (powi@powi.fr)
+
+This file is part of PraxisBot.
+
+PraxisBot is free software: you can redistribute it and/or  modify
+it under the terms of the GNU Affero General Public License, version 3,
+as published by the Free Software Foundation.
+
+PraxisBot is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with PraxisBot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+#Micro-benchmark of ExecutionScope.format_text: tags rendered per second
+#with the previous regex/if-chain implementation and with compiled templates.
+#Run from the repository root: python3 benchmarks/format_text.py
+
+import os
+import sys
+import re
+import time
+import random
+import datetime
+from pytz import timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import praxisbot
+
+class FakeObject:
+	def __init__(self, **kwargs):
+		self.__dict__.update(kwargs)
+
+class FakeShell:
+	def __init__(self, member):
+		self.member = member
+
+	def find_member(self, name, guild):
+		return self.member
+
+	def find_channel(self, name, guild):
+		return None
+
+	def find_role(self, name, guild):
+		return None
+
+def legacy_format_text(self, text):
+	if not text:
+		return ""
+
+	p = re.compile("\{\{([^\}]+)\}\}")
+
+	formatedText = ""
+	textIter = 0
+	mi = p.finditer(text)
+	for m in mi:
+		formatedText = formatedText + text[textIter:m.start()]
+		textIter = m.end()
+
+		tag = m.group(1).strip()
+		tagOutput = m.group()
+
+		if tag.find('|') >= 0:
+			tag = random.choice(tag.split("|"))
+			tagOutput = tag
+
+		u = self.user
+		user_chk = re.fullmatch('([*@#]?user(?:_time|_avatar)?)=(.*)', tag)
+		if user_chk:
+			subUser = user_chk.group(2).strip()
+			if subUser in self.vars:
+				subUser = self.vars[subUser].strip()
+			u = self.shell.find_member(subUser, self.guild)
+			tag = user_chk.group(1)
+
+		c = self.channel
+		channel_chk = re.fullmatch('([*#]?channel)=(.*)', tag)
+		if channel_chk:
+			subChan = channel_chk.group(2).strip()
+			if subChan in self.vars:
+				subChan = self.vars[subChan]
+			c = self.shell.find_channel(subChan, self.guild)
+			tag = channel_chk.group(1)
+
+		r = None
+		role_chk = re.fullmatch('([*@]?role)=(.*)', tag)
+		if role_chk:
+			subRole = role_chk.group(2).strip()
+			if subRole in self.vars:
+				subRole = self.vars[subRole]
+			r = self.shell.find_role(subRole, self.guild)
+			tag = role_chk.group(1)
+
+		if tag.lower() == "server" and self.guild:
+			tagOutput = self.guild.name
+		elif tag.lower() == "*server" and self.guild:
+			tagOutput = self.guild.id
+		elif tag.lower() == "n":
+			tagOutput = "\n"
+		elif tag.lower() == "now":
+			d = datetime.datetime.now(timezone('Europe/Paris'))
+			tagOutput = d.strftime("%Y-%m-%d %H:%M:%S")
+		elif tag.lower() == "channel" and c:
+			tagOutput = c.name
+		elif tag.lower() == "#channel" and c:
+			tagOutput = c.mention
+		elif tag.lower() == "*channel" and c:
+			tagOutput = c.id
+		elif tag.lower() == "role" and r:
+			tagOutput = r.name
+		elif tag.lower() == "@role" and r:
+			tagOutput = r.mention
+		elif tag.lower() == "*role" and r:
+			tagOutput = r.id
+		elif tag.lower() == "#user" and u:
+			tagOutput = "{}#{}".format(u.name,u.discriminator)
+		elif tag.lower() == "@user" and u:
+			tagOutput = u.mention
+		elif tag.lower() == "*user" and u:
+			tagOutput = u.id
+		elif tag.lower() == "user" and u:
+			tagOutput = u.display_name
+		elif tag.lower() == "user_time" and u:
+			tagOutput = str(u.created_at)
+		elif tag.lower() == "user_avatar" and u:
+			tagOutput = str(u.avatar_url_as(format="png"))
+		elif tag[0] == "*" and tag[1:] in self.vars:
+			if len(self.vars[tag[1:]].strip()) == 0:
+				tagOutput = 0
+			else:
+				s = self.vars[tag[1:]].split("\n")
+				tagOutput = str(len(s))
+		elif tag[0] == "," and tag[1:] in self.vars:
+			s = self.vars[tag[1:]].split("\n")
+			tagOutput = ", ".join(s)
+		elif tag in self.vars:
+			tagOutput = self.vars[tag]
+		else:
+			tagOutput = tag
+		formatedText = formatedText + str(tagOutput)
+
+	formatedText = formatedText + text[textIter:]
+
+	return formatedText
+
+def create_scope():
+	member = FakeObject(id=203135242813440001, name="Powi", discriminator="0001", display_name="Powi", mention="<@203135242813440001>", created_at=datetime.datetime(2016, 8, 1))
+	guild = FakeObject(id=461819232884097054, name="PraxisBot")
+	channel = FakeObject(id=461819232884097055, name="general", mention="<#461819232884097055>")
+
+	scope = praxisbot.ExecutionScope(FakeShell(member), guild, [""])
+	scope.user = member
+	scope.channel = channel
+	scope.vars = {"params": "hello", "target": "Powi#0001", "list": "a\nb\nc"}
+	for i in range(200):
+		scope.vars["var{}".format(i)] = str(i)
+	return scope
+
+TEMPLATES = [
+	"Welcome {{@user}} on {{server}}!{{n}}Please read {{#channel}}.",
+	"{{user=target}} has {{*list}} items: {{,list}}",
+	"Params: {{params}} / {{var42}} / {{unknown}}",
+	"{{#user}} ({{*user}}) in {{channel}} on {{*server}}"
+]
+
+def count_tags(texts):
+	return sum(len(praxisbot.Template.tag_regex.findall(t)) for t in texts)
+
+def run(name, func, scope, duration):
+	tags = count_tags(TEMPLATES)
+	iterations = 0
+	start = time.perf_counter()
+	while time.perf_counter() - start < duration:
+		for t in TEMPLATES:
+			func(scope, t)
+		iterations = iterations+1
+	elapsed = time.perf_counter() - start
+	rate = iterations*tags/elapsed
+	print("{:<10} {:>12.0f} tags/s".format(name, rate))
+	return rate
+
+if __name__ == "__main__":
+	duration = float(sys.argv[1]) if len(sys.argv) > 1 else 2.0
+	scope = create_scope()
+
+	for t in TEMPLATES:
+		if legacy_format_text(scope, t) != scope.format_text(t):
+			print("Mismatch on template {}".format(t))
+			sys.exit(1)
+
+	before = run("before", legacy_format_text, scope, duration)
+	after = run("after", praxisbot.ExecutionScope.format_text, scope, duration)
+	print("speedup    {:>12.2f}x".format(after/before))
@@ -88,8 +88,7 @@ class ActivityPlugin(praxisbot.Plugin):
 		Display server activity during the last month.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return scope
 
@@ -111,8 +110,7 @@ class ActivityPlugin(praxisbot.Plugin):
 		Display server activity during the last month.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return scope
 
@@ -134,8 +132,7 @@ class ActivityPlugin(praxisbot.Plugin):
 		Display server activity during the last year.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return scope
 
@@ -67,14 +67,13 @@ class ArchivePlugin(praxisbot.Plugin):
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('--channel', '-c', help='Channel to archive')
 	async def execute_archive_all(self, scope, command, options, lines, **kwargs):
 		"""
 		Create a text file containing all messages.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('--channel', '-c', help='Channel to archive')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return scope
 
@@ -112,14 +111,13 @@ class ArchivePlugin(praxisbot.Plugin):
 		f.close()
 
 	@praxisbot.command
+	@praxisbot.argument('--channel', '-c', help='Channel to archive')
 	async def execute_archive_last_day(self, scope, command, options, lines, **kwargs):
 		"""
 		Create a text file containing all messages from the last 24h.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('--channel', '-c', help='Channel to archive')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return scope
 
@@ -160,14 +158,13 @@ class ArchivePlugin(praxisbot.Plugin):
 		f.close()
 
 	@praxisbot.command
+	@praxisbot.argument('--channel', '-c', help='Channel to archive')
 	async def execute_archive_pins(self, scope, command, options, lines, **kwargs):
 		"""
 		Create a text file containing all pinned messages.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('--channel', '-c', help='Channel to archive')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return scope
 
@@ -34,13 +34,25 @@ class BoardPlugin(praxisbot.Plugin):
 
 	name = "Board"
 
+	migrations = [
+		[
+			praxisbot.SQLTable("boards", ["id INTEGER PRIMARY KEY", "name TEXT", "discord_sid INTEGER", "discord_cid INTEGER", "discord_mid INTEGER"])
+		],
+		[
+			praxisbot.SQLIndex("boards", ["discord_sid", "name"], unique=True)
+		]
+	]
+
+	queries = [
+		("boards", ["discord_sid", "name"]),
+		("boards", ["discord_sid"])
+	]
+
 	def __init__(self, shell):
 		super().__init__(shell)
 
 		self.boardname_regex = re.compile('[a-zA-Z0-9_-]+')
 
-		self.shell.create_sql_table("boards", ["id INTEGER PRIMARY KEY", "name TEXT", "discord_sid INTEGER", "discord_cid INTEGER", "discord_mid INTEGER"])
-
 		self.add_command("create_board", self.execute_create_board)
 		self.add_command("edit_board", self.execute_edit_board)
 		self.add_command("delete_board", self.execute_delete_board)
@@ -54,17 +66,16 @@ class BoardPlugin(praxisbot.Plugin):
 		return e
 
 	@praxisbot.command
+	@praxisbot.argument('boardname', help='Name of the board')
+	@praxisbot.argument('--channel', '-c', help='Channel where the board will be.')
+	@praxisbot.argument('--content', help='Channel where the board will be.')
+	@praxisbot.argument('--format', action='store_true', help='Apply PraxisBot text formating.')
 	async def execute_create_board(self, scope, command, options, lines, **kwargs):
 		"""
 		Create a new board.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('boardname', help='Name of the board')
-		parser.add_argument('--channel', '-c', help='Channel where the board will be.')
-		parser.add_argument('--content', help='Channel where the board will be.')
-		parser.add_argument('--format', action='store_true', help='Apply PraxisBot text formating.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -84,7 +95,7 @@ class BoardPlugin(praxisbot.Plugin):
 			await scope.shell.print_permission(scope, "You don't have write permission in this channel.")
 			return
 
-		boardId = scope.shell.get_sql_data("boards", ["id"], {"discord_sid": int(scope.guild.id), "name": str(boardname)})
+		boardId = await scope.shell.get_sql_data("boards", ["id"], {"discord_sid": int(scope.guild.id), "name": str(boardname)}, scope=scope)
 		if boardId:
 			await scope.shell.print_error(scope, "The board `"+boardname+"` already exists.")
 			return
@@ -101,24 +112,23 @@ class BoardPlugin(praxisbot.Plugin):
 
 		e = self.create_embed(boardname, scope.user);
 		m = await chan.send(content, embed=e)
-		scope.shell.set_sql_data("boards", {"discord_cid": int(m.channel.id), "discord_mid": int(m.id)}, {"discord_sid": int(m.guild.id), "name": str(boardname)})
+		await scope.shell.set_sql_data("boards", {"discord_cid": int(m.channel.id), "discord_mid": int(m.id)}, {"discord_sid": int(m.guild.id), "name": str(boardname)}, scope=scope)
 
 	@praxisbot.command
+	@praxisbot.argument('boardname', help='Name of the board')
 	async def execute_delete_board(self, scope, command, options, lines, **kwargs):
 		"""
 		Make a board no longer editable.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('boardname', help='Name of the board')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		boardname = scope.format_text(args.boardname)
 		self.ensure_object_name("Board name", boardname)
 
-		board = scope.shell.get_sql_data("boards", ["id", "discord_cid", "discord_mid"], {"discord_sid": int(scope.guild.id), "name": str(boardname)})
+		board = await scope.shell.get_sql_data("boards", ["id", "discord_cid", "discord_mid"], {"discord_sid": int(scope.guild.id), "name": str(boardname)}, scope=scope)
 		if not board:
 			await scope.shell.print_error(scope, "Board `{}` not found.".format(boardname))
 			return
@@ -128,28 +138,27 @@ class BoardPlugin(praxisbot.Plugin):
 			await scope.shell.print_permission(scope, "You don't have write permission in this channel.")
 			return
 
-		scope.shell.delete_sql_data("boards", {"id": board[0]})
+		await scope.shell.delete_sql_data("boards", {"id": board[0]}, scope=scope)
 
 		await scope.shell.print_success(scope, "Board `{}` deleted.".format(boardname))
 
 	@praxisbot.command
+	@praxisbot.argument('boardname', help='Name of the board')
+	@praxisbot.argument('--content', help='Channel where the board will be.')
+	@praxisbot.argument('--format', action='store_true', help='Apply PraxisBot text formating.')
 	async def execute_edit_board(self, scope, command, options, lines, **kwargs):
 		"""
 		Edit a board. Content of the board must be written in the second line, or with the parameter --content.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('boardname', help='Name of the board')
-		parser.add_argument('--content', help='Channel where the board will be.')
-		parser.add_argument('--format', action='store_true', help='Apply PraxisBot text formating.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		boardname = scope.format_text(args.boardname)
 		self.ensure_object_name("Board name", boardname)
 
-		board = scope.shell.get_sql_data("boards", ["id", "discord_cid", "discord_mid"], {"discord_sid": int(scope.guild.id), "name": str(boardname)})
+		board = await scope.shell.get_sql_data("boards", ["id", "discord_cid", "discord_mid"], {"discord_sid": int(scope.guild.id), "name": str(boardname)}, scope=scope)
 		if not board:
 			await scope.shell.print_error(scope, "Board `"+boardname+"` not found.")
 			return
@@ -187,21 +196,20 @@ class BoardPlugin(praxisbot.Plugin):
 		await scope.shell.print_success(scope, "Board `"+boardname+"` edited.")
 
 	@praxisbot.command
+	@praxisbot.argument('boardname', help='Name of the board')
 	async def execute_show_board(self, scope, command, options, lines, **kwargs):
 		"""
 		Show the source code of a board.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('boardname', help='Name of the board')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		boardname = scope.format_text(args.boardname)
 		self.ensure_object_name("Board name", boardname)
 
-		board = scope.shell.get_sql_data("boards", ["id", "discord_cid", "discord_mid"], {"discord_sid": int(scope.guild.id), "name": str(boardname)})
+		board = await scope.shell.get_sql_data("boards", ["id", "discord_cid", "discord_mid"], {"discord_sid": int(scope.guild.id), "name": str(boardname)}, scope=scope)
 		if not board:
 			await scope.shell.print_error(scope, "Board `"+boardname+"` not found.")
 			return
@@ -231,23 +239,20 @@ class BoardPlugin(praxisbot.Plugin):
 		List all boards.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		stream = praxisbot.MessageStream(scope)
 		await stream.send("**List of boards**\n")
 
-		with scope.shell.dbcon:
-			c = scope.shell.dbcon.cursor()
-			for row in c.execute("SELECT name, discord_cid FROM "+scope.shell.dbtable("boards")+" WHERE discord_sid = ? ORDER BY name", [int(scope.guild.id)]):
+		for row in await scope.db.fetchall("SELECT name, discord_cid FROM "+scope.shell.dbtable("boards")+" WHERE discord_sid = ? ORDER BY name", [int(scope.guild.id)]):
 
-				chan = scope.shell.find_channel(str(row[1]), scope.guild)
-				if not chan:
-					continue
-				if scope.permission < praxisbot.UserPermission.Script and not chan.permissions_for(scope.user).read_messages:
-					continue
-				await stream.send("\n - `"+row[0]+"` in "+chan.mention)
+			chan = scope.shell.find_channel(str(row[1]), scope.guild)
+			if not chan:
+				continue
+			if scope.permission < praxisbot.UserPermission.Script and not chan.permissions_for(scope.user).read_messages:
+				continue
+			await stream.send("\n - `"+row[0]+"` in "+chan.mention)
 
 		await stream.finish()
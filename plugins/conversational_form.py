@@ -19,6 +19,7 @@ along with PraxisBot.  If not, see <http://www.gnu.org/licenses/>.
 
 """
 
+import asyncio
 import shlex
 import argparse
 import re
@@ -26,6 +27,8 @@ import requests
 import traceback
 import io
 import datetime
+import heapq
+import json
 from pytz import timezone
 from dateutil.relativedelta import relativedelta
 import praxisbot
@@ -43,6 +46,116 @@ class Session:
 		self.start_time = datetime.datetime.now()
 		self.last_time = self.start_time
 
+	def expiry(self):
+		return (self.last_time + self.timeout_duration).timestamp()
+
+def format_timeout(timeout):
+	return "{}-{}-{} {}:{}:{}".format(timeout.years, timeout.months, timeout.days, timeout.hours, timeout.minutes, timeout.seconds)
+
+def parse_timeout(text):
+	r = re.match("([0-9]+)-([0-9]+)-([0-9]+) ([0-9]+):([0-9]+):([0-9]+)", text)
+	if not r:
+		return None
+	return relativedelta(years=int(r.group(1)), months=int(r.group(2)), days=int(r.group(3)), hours=int(r.group(4)), minutes=int(r.group(5)), seconds=int(r.group(6)))
+
+class SessionStore:
+	"""
+	Sessions keyed by (user id, channel id, guild id), with a heap of expiry times per guild so that only expired sessions are visited.
+	Sessions changed since the last snapshot are listed in dirty
+	"""
+
+	def __init__(self):
+		self.sessions = {}
+		self.expiries = {}
+		self.dirty = set()
+
+	def __contains__(self, key):
+		return key in self.sessions
+
+	def __getitem__(self, key):
+		return self.sessions[key]
+
+	def get(self, key):
+		return self.sessions.get(key)
+
+	def put(self, key, session, dirty=True):
+		self.sessions[key] = session
+		heapq.heappush(self.expiries.setdefault(key[2], []), (session.expiry(), key))
+		if dirty:
+			self.dirty.add(key)
+
+	def touch(self, key):
+		"""
+		Mark the session as used now, which delays its expiry
+		"""
+		session = self.sessions[key]
+		session.last_time = datetime.datetime.now()
+		self.put(key, session)
+
+	def remove(self, key):
+		if self.sessions.pop(key, None):
+			self.dirty.add(key)
+
+	def is_current(self, entry):
+		#Entries of the heap are left behind when a session is touched or removed
+		session = self.sessions.get(entry[1])
+		return session != None and session.expiry() == entry[0]
+
+	def next_expiry(self, guild_id):
+		heap = self.expiries.get(guild_id)
+		while heap and not self.is_current(heap[0]):
+			heapq.heappop(heap)
+		if not heap:
+			self.expiries.pop(guild_id, None)
+			return None
+		return heap[0][0]
+
+	def pop_expired(self, guild_id, now):
+		"""
+		Take out of the heap the sessions of the guild expired at now, and return their keys
+		"""
+		expired = []
+		heap = self.expiries.get(guild_id, [])
+		while heap and heap[0][0] <= now:
+			entry = heapq.heappop(heap)
+			if self.is_current(entry) and entry[1] not in expired:
+				expired.append(entry[1])
+		return expired
+
+	def guild_sessions(self, guild_id):
+		return [(k, s) for k, s in self.sessions.items() if k[2] == guild_id]
+
+	def take_dirty(self):
+		dirty = self.dirty
+		self.dirty = set()
+		return [(k, self.sessions.get(k)) for k in dirty]
+
+class FormLink:
+	def __init__(self, node_end, script, value):
+		self.node_end = node_end
+		self.script = script
+		self.value = value
+
+class FormGraph:
+	"""
+	Nodes and links of the conversational forms of a guild. Links leaving a node are grouped by type and sorted by priority
+	"""
+
+	def __init__(self, nodes, links):
+		self.nodes = dict(nodes)
+		self.links = {}
+		for node_start, node_end, script, type, value, priority in sorted(links, key=lambda l: -(l[5] or 0)):
+			if type == LinkType.UserRegex:
+				#Compile once, in the shared cache; links with an invalid pattern can never be followed
+				try:
+					praxisbot.regex_cache.compile(value)
+				except re.error:
+					continue
+			self.links.setdefault((node_start, type), []).append(FormLink(node_end, script, value))
+
+	def get_links(self, node, type):
+		return self.links.get((node, type), [])
+
 class ConversationalFormPlugin(praxisbot.Plugin):
 	"""
 	ConversationalForm commands
@@ -50,13 +163,40 @@ class ConversationalFormPlugin(praxisbot.Plugin):
 
 	name = "ConversationalForm"
 
+	migrations = [
+		[
+			praxisbot.SQLTable("cf_nodes", ["id INTEGER PRIMARY KEY", "name TEXT", "discord_sid INTEGER", "script TEXT"]),
+			praxisbot.SQLTable("cf_links", ["id INTEGER PRIMARY KEY", "node_start TEXT", "node_end TEXT", "discord_sid INTEGER", "script TEXT", "type INTEGER", "value TEXT", "priority INTEGER"])
+		],
+		[
+			praxisbot.SQLIndex("cf_nodes", ["discord_sid", "name"], unique=True),
+			praxisbot.SQLIndex("cf_links", ["discord_sid", "node_start", "node_end"], unique=True),
+			praxisbot.SQLIndex("cf_links", ["discord_sid", "node_end"])
+		],
+		[
+			praxisbot.SQLTable("cf_sessions", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "discord_uid INTEGER", "discord_cid INTEGER", "node TEXT", "vars TEXT", "timeout TEXT", "start_time TEXT", "last_time TEXT"]),
+			praxisbot.SQLIndex("cf_sessions", ["discord_sid", "discord_uid", "discord_cid"], unique=True)
+		]
+	]
+
+	queries = [
+		("cf_nodes", ["discord_sid", "name"]),
+		("cf_nodes", ["discord_sid"]),
+		("cf_links", ["discord_sid", "node_start", "node_end"]),
+		("cf_links", ["discord_sid", "node_start", "type"]),
+		("cf_links", ["discord_sid", "node_end"]),
+		("cf_links", ["discord_sid"]),
+		("cf_sessions", ["discord_sid", "discord_uid", "discord_cid"]),
+		("cf_sessions", ["discord_sid"])
+	]
+
 	def __init__(self, shell):
 		super().__init__(shell)
 
-		self.shell.create_sql_table("cf_nodes", ["id INTEGER PRIMARY KEY", "name TEXT", "discord_sid INTEGER", "script TEXT"])
-		self.shell.create_sql_table("cf_links", ["id INTEGER PRIMARY KEY", "node_start TEXT", "node_end TEXT", "discord_sid INTEGER", "script TEXT", "type INTEGER", "value TEXT", "priority INTEGER"])
-
-		self.sessions = {}
+		self.sessions = SessionStore()
+		self.graphs = {}
+		self.snapshot_delay = 5.0
+		self.snapshot_flush = None
 
 		self.add_command("create_cf_node", self.execute_create_cf_node)
 		self.add_command("create_cf_link", self.execute_create_cf_link)
@@ -67,21 +207,90 @@ class ConversationalFormPlugin(praxisbot.Plugin):
 		self.add_command("end_cf_session", self.execute_end_cf_session)
 		self.add_command("cf_sessions", self.execute_cf_sessions)
 
+	async def on_ready(self, scope):
+		"""
+		Index the sessions saved before a restart. Their variables are loaded on the next message of the user
+		"""
+		for row in await scope.db.fetchall("SELECT discord_uid, discord_cid, node, timeout, start_time, last_time FROM "+scope.shell.dbtable("cf_sessions")+" WHERE discord_sid = ?", [int(scope.guild.id)]):
+			key = (row[0], row[1], scope.guild.id)
+			if key in self.sessions:
+				continue
+			try:
+				session = Session(row[2], parse_timeout(row[3]))
+				session.start_time = datetime.datetime.fromisoformat(row[4])
+				session.last_time = datetime.datetime.fromisoformat(row[5])
+				session.vars = None
+				self.sessions.put(key, session, dirty=False)
+				self.shell.add_reaction_listener((key[1], key[0]), self)
+			except (TypeError, ValueError):
+				self.log.warning("Invalid saved session %s", key, extra={"guild": scope.guild.id})
+		self.schedule_timeouts(scope.guild)
+
+	async def on_close(self):
+		await self.snapshot_sessions()
+
+	async def load_session(self, scope, key):
+		session = self.sessions.get(key)
+		if session and session.vars == None:
+			row = await scope.db.fetchone("SELECT vars FROM "+scope.shell.dbtable("cf_sessions")+" WHERE discord_sid = ? AND discord_uid = ? AND discord_cid = ?", [key[2], key[0], key[1]])
+			session.vars = json.loads(row[0]) if row and row[0] else {}
+		return session
+
+	def queue_snapshot(self):
+		if self.sessions.dirty and not self.snapshot_flush:
+			self.snapshot_flush = asyncio.get_event_loop().call_later(self.snapshot_delay, lambda: asyncio.ensure_future(self.snapshot_sessions()))
+
+	async def snapshot_sessions(self):
+		"""
+		Persist the sessions changed since the last snapshot in one transaction
+		"""
+		if self.snapshot_flush:
+			self.snapshot_flush.cancel()
+			self.snapshot_flush = None
+
+		statements = []
+		for key, session in self.sessions.take_dirty():
+			where = {"discord_sid": key[2], "discord_uid": key[0], "discord_cid": key[1]}
+			if not session:
+				statements.append(self.shell.sql_delete("cf_sessions", where))
+				continue
+			fields = {"node": session.current_node, "timeout": format_timeout(session.timeout_duration), "start_time": session.start_time.isoformat(" "), "last_time": session.last_time.isoformat(" ")}
+			if session.vars != None:
+				fields["vars"] = json.dumps(session.vars, default=str)
+			statements.append(self.shell.sql_upsert("cf_sessions", fields, where))
+		if statements:
+			await self.shell.db.execute_batch(statements)
+
 	def start_session(self, user, channel, server, node_start, timeout):
 		key = (user.id, channel.id, server.id)
-		self.sessions[key] = Session(node_start, timeout)
+		self.sessions.put(key, Session(node_start, timeout))
+		self.shell.add_reaction_listener((channel.id, user.id), self)
+		self.schedule_timeouts(server)
+		self.queue_snapshot()
+
+	def schedule_timeouts(self, server):
+		"""
+		Wake up the guild when its first session times out
+		"""
+		due = self.sessions.next_expiry(server.id)
+		if due == None:
+			self.unschedule(server, "timeouts")
+			return
+
+		scheduled = self.scheduled(server, "timeouts")
+		if scheduled == None or due < scheduled:
+			self.schedule(server, "timeouts", self.execute_timeouts, due=due)
 
 	def end_session(self, user, channel, server):
-		key = (user.id, channel.id, server.id)
-		if key in self.sessions:
-			del(self.sessions[key])
+		self.remove_session((user.id, channel.id, server.id))
+
+	def remove_session(self, key):
+		self.sessions.remove(key)
+		self.shell.remove_reaction_listener((key[1], key[0]), self)
+		self.queue_snapshot()
 
 	def get_session(self, user, channel, server):
-		key = (user.id, channel.id, server.id)
-		if key in self.sessions:
-			return self.sessions[key]
-		else:
-			return None
+		return self.sessions.get((user.id, channel.id, server.id))
 
 	async def execute_session_script(self, user, channel, server, scope, script):
 		key = (user.id, channel.id, server.id)
@@ -94,19 +303,32 @@ class ConversationalFormPlugin(praxisbot.Plugin):
 		subScope.channel = channel
 		subScope.permission = praxisbot.UserPermission.Script
 		subScope.verbose = 1
-
-		for v in self.sessions[key].vars:
-			subScope.session_vars[v] = self.sessions[key].vars[v]
-			subScope.vars[v] = self.sessions[key].vars[v]
+		subScope.set_session_vars(self.sessions[key].vars)
 
 		await scope.shell.execute_script(subScope, script)
 
 		if key not in self.sessions:
 			return
 
-		for v in subScope.session_vars:
-			self.sessions[key].vars[v] = subScope.session_vars[v]
-		self.sessions[key].last_time = datetime.datetime.now()
+		self.sessions.touch(key)
+		self.queue_snapshot()
+
+	async def get_graph(self, scope):
+		"""
+		Graph of the conversational forms of the guild, loaded on first use after a change
+		"""
+		graph = self.graphs.get(scope.guild.id)
+		if not graph:
+			nodes = await scope.db.fetchall("SELECT name, script FROM "+scope.shell.dbtable("cf_nodes")+" WHERE discord_sid = ?", [int(scope.guild.id)])
+			links = await scope.db.fetchall("SELECT node_start, node_end, script, type, value, priority FROM "+scope.shell.dbtable("cf_links")+" WHERE discord_sid = ? ORDER BY id", [int(scope.guild.id)])
+			graph = FormGraph(nodes, links)
+			self.graphs[scope.guild.id] = graph
+		return graph
+
+	def invalidate_graph(self, scope):
+		#The graph is loaded again from the database, also if the change is rolled back
+		self.graphs.pop(scope.guild.id, None)
+		scope.on_rollback(lambda: self.graphs.pop(scope.guild.id, None))
 
 	async def execute_session_node(self, user, channel, server, scope):
 		key = (user.id, channel.id, server.id)
@@ -114,106 +336,96 @@ class ConversationalFormPlugin(praxisbot.Plugin):
 			return
 
 		node = self.sessions[key].current_node
-		node_data = scope.shell.get_sql_data("cf_nodes", ["script"], {"discord_sid":int(scope.guild.id), "name":str(node)})
-		if not node_data:
-			del(self.sessions[key])
+		graph = await self.get_graph(scope)
+		if node not in graph.nodes:
+			self.remove_session(key)
 			return
 
-		await self.execute_session_script(user, channel, server, scope, node_data[0])
+		await self.execute_session_script(user, channel, server, scope, graph.nodes[node])
 
-	async def on_loop(self, scope):
-		sessions_to_delete = set()
-		for s in self.sessions:
-			timeout_time = self.sessions[s].last_time + self.sessions[s].timeout_duration
-			if timeout_time < datetime.datetime.now():
-				sessions_to_delete.add(s)
+	async def execute_timeouts(self, scope):
+		for key in self.sessions.pop_expired(scope.guild.id, datetime.datetime.now().timestamp()):
+			self.remove_session(key)
 
-		for s in sessions_to_delete:
-			if s in self.sessions:
-				del(self.sessions[s])
+		#Sessions used since they were scheduled time out later
+		self.schedule_timeouts(scope.guild)
 
 	async def on_message(self, scope, message, command_found):
 		if command_found:
 			return
 
-		session = self.get_session(scope.user, scope.channel, scope.guild)
+		session = await self.load_session(scope, (scope.user.id, scope.channel.id, scope.guild.id))
 		if not session:
 			return
 
-		node = session.current_node
-		with scope.shell.dbcon:
-			c = scope.shell.dbcon.cursor()
-			for row in c.execute("SELECT node_end, script, value FROM "+scope.shell.dbtable("cf_links")+" WHERE discord_sid = ? AND node_start = ? AND type = ? ORDER BY priority DESC, node_start", [int(scope.guild.id), str(node), int(LinkType.UserRegex)]):
-				try:
-					if not re.search(row[2], message.content):
-						continue
-				except:
+		graph = await self.get_graph(scope)
+		for link in graph.get_links(session.current_node, LinkType.UserRegex):
+			try:
+				if not await praxisbot.regex_cache.search(link.value, message.content):
 					continue
+			except:
+				continue
 
-				subScope = scope.create_subscope()
-				subScope.vars["message"] = message.content
-				await self.execute_session_script(scope.user, scope.channel, scope.guild, subScope, row[1])
+			scope.vars["message"] = message.content
+			await self.execute_session_script(scope.user, scope.channel, scope.guild, scope, link.script)
 
-				session.current_node = row[0]
-				await self.execute_session_node(scope.user, scope.channel, scope.guild, scope)
-				return
+			session.current_node = link.node_end
+			await self.execute_session_node(scope.user, scope.channel, scope.guild, scope)
+			return
 
 	def check_emoji(self, reaction, emoji):
 		e = str(reaction.emoji)
 		return e.startswith(emoji)
 
 	async def on_reaction(self, scope, reaction):
-		session = self.get_session(scope.user, scope.channel, scope.guild)
+		session = await self.load_session(scope, (scope.user.id, scope.channel.id, scope.guild.id))
 		if not session:
 			return
-		node = session.current_node
-		with scope.shell.dbcon:
-			c = scope.shell.dbcon.cursor()
-			for row in c.execute("SELECT node_end, script, value FROM "+scope.shell.dbtable("cf_links")+" WHERE discord_sid = ? AND node_start = ? AND type = ? ORDER BY priority DESC, node_start", [int(scope.guild.id), str(node), int(LinkType.Reaction)]):
-				if self.check_emoji(reaction, row[2]):
-					await self.execute_session_script(scope.user, scope.channel, scope.guild, scope, row[1])
+		graph = await self.get_graph(scope)
+		for link in graph.get_links(session.current_node, LinkType.Reaction):
+			if self.check_emoji(reaction, link.value):
+				await self.execute_session_script(scope.user, scope.channel, scope.guild, scope, link.script)
 
-					session.current_node = row[0]
-					await self.execute_session_node(scope.user, scope.channel, scope.guild, scope)
-					return
+				session.current_node = link.node_end
+				await self.execute_session_node(scope.user, scope.channel, scope.guild, scope)
+				return
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('name', help='Text to send')
 	async def execute_create_cf_node(self, scope, command, options, lines, **kwargs):
 		"""
 		Create a new node.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('name', help='Text to send')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		self.ensure_object_name("Node name", args.name)
 
-		#node = scope.shell.get_sql_data("cf_nodes", ["id"], {"discord_sid":int(scope.guild.id), "name":str(args.name)})
+		#node = await scope.shell.get_sql_data("cf_nodes", ["id"], {"discord_sid":int(scope.guild.id), "name":str(args.name)})
 		#if node:
 		#	await scope.shell.print_error(scope, "Node `"+args.name+"` already exists.")
 		#	return
 
-		scope.shell.set_sql_data("cf_nodes", {"script": "\n".join(lines)}, {"discord_sid":int(scope.guild.id), "name":str(args.name)})
+		await scope.shell.set_sql_data("cf_nodes", {"script": "\n".join(lines)}, {"discord_sid":int(scope.guild.id), "name":str(args.name)}, scope=scope)
+		self.invalidate_graph(scope)
 		await scope.shell.print_success(scope, "Node `"+args.name+"` created.")
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('start', help='Name of the starting node')
+	@praxisbot.argument('end', help='Name of the final node')
+	@praxisbot.argument('--message', help='Link activated if a message match a regular expression.')
+	@praxisbot.argument('--reaction', help='Link activated if a reaction is added in this channel.')
+	@praxisbot.argument('--priority', help='Priority of the link')
 	async def execute_create_cf_link(self, scope, command, options, lines, **kwargs):
 		"""
 		Create a link between two nodes.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('start', help='Name of the starting node')
-		parser.add_argument('end', help='Name of the final node')
-		parser.add_argument('--message', help='Link activated if a message match a regular expression.')
-		parser.add_argument('--reaction', help='Link activated if a reaction is added in this channel.')
-		parser.add_argument('--priority', help='Priority of the link')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -228,73 +440,74 @@ class ConversationalFormPlugin(praxisbot.Plugin):
 				await scope.shell.print_error(scope, "Priority must be a positive integer.")
 				return
 
-		node_start = scope.shell.get_sql_data("cf_nodes", ["id"], {"discord_sid":int(scope.guild.id), "name":str(args.start)})
+		node_start = await scope.shell.get_sql_data("cf_nodes", ["id"], {"discord_sid":int(scope.guild.id), "name":str(args.start)}, scope=scope)
 		if not node_start:
 			await scope.shell.print_error(scope, "Node `"+args.start+"` not found.")
 			return
 
-		node_end = scope.shell.get_sql_data("cf_nodes", ["id"], {"discord_sid":int(scope.guild.id), "name":str(args.end)})
+		node_end = await scope.shell.get_sql_data("cf_nodes", ["id"], {"discord_sid":int(scope.guild.id), "name":str(args.end)}, scope=scope)
 		if not node_end:
 			await scope.shell.print_error(scope, "Node `"+args.end+"` not found.")
 			return
 
 		if args.message:
 			self.ensure_regex(args.message)
-			scope.shell.set_sql_data("cf_links", {"script": "\n".join(lines), "type": LinkType.UserRegex, "value": args.message, "priority":int(priority)}, {"discord_sid":int(scope.guild.id), "node_start":str(args.start), "node_end":str(args.end)})
+			await scope.shell.set_sql_data("cf_links", {"script": "\n".join(lines), "type": LinkType.UserRegex, "value": args.message, "priority":int(priority)}, {"discord_sid":int(scope.guild.id), "node_start":str(args.start), "node_end":str(args.end)}, scope=scope)
 		elif args.reaction:
-			scope.shell.set_sql_data("cf_links", {"script": "\n".join(lines), "type": LinkType.Reaction, "value": args.reaction, "priority":int(priority)}, {"discord_sid":int(scope.guild.id), "node_start":str(args.start), "node_end":str(args.end)})
+			await scope.shell.set_sql_data("cf_links", {"script": "\n".join(lines), "type": LinkType.Reaction, "value": args.reaction, "priority":int(priority)}, {"discord_sid":int(scope.guild.id), "node_start":str(args.start), "node_end":str(args.end)}, scope=scope)
 		else:
 			await scope.shell.print_error(scope, "Missing type of link. Please use --message option.")
 			return
+		self.invalidate_graph(scope)
 
 		await scope.shell.print_success(scope, "Link between `"+args.start+"` and `"+args.end+"` created.")
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('name', help='Text to send')
 	async def execute_delete_cf_node(self, scope, command, options, lines, **kwargs):
 		"""
 		Delete a node.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('name', help='Text to send')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		self.ensure_object_name("Node name", args.name)
 
-		node = scope.shell.get_sql_data("cf_nodes", ["id"], {"discord_sid":int(scope.guild.id), "name":str(args.name)})
+		node = await scope.shell.get_sql_data("cf_nodes", ["id"], {"discord_sid":int(scope.guild.id), "name":str(args.name)}, scope=scope)
 		if not node:
 			await scope.shell.print_error(scope, "Node `"+args.name+"` not found.")
 			return
 
-		scope.shell.delete_sql_data("cf_nodes", {"discord_sid":int(scope.guild.id), "name":str(args.name)})
+		await scope.shell.delete_sql_data("cf_nodes", {"discord_sid":int(scope.guild.id), "name":str(args.name)}, scope=scope)
+		self.invalidate_graph(scope)
 		await scope.shell.print_success(scope, "Node `"+args.name+"` delete.")
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('start', help='Name of the starting node')
+	@praxisbot.argument('end', help='Name of the final node')
 	async def execute_delete_cf_link(self, scope, command, options, lines, **kwargs):
 		"""
 		Delete a link between two nodes.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('start', help='Name of the starting node')
-		parser.add_argument('end', help='Name of the final node')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		self.ensure_object_name("Node name", args.start)
 		self.ensure_object_name("Node name", args.end)
 
-		link = scope.shell.get_sql_data("cf_links", ["id"], {"discord_sid":int(scope.guild.id), "node_start":str(args.start), "node_end":str(args.end)})
+		link = await scope.shell.get_sql_data("cf_links", ["id"], {"discord_sid":int(scope.guild.id), "node_start":str(args.start), "node_end":str(args.end)}, scope=scope)
 		if not link:
 			await scope.shell.print_error(scope, "Link `"+args.start+" → "+args.end+"` not found.")
 			return
 
-		scope.shell.delete_sql_data("cf_links", {"discord_sid":int(scope.guild.id), "node_start":str(args.start), "node_end":str(args.end)})
+		await scope.shell.delete_sql_data("cf_links", {"discord_sid":int(scope.guild.id), "node_start":str(args.start), "node_end":str(args.end)}, scope=scope)
+		self.invalidate_graph(scope)
 		await scope.shell.print_success(scope, "Link `"+args.start+" → "+args.end+"` delete.")
 
 	@praxisbot.command
@@ -304,79 +517,67 @@ class ConversationalFormPlugin(praxisbot.Plugin):
 		List all nodes and links
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		stream = praxisbot.MessageStream(scope)
 
-		with scope.shell.dbcon:
-			c0 = scope.shell.dbcon.cursor()
-			c1 = scope.shell.dbcon.cursor()
-
-			await stream.send("__**List of nodes**__")
-			for row in c0.execute("SELECT name, script FROM "+scope.shell.dbtable("cf_nodes")+" WHERE discord_sid = ? ORDER BY name", [int(scope.guild.id)]):
-				await stream.send("\n\n:triangular_flag_on_post: **"+row[0]+"**")
-				for link in c1.execute("SELECT node_start, script FROM "+scope.shell.dbtable("cf_links")+" WHERE discord_sid = ? AND node_start = ? AND node_end == node_start ORDER BY node_start, priority DESC", [int(scope.guild.id), str(row[0])]):
-					await stream.send("\n - Self link: **"+str(row[0])+"** → **"+str(row[0])+"**")
-				for link in c1.execute("SELECT node_start, script FROM "+scope.shell.dbtable("cf_links")+" WHERE discord_sid = ? AND node_end = ? AND node_end != node_start ORDER BY node_start, priority DESC", [int(scope.guild.id), str(row[0])]):
-					await stream.send("\n - Incoming link: "+link[0]+" → **"+str(row[0])+"**")
-				for link in c1.execute("SELECT node_end, script FROM "+scope.shell.dbtable("cf_links")+" WHERE discord_sid = ? AND node_start = ? AND node_end != node_start ORDER BY node_end, priority DESC", [int(scope.guild.id), str(row[0])]):
-					await stream.send("\n - Outcoming link: **"+str(row[0])+"** → "+link[0])
-				if len(row[1]) > 0:
-					await stream.send("\n - Script:")
-					await stream.send("\n```\n"+row[1]+"\n```")
-
-			await stream.send("\n\n__**List of links**__")
-			for row in c0.execute("SELECT node_start, node_end, script, type, value, priority FROM "+scope.shell.dbtable("cf_links")+" WHERE discord_sid = ? ORDER BY node_start, node_end", [int(scope.guild.id)]):
-				await stream.send("\n\n:link: **"+row[0]+" → "+row[1]+"**")
-				await stream.send("\n - Priority: "+str(row[5]))
-				if row[3] == LinkType.UserRegex:
-					await stream.send("\n - Condition: user message match `"+row[4]+"`")
-				elif row[3] == LinkType.Timeout:
-					await stream.send("\n - Condition: timeout of "+row[4]+"")
-				elif row[3] == LinkType.Reaction:
-					await stream.send("\n - Condition: reaction added "+row[4]+"")
-				if len(row[2]) > 0:
-					await stream.send("\n - Script:")
-					await stream.send("\n```\n"+row[2]+"\n```")
+
+		await stream.send("__**List of nodes**__")
+		for row in await scope.db.fetchall("SELECT name, script FROM "+scope.shell.dbtable("cf_nodes")+" WHERE discord_sid = ? ORDER BY name", [int(scope.guild.id)]):
+			await stream.send("\n\n:triangular_flag_on_post: **"+row[0]+"**")
+			for link in await scope.db.fetchall("SELECT node_start, script FROM "+scope.shell.dbtable("cf_links")+" WHERE discord_sid = ? AND node_start = ? AND node_end == node_start ORDER BY node_start, priority DESC", [int(scope.guild.id), str(row[0])]):
+				await stream.send("\n - Self link: **"+str(row[0])+"** → **"+str(row[0])+"**")
+			for link in await scope.db.fetchall("SELECT node_start, script FROM "+scope.shell.dbtable("cf_links")+" WHERE discord_sid = ? AND node_end = ? AND node_end != node_start ORDER BY node_start, priority DESC", [int(scope.guild.id), str(row[0])]):
+				await stream.send("\n - Incoming link: "+link[0]+" → **"+str(row[0])+"**")
+			for link in await scope.db.fetchall("SELECT node_end, script FROM "+scope.shell.dbtable("cf_links")+" WHERE discord_sid = ? AND node_start = ? AND node_end != node_start ORDER BY node_end, priority DESC", [int(scope.guild.id), str(row[0])]):
+				await stream.send("\n - Outcoming link: **"+str(row[0])+"** → "+link[0])
+			if len(row[1]) > 0:
+				await stream.send("\n - Script:")
+				await stream.send("\n```\n"+row[1]+"\n```")
+
+		await stream.send("\n\n__**List of links**__")
+		for row in await scope.db.fetchall("SELECT node_start, node_end, script, type, value, priority FROM "+scope.shell.dbtable("cf_links")+" WHERE discord_sid = ? ORDER BY node_start, node_end", [int(scope.guild.id)]):
+			await stream.send("\n\n:link: **"+row[0]+" → "+row[1]+"**")
+			await stream.send("\n - Priority: "+str(row[5]))
+			if row[3] == LinkType.UserRegex:
+				await stream.send("\n - Condition: user message match `"+row[4]+"`")
+			elif row[3] == LinkType.Timeout:
+				await stream.send("\n - Condition: timeout of "+row[4]+"")
+			elif row[3] == LinkType.Reaction:
+				await stream.send("\n - Condition: reaction added "+row[4]+"")
+			if len(row[2]) > 0:
+				await stream.send("\n - Script:")
+				await stream.send("\n```\n"+row[2]+"\n```")
 
 		await stream.finish()
 
 	@praxisbot.command
 	@praxisbot.permission_script
+	@praxisbot.argument('node', help='Name of the starting node')
+	@praxisbot.argument('--timeout', help='Timeout after no response from users.')
 	async def execute_start_cf_session(self, scope, command, options, lines, **kwargs):
 		"""
 		Start a conversational session
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('node', help='Name of the starting node')
-		parser.add_argument('--timeout', help='Timeout after no response from users.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		self.ensure_object_name("Node name", args.node)
-		node_start = scope.shell.get_sql_data("cf_nodes", ["id"], {"discord_sid":int(scope.guild.id), "name":str(args.node)})
+		node_start = await scope.shell.get_sql_data("cf_nodes", ["id"], {"discord_sid":int(scope.guild.id), "name":str(args.node)}, scope=scope)
 		if not node_start:
 			await scope.shell.print_error(scope, "Node `"+args.node+"` not found.")
 			return
 
 		timeout = relativedelta(minutes=15)
 		if args.timeout:
-			r = re.match("([0-9]+)-([0-9]+)-([0-9]+) ([0-9]+):([0-9]+):([0-9]+)", scope.format_text(args.timeout))
-			if r:
-				years = int(r.group(1))
-				months = int(r.group(2))
-				days = int(r.group(3))
-				hours = int(r.group(4))
-				minutes = int(r.group(5))
-				seconds = int(r.group(6))
-				timeout = relativedelta(years=years, months=months, days=days, hours=hours, minutes=minutes, seconds=seconds)
-			else:
-				await scope.shell.print_error("Timeout must be in the format `Y-M-D H:M:S`")
+			timeout = parse_timeout(scope.format_text(args.timeout))
+			if not timeout:
+				await scope.shell.print_error(scope, "Timeout must be in the format `Y-M-D H:M:S`")
+				return
 
 		self.start_session(scope.user, scope.channel, scope.guild, args.node, timeout)
 		await self.execute_session_node(scope.user, scope.channel, scope.guild, scope)
@@ -388,8 +589,7 @@ class ConversationalFormPlugin(praxisbot.Plugin):
 		End a conversational session
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -406,8 +606,7 @@ class ConversationalFormPlugin(praxisbot.Plugin):
 		List active conversational sessions
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -415,10 +614,7 @@ class ConversationalFormPlugin(praxisbot.Plugin):
 
 		await stream.send("__**List of conversational sessions**__")
 
-		for s in self.sessions:
-			if scope.guild.id != s[2]:
-				continue
-
+		for s, session in self.sessions.guild_sessions(scope.guild.id):
 			user = scope.shell.find_member(s[0], scope.guild)
 			if not user:
 				continue
@@ -427,8 +623,8 @@ class ConversationalFormPlugin(praxisbot.Plugin):
 				continue
 
 			await stream.send("\n\n:speech_balloon: **Session with "+user.name+"#"+user.discriminator+" in "+channel.mention+"**")
-			await stream.send("\n - Current node: "+self.sessions[s].current_node)
-			await stream.send("\n - Start time: "+self.sessions[s].start_time.strftime("%Y-%m-%d %H:%M:%S"))
-			await stream.send("\n - Last execution time: "+self.sessions[s].last_time.strftime("%Y-%m-%d %H:%M:%S"))
+			await stream.send("\n - Current node: "+session.current_node)
+			await stream.send("\n - Start time: "+session.start_time.strftime("%Y-%m-%d %H:%M:%S"))
+			await stream.send("\n - Last execution time: "+session.last_time.strftime("%Y-%m-%d %H:%M:%S"))
 
 		await stream.finish()
@@ -144,24 +144,37 @@ class CorePlugin(praxisbot.Plugin):
 
 	name = "Core"
 
+	migrations = [
+		[
+			praxisbot.SQLTable("variables", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "name TEXT", "value TEXT"])
+		],
+		[
+			praxisbot.SQLIndex("variables", ["discord_sid", "name"], unique=True)
+		]
+	]
+
+	queries = [
+		("variables", ["discord_sid", "name"])
+	]
+
 	def __init__(self, shell):
 		super().__init__(shell)
 
-		self.shell.create_sql_table("variables", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "name TEXT", "value TEXT"])
+		self.shell.load_global_variables()
 		self.helpMessages = {}
 		for g in shell.client.guilds:
 			self.helpMessages[g] = HelpMessage(g,None)
 
 		self.add_command("help", self.execute_help)
 		self.add_command("say", self.execute_say)
-		self.add_command("if", self.execute_if)
+		self.add_command("if", self.execute_if, praxisbot.ExecutionBlockIf)
 		self.add_command("set_variable", self.execute_set_variable)
 		self.add_command("variables", self.execute_variables)
 		self.add_command("change_roles", self.execute_change_roles)
 		self.add_command("set_command_prefix", self.execute_set_command_prefix)
 		self.add_command("script", self.execute_script)
 		self.add_command("exit", self.execute_exit)
-		self.add_command("for", self.execute_for)
+		self.add_command("for", self.execute_for, praxisbot.ExecutionBlockFor)
 		self.add_command("regex", self.execute_regex)
 		self.add_command("whois", self.execute_whois)
 		self.add_command("delete_message", self.execute_delete_message)
@@ -169,21 +182,26 @@ class CorePlugin(praxisbot.Plugin):
 		self.add_command("silent", self.execute_silent)
 		self.add_command("cite", self.execute_cite)
 		self.add_command("backup_db", self.execute_backup_db)
+		self.add_command("db_stats", self.execute_db_stats)
+		self.add_command("event_stats", self.execute_event_stats)
+		self.add_command("regex_stats", self.execute_regex_stats)
 		
 	async def on_reaction(self, scope, reaction):
 		helpMessage = self.helpMessages[scope.guild]
 		
-		if reaction.message.id != helpMessage.last.id:
-			print("Reaction added to another message : Waited in {}, got in {}".format(reaction.message.id,helpMessage.last.id))
+		if not helpMessage.last:
+			return
+		if reaction.message_id != helpMessage.last.id:
+			self.log.debug("Reaction added to another message: waited in %s, got in %s", helpMessage.last.id, reaction.message_id)
 			return
 
 		if reaction.emoji not in helpMessage.reactions:
-			print("Reaction not in base")
+			self.log.debug("Reaction %s is not a help page", reaction.emoji)
 			return
 		
 		helpMessage.reactions = []
 		helpMessage.get_page_from_reaction(reaction.emoji)
-		print("Attempt to print page : {}".format(helpMessage.page))
+		self.log.debug("Printing help page %s", helpMessage.page, extra={"guild": scope.guild.id})
 		await helpMessage.print()
 	
 	@praxisbot.command
@@ -193,10 +211,14 @@ class CorePlugin(praxisbot.Plugin):
 		"""
 		
 		helpMessage = self.helpMessages[scope.guild]
+		if helpMessage.last:
+			scope.shell.remove_reaction_listener(helpMessage.last.id, self)
 		helpMessage.reset()
 		
 		helpMessage.set_plugins(scope.shell.plugins)
 		await helpMessage.print(scope.channel)
+		if helpMessage.last:
+			scope.shell.add_reaction_listener(helpMessage.last.id, self)
 
 	@praxisbot.command
 	async def execute_script(self, scope, command, options, lines, **kwargs):
@@ -204,8 +226,7 @@ class CorePlugin(praxisbot.Plugin):
 		Execute a list of commands.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -226,8 +247,7 @@ class CorePlugin(praxisbot.Plugin):
 		Stop the execution of the current script.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -235,26 +255,25 @@ class CorePlugin(praxisbot.Plugin):
 		return scope
 
 	@praxisbot.command
+	@praxisbot.argument('firstvar', help='First values', metavar='VALUE')
+	@praxisbot.argument('--equal', help='Test if A = B', metavar='VALUE')
+	@praxisbot.argument('--hasroles', nargs='+', help='Test if a member has one of the listed roles', metavar='ROLE')
+	@praxisbot.argument('--ismember', action='store_true', help='Test if a parameter is a valid member')
+	@praxisbot.argument('--iswritable', action='store_true', help='Test if a parameter is a writable text channel')
+	@praxisbot.argument('--isrole', action='store_true', help='Test if a parameter is a valid role')
+	@praxisbot.argument('--isdate', action='store_true', help='Test if a parameter is a valid date')
+	@praxisbot.argument('--not', dest='inverse', action='store_true', help='Inverse the result of the test')
+	@praxisbot.argument('--find', help='Return truc if an occurence of B is found in A (case insensitive)')
+	@praxisbot.argument('--inset', help='Return truc if B is in the set A')
+	@praxisbot.argument('--regex', help='Return true if A match the regular expression B')
+	@praxisbot.argument('--inf', help='Return true if A is inferior to B')
+	@praxisbot.argument('--sup', help='Return true if A is superior to B')
 	async def execute_if(self, scope, command, options, lines, **kwargs):
 		"""
 		Check conditions. Used with `else` and `endif`.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('firstvar', help='First values', metavar='VALUE')
-		parser.add_argument('--equal', help='Test if A = B', metavar='VALUE')
-		parser.add_argument('--hasroles', nargs='+', help='Test if a member has one of the listed roles', metavar='ROLE')
-		parser.add_argument('--ismember', action='store_true', help='Test if a parameter is a valid member')
-		parser.add_argument('--iswritable', action='store_true', help='Test if a parameter is a writable text channel')
-		parser.add_argument('--isrole', action='store_true', help='Test if a parameter is a valid role')
-		parser.add_argument('--isdate', action='store_true', help='Test if a parameter is a valid date')
-		parser.add_argument('--not', dest='inverse', action='store_true', help='Inverse the result of the test')
-		parser.add_argument('--find', help='Return truc if an occurence of B is found in A (case insensitive)')
-		parser.add_argument('--inset', help='Return truc if B is in the set A')
-		parser.add_argument('--regex', help='Return true if A match the regular expression B')
-		parser.add_argument('--inf', help='Return true if A is inferior to B')
-		parser.add_argument('--sup', help='Return true if A is superior to B')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -295,11 +314,11 @@ class CorePlugin(praxisbot.Plugin):
 			a = scope.format_text(args.firstvar)
 			b = scope.format_text(args.regex)
 			try:
-				if re.search(b, a):
+				if await praxisbot.regex_cache.search(b, a):
 					res = True
 				else:
 					res = False
-			except:
+			except re.error:
 				await scope.shell.print_error(scope, "The regular expression seems wrong.")
 				res = False
 		elif args.ismember:
@@ -340,6 +359,9 @@ class CorePlugin(praxisbot.Plugin):
 		scope.blocks.append(praxisbot.ExecutionBlockIf(res))
 
 	@praxisbot.command
+	@praxisbot.argument('name', help='Name of the iterator', metavar='VALUE')
+	@praxisbot.argument('--in', dest="list", nargs='+', help='List of elements', metavar='ELEMENT')
+	@praxisbot.argument('--inset', help='Name of a variable containing a set', metavar='VARIABLE')
 	async def execute_for(self, scope, command, options, lines, **kwargs):
 		"""
 		Execute commands until condition. Used with `endfor`.
@@ -351,11 +373,7 @@ class CorePlugin(praxisbot.Plugin):
 				scope.abort = True
 				return
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('name', help='Name of the iterator', metavar='VALUE')
-		parser.add_argument('--in', dest="list", nargs='+', help='List of elements', metavar='ELEMENT')
-		parser.add_argument('--inset', help='Name of a variable containing a set', metavar='VARIABLE')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -373,24 +391,23 @@ class CorePlugin(praxisbot.Plugin):
 		scope.blocks.append(praxisbot.ExecutionBlockFor(var, list))
 
 	@praxisbot.command
+	@praxisbot.argument('name', help='Variable name')
+	@praxisbot.argument('value', nargs='?', help='Variable value')
+	@praxisbot.argument('--global', dest='glob', action='store_true', help='Set the variable for all commands on this server')
+	@praxisbot.argument('--delete_global', dest='del_glob', action='store_true', help='Delete the variable for all commands on this server')
+	@praxisbot.argument('--session', action='store_true', help='Set the variable for an user session')
+	@praxisbot.argument('--dateadd', help='Add a duration to a date. YYYY-MM-DD HH:MM:SS')
+	@praxisbot.argument('--intadd', help='Add the integer value to the variable')
+	@praxisbot.argument('--intremove', help='Remove the integer value from the variable')
+	@praxisbot.argument('--setadd', nargs='+', help='Add elements in the set')
+	@praxisbot.argument('--setremove', nargs='+', help='Remove elements from the set')
+	@praxisbot.argument('--members', nargs='*', help='Get all members that are at least in one of the listed groups')
 	async def execute_set_variable(self, scope, command, options, lines, **kwargs):
 		"""
 		Update local and global variables.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('name', help='Variable name')
-		parser.add_argument('value', nargs='?', help='Variable value')
-		parser.add_argument('--global', dest='glob', action='store_true', help='Set the variable for all commands on this server')
-		parser.add_argument('--delete_global', dest='del_glob', action='store_true', help='Delete the variable for all commands on this server')
-		parser.add_argument('--session', action='store_true', help='Set the variable for an user session')
-		parser.add_argument('--dateadd', help='Add a duration to a date. YYYY-MM-DD HH:MM:SS')
-		parser.add_argument('--intadd', help='Add the integer value to the variable')
-		parser.add_argument('--intremove', help='Remove the integer value from the variable')
-		parser.add_argument('--setadd', nargs='+', help='Add elements in the set')
-		parser.add_argument('--setremove', nargs='+', help='Remove elements from the set')
-		parser.add_argument('--members', nargs='*', help='Get all members that are at least in one of the listed groups')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -497,9 +514,9 @@ class CorePlugin(praxisbot.Plugin):
 			scope.session_vars[var] = val
 
 		if args.glob:
-			scope.shell.set_sql_data("variables", {"value":str(val)}, {"discord_sid": int(scope.guild.id), "name": str(var)})
+			scope.shell.set_global_variable(scope.guild, str(var), str(val), scope=scope)
 		elif args.del_glob:
-			scope.shell.delete_sql_data("variables", {"discord_sid": int(scope.guild.id), "name": str(var)})
+			scope.shell.delete_global_variable(scope.guild, str(var), scope=scope)
 			await scope.shell.print_success(scope, "{} is now deleted".format(var))
 			return
 
@@ -512,8 +529,7 @@ class CorePlugin(praxisbot.Plugin):
 		List all current variables.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -528,26 +544,25 @@ class CorePlugin(praxisbot.Plugin):
 
 
 	@praxisbot.command
+	@praxisbot.argument('message', nargs="?", help='Text to send')
+	@praxisbot.argument('--channel', '-c', help='Channel where to send the message')
+	@praxisbot.argument('--title', '-t', help='Embed title')
+	@praxisbot.argument('--description', '-d', help='Embed description')
+	@praxisbot.argument('--footer', '-f', help='Embed footer')
+	@praxisbot.argument('--footerimage', help='Embed footer image')
+	@praxisbot.argument('--image', '-i', help='Embed image')
+	@praxisbot.argument('--thumbnail', '-m', help='Embed thumbnail')
+	@praxisbot.argument('--author', '-a', help='Embed author name')
+	@praxisbot.argument('--authorimage', help='Embed author image')
+	@praxisbot.argument('--authorurl', help='Embed author URL')
+	@praxisbot.argument('--fields', nargs="+", help='List of key/value')
+	@praxisbot.argument('--reactions', nargs='+', help='Name of a variable containing a set', metavar='EMOJI')
 	async def execute_say(self, scope, command, options, lines, **kwargs):
 		"""
 		Send a message.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('message', nargs="?", help='Text to send')
-		parser.add_argument('--channel', '-c', help='Channel where to send the message')
-		parser.add_argument('--title', '-t', help='Embed title')
-		parser.add_argument('--description', '-d', help='Embed description')
-		parser.add_argument('--footer', '-f', help='Embed footer')
-		parser.add_argument('--footerimage', help='Embed footer image')
-		parser.add_argument('--image', '-i', help='Embed image')
-		parser.add_argument('--thumbnail', '-m', help='Embed thumbnail')
-		parser.add_argument('--author', '-a', help='Embed author name')
-		parser.add_argument('--authorimage', help='Embed author image')
-		parser.add_argument('--authorurl', help='Embed author URL')
-		parser.add_argument('--fields', nargs="+", help='List of key/value')
-		parser.add_argument('--reactions', nargs='+', help='Name of a variable containing a set', metavar='EMOJI')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -623,16 +638,15 @@ class CorePlugin(praxisbot.Plugin):
 
 	@praxisbot.command
 	@praxisbot.permission_script
+	@praxisbot.argument('user', help='User name')
+	@praxisbot.argument('--add', nargs='*', help='A list of roles to add', default=[])
+	@praxisbot.argument('--remove', nargs='*', help='A list of roles to remove', default=[])
 	async def execute_change_roles(self, scope, command, options, lines, **kwargs):
 		"""
 		Change roles of a member.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('user', help='User name')
-		parser.add_argument('--add', nargs='*', help='A list of roles to add', default=[])
-		parser.add_argument('--remove', nargs='*', help='A list of roles to remove', default=[])
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -668,40 +682,38 @@ class CorePlugin(praxisbot.Plugin):
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('prefix', help='Prefix')
 	async def execute_set_command_prefix(self, scope, command, options, lines, **kwargs):
 		"""
 		Set the prefix used to send commands.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('prefix', help='Prefix')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
-		scope.shell.set_sql_data("servers", {"command_prefix": str(args.prefix)}, {"discord_sid": int(scope.guild.id)}, "discord_sid")
+		await scope.shell.set_command_prefix(scope.guild, args.prefix)
 		await scope.shell.print_success(scope, "Command prefix changed to ``"+args.prefix+"``.")
 
 	@praxisbot.command
+	@praxisbot.argument('regex', help='Regular expression')
+	@praxisbot.argument('data', help='Target string')
+	@praxisbot.argument('--var', help='Variable that will contains the result')
+	@praxisbot.argument('--output', help='Format of the output. Use {{result}}, {{result0}}, {{result1}}, ....', default="{{result}}")
 	async def execute_regex(self, scope, command, options, lines, **kwargs):
 		"""
 		Extract data from a string using regular expression.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('regex', help='Regular expression')
-		parser.add_argument('data', help='Target string')
-		parser.add_argument('--var', help='Variable that will contains the result')
-		parser.add_argument('--output', help='Format of the output. Use {{result}}, {{result0}}, {{result1}}, ....', default="{{result}}")
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		data = scope.format_text(args.data)
 		res = None
 		try:
-			res = re.search(args.regex, data)
-		except:
+			res = await praxisbot.regex_cache.search(args.regex, data)
+		except re.error:
 			await scope.shell.print_error(scope, "The regular expression seems wrong.")
 			return
 
@@ -721,15 +733,14 @@ class CorePlugin(praxisbot.Plugin):
 			return
 
 	@praxisbot.command
+	@praxisbot.argument('user', help='An user')
+	@praxisbot.argument('--channel', '-c', help='Channel where to send the message')
 	async def execute_whois(self, scope, command, options, lines, **kwargs):
 		"""
 		Get all available informations about an user.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('user', help='An user')
-		parser.add_argument('--channel', '-c', help='Channel where to send the message')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -796,8 +807,7 @@ class CorePlugin(praxisbot.Plugin):
 		Delete the message that trigger the current execution.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -809,8 +819,7 @@ class CorePlugin(praxisbot.Plugin):
 		Print all messages.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -822,24 +831,22 @@ class CorePlugin(praxisbot.Plugin):
 		Don't print any feedback during execution.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		scope.verbose = 0
 
 	@praxisbot.command
+	@praxisbot.argument('messageid', help='Message ID or URL to cite')
+	@praxisbot.argument('--channel', help='Channel where the cited message is')
+	@praxisbot.argument('--server', help='Server where the cited message is')
 	async def execute_cite(self, scope, command, options, lines, **kwargs):
 		"""
 		Cite a message.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('messageid', help='Message ID or URL to cite')
-		parser.add_argument('--channel', help='Channel where the cited message is')
-		parser.add_argument('--server', help='Server where the cited message is')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -930,4 +937,82 @@ class CorePlugin(praxisbot.Plugin):
 
 		await scope.user.send("Here is the backup of the database : ",file=discord.File(dbfile))
 		await scope.shell.print_success(scope,"I've just sent you the database backup in Private Message")
-		scope.deletecmd = True
\ No newline at end of file
+		scope.deletecmd = True
+
+	@praxisbot.command
+	@praxisbot.permission_admin
+	async def execute_db_stats(self, scope, command, options, lines, **kwargs):
+		"""
+		Show the load of the database thread.
+		"""
+
+		args = await self.parse_options(scope, kwargs["parser"], options)
+		if not args:
+			return
+
+		stats = scope.shell.db.stats()
+		text = "**Database**"
+		text = text+"\n - Queued queries: {} (max {})".format(stats["queue_depth"], stats["max_queue_depth"])
+		text = text+"\n - Executed queries: {}".format(stats["executed"])
+		text = text+"\n - Latency: {:.1f} ms average, {:.1f} ms max".format(stats["average_latency"]*1000, stats["max_latency"]*1000)
+		if stats["write_behind"]:
+			text = text+"\n - Queued writes: {}".format(stats["pending_writes"])
+			text = text+"\n - Group commits: {} ({:.1f} rows per commit)".format(stats["flushes"], stats["rows_per_flush"])
+			text = text+"\n - Commit latency: {:.1f} ms average, {:.1f} ms max".format(stats["average_flush_latency"]*1000, stats["max_flush_latency"]*1000)
+		await scope.shell.print_info(scope, text)
+
+	@praxisbot.command
+	@praxisbot.permission_admin
+	async def execute_event_stats(self, scope, command, options, lines, **kwargs):
+		"""
+		Show the load of the event queues.
+		"""
+
+		args = await self.parse_options(scope, kwargs["parser"], options)
+		if not args:
+			return
+
+		stats = scope.shell.events.stats()
+		text = "**Events**"
+		text = text+"\n - Workers: {} ({} per guild)".format(stats["workers"], stats["guild_concurrency"])
+		text = text+"\n - Queued events: {} in {} busy guilds (max {} for a guild)".format(stats["queue_depth"], stats["busy_guilds"], stats["max_queue_depth"])
+		text = text+"\n - This server: {} queued events".format(scope.shell.events.queue_depth(scope.guild))
+		text = text+"\n - Handled events: {} ({} failed)".format(stats["handled"], stats["failed"])
+		text = text+"\n - Wait in queue: {:.1f} ms average, {:.1f} ms max".format(stats["average_wait"]*1000, stats["max_wait"]*1000)
+		jobs = scope.shell.jobs.stats()
+		text = text+"\n - Timed jobs: {} scheduled, {} runs ({} skipped while still queued)".format(jobs["jobs"], jobs["runs"], jobs["skipped"])
+		await scope.shell.print_info(scope, text)
+
+	@praxisbot.command
+	@praxisbot.permission_admin
+	async def execute_regex_stats(self, scope, command, options, lines, **kwargs):
+		"""
+		Show the use of the regular expression cache and the slowest patterns.
+		"""
+
+		args = await self.parse_options(scope, kwargs["parser"], options)
+		if not args:
+			return
+
+		cache = praxisbot.regex_cache
+		stats = cache.stats()
+		stream = praxisbot.MessageStream(scope)
+		await stream.send("**Regular expressions**")
+		await stream.send("\n - Cached patterns: {} (max {})".format(stats["patterns"], stats["size"]))
+		await stream.send("\n - Cache hits: {} ({:.0%}), misses: {}".format(stats["hits"], stats["hit_rate"], stats["misses"]))
+		if stats["sandbox"]:
+			await stream.send("\n - Sandbox: {} patterns evaluated in the sandbox, stopped after {} s".format(stats["sandboxed"], stats["timeout"]))
+		else:
+			await stream.send("\n - Sandbox: disabled")
+
+		await stream.send("\n\n**Most used patterns**")
+		for e in cache.most_used():
+			match_rate = e.matches/e.runs if e.runs else 0.0
+			await stream.send("\n - `{}`: {} uses, {} runs, {:.0%} matched".format(e.pattern[:100], e.hits+1, e.runs, match_rate))
+
+		slow = cache.slow_patterns()
+		if slow:
+			await stream.send("\n\n**Slow patterns**")
+			for e in slow:
+				await stream.send("\n - `{}`: {:.1f} ms max, {:.1f} ms average, {} stopped".format(e.pattern[:100], e.max_time*1000, e.total_time/e.runs*1000 if e.runs else 0.0, e.timeouts))
+		await stream.finish()
@@ -37,15 +37,31 @@ class HTTPPlugin(praxisbot.Plugin):
 
 	name = "HTTP"
 
+	migrations = [
+		[
+			praxisbot.SQLTable("cookies", ["id INTEGER PRIMARY KEY", "nameid TEXT", "discord_sid INTEGER", "name TEXT", "content TEXT", "filter TEXT"]),
+			praxisbot.SQLTable("cookies_groups", ["id INTEGER_PRIMARY_KEY", "name TEXT", "discord_sid INTEGER", "nameid TEXT"])
+		],
+		[
+			praxisbot.SQLIndex("cookies", ["discord_sid", "nameid"], unique=True),
+			praxisbot.SQLIndex("cookies_groups", ["discord_sid", "name", "nameid"], unique=True)
+		]
+	]
+
+	queries = [
+		("cookies", ["discord_sid", "nameid"]),
+		("cookies", ["discord_sid"]),
+		("cookies_groups", ["discord_sid", "name", "nameid"]),
+		("cookies_groups", ["discord_sid", "name"]),
+		("cookies_groups", ["discord_sid"])
+	]
+
 	def __init__(self, shell):
 		super().__init__(shell)
 
 		self.cookiename_regex = re.compile('[a-zA-Z0-9_-]+')
 
-		self.shell.create_sql_table("cookies", ["id INTEGER PRIMARY KEY", "nameid TEXT", "discord_sid INTEGER", "name TEXT", "content TEXT", "filter TEXT"])
-		self.shell.create_sql_table("cookies_groups", ["id INTEGER_PRIMARY_KEY", "name TEXT", "discord_sid INTEGER", "nameid TEXT"])
-
-		self.add_command("if_http", self.execute_if_http)
+		self.add_command("if_http", self.execute_if_http, praxisbot.ExecutionBlockIf)
 		self.add_command("create_cookie", self.execute_create_cookie)
 		self.add_command("group_cookies", self.execute_group_cookies)
 		self.add_command("delete_cookie", self.execute_delete_cookie)
@@ -58,6 +74,10 @@ class HTTPPlugin(praxisbot.Plugin):
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('id', help='ID of the cookie. This ID is used to delete the cookie.')
+	@praxisbot.argument('name', help='Name of the cookie.')
+	@praxisbot.argument('filter', help='Regular expression that restrict usage of the cookie.')
+	@praxisbot.argument('--force', '-f', action='store_true', help='Replace the cookie if it already exists')
 	async def execute_create_cookie(self, scope, command, options, lines, **kwargs):
 		"""
 		Create a cookie for HTTP requests.
@@ -65,12 +85,7 @@ class HTTPPlugin(praxisbot.Plugin):
 
 		scope.deletecmd = True
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('id', help='ID of the cookie. This ID is used to delete the cookie.')
-		parser.add_argument('name', help='Name of the cookie.')
-		parser.add_argument('filter', help='Regular expression that restrict usage of the cookie.')
-		parser.add_argument('--force', '-f', action='store_true', help='Replace the cookie if it already exists')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -80,12 +95,12 @@ class HTTPPlugin(praxisbot.Plugin):
 
 		self.ensure_object_name("Cookie ID", args.id)
 
-		cookieID = scope.shell.get_sql_data("cookies", ["id"], {"discord_sid": int(scope.guild.id), "nameid": str(args.id)})
+		cookieID = await scope.shell.get_sql_data("cookies", ["id"], {"discord_sid": int(scope.guild.id), "nameid": str(args.id)}, scope=scope)
 		if cookieID and not args.force:
 			await scope.shell.print_error(scope, "The cookie `{}` already exists.".format(args.id))
 			return
 
-		scope.shell.set_sql_data("cookies", {"name": str(args.name), "content": str("\n".join(lines)), "filter": str(args.filter)}, {"discord_sid": int(scope.guild.id), "nameid": str(args.id)})
+		await scope.shell.set_sql_data("cookies", {"name": str(args.name), "content": str("\n".join(lines)), "filter": str(args.filter)}, {"discord_sid": int(scope.guild.id), "nameid": str(args.id)}, scope=scope)
 		if cookieID:
 			await scope.shell.print_success(scope, "Cookie `{}` edited.".format(args.id))
 		else:
@@ -93,6 +108,10 @@ class HTTPPlugin(praxisbot.Plugin):
 	
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('name', help='Name of the group of cookies.')
+	@praxisbot.argument('cookiesID', nargs="*", help='IDs of cookies to group together')
+	@praxisbot.argument('--force', '-f', action='store_true', help='Replace the group if it already exists')
+	@praxisbot.argument('--append', '-a', action='store_true', help='Append to the group if it already exists')
 	async def execute_group_cookies(self, scope, command, options, lines, **kwargs):
 		"""
 		Create a group of cookies
@@ -100,24 +119,19 @@ class HTTPPlugin(praxisbot.Plugin):
 		
 		scope.delete_cookie = True
 		
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('name', help='Name of the group of cookies.')
-		parser.add_argument('cookiesID', nargs="*", help='IDs of cookies to group together')
-		parser.add_argument('--force', '-f', action='store_true', help='Replace the group if it already exists')
-		parser.add_argument('--append', '-a', action='store_true', help='Append to the group if it already exists')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 			
-		groupID = scope.shell.get_sql_data("cookies_groups", ["id"], {"discord_sid": int(scope.guild.id), "name": str(args.name)})
+		groupID = await scope.shell.get_sql_data("cookies_groups", ["id"], {"discord_sid": int(scope.guild.id), "name": str(args.name)}, scope=scope)
 		if groupID and not args.force and not args.append:
 			await scope.shell.print_error(scope, "The group `{}` already exists.".format(args.name))
 			return
 		elif args.force:
-			scope.shell.delete_sql_data("cookies_groups", {"discord_sid": scope.guild.id, "name": str(args.name)})
+			await scope.shell.delete_sql_data("cookies_groups", {"discord_sid": scope.guild.id, "name": str(args.name)}, scope=scope)
 		
 		for cookie in args.cookiesID:
-			scope.shell.set_sql_data("cookies_groups", {}, {"name": str(args.name), "discord_sid": scope.guild.id, "nameid": str(cookie)})
+			await scope.shell.set_sql_data("cookies_groups", {}, {"name": str(args.name), "discord_sid": scope.guild.id, "nameid": str(cookie)}, scope=scope)
 			
 		if groupID:
 			await scope.shell.print_success(scope, "Group `{}` edited.".format(args.name))
@@ -126,6 +140,7 @@ class HTTPPlugin(praxisbot.Plugin):
 		
 
 	@praxisbot.command
+	@praxisbot.argument('id', help='ID of the cookie. This ID is used to delete the cookie.')
 	async def execute_delete_cookie(self, scope, command, options, lines, **kwargs):
 		"""
 		Delete a cookie.
@@ -133,20 +148,18 @@ class HTTPPlugin(praxisbot.Plugin):
 
 		scope.deletecmd = True
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('id', help='ID of the cookie. This ID is used to delete the cookie.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		self.ensure_object_name("Cookie ID", args.id)
 
-		cookieID = scope.shell.get_sql_data("cookies", ["id"], {"discord_sid": int(scope.guild.id), "nameid": str(args.id)})
+		cookieID = await scope.shell.get_sql_data("cookies", ["id"], {"discord_sid": int(scope.guild.id), "nameid": str(args.id)}, scope=scope)
 		if not cookieID:
 			await scope.shell.print_error(scope, "The cookie `{}` doesn't exists.".format(args.id))
 			return
 
-		scope.shell.delete_sql_data("cookies", {"discord_sid": scope.guild.id, "nameid": str(args.id)})
+		await scope.shell.delete_sql_data("cookies", {"discord_sid": scope.guild.id, "nameid": str(args.id)}, scope=scope)
 		await scope.shell.print_success(scope, "Cookie `{}` deleted.".format(args.id))
 
 	@praxisbot.command
@@ -156,22 +169,21 @@ class HTTPPlugin(praxisbot.Plugin):
 		List all cookies.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		stream = praxisbot.MessageStream(scope)
 		await stream.send("**List of HTTP cookies**\n")
 
-		cookies = scope.shell.get_sql_data("cookies",["nameid","filter"],{"discord_sid":scope.guild.id},True)
+		cookies = await scope.shell.get_sql_data("cookies",["nameid","filter"],{"discord_sid":scope.guild.id},True, scope=scope)
 		if not cookies:
 			await stream.finish()
 			return
 		for row in cookies:
 			await stream.send("\n - {}: `{}`".format(row[0],row[1]))
 
-		groups = scope.shell.get_sql_data("cookies_groups",["name","nameid"], {"discord_sid":scope.guild.id}, True)
+		groups = await scope.shell.get_sql_data("cookies_groups",["name","nameid"], {"discord_sid":scope.guild.id}, True, scope=scope)
 		if groups:
 			await stream.send("\n\n**List of cookies groups**\n")
 			g_names = []
@@ -184,23 +196,22 @@ class HTTPPlugin(praxisbot.Plugin):
 			
 			for g in g_names:
 				await stream.send("\nGroup : **{}**".format(g))
-				cookies = scope.shell.get_sql_data("cookies_groups",["nameid"], {"discord_sid":scope.guild.id,"name":g}, True)
+				cookies = await scope.shell.get_sql_data("cookies_groups",["nameid"], {"discord_sid":scope.guild.id,"name":g}, True, scope=scope)
 				for c in cookies:
 					await stream.send("\n·{}".format(c[0]))
 		await stream.finish()
 
 	@praxisbot.command
 	@praxisbot.permission_script
+	@praxisbot.argument('url', help='First values', metavar='VALUE')
+	@praxisbot.argument('--valid', action='store_true', help='Test if the URL is valid.')
+	@praxisbot.argument('--not', dest='inverse', action='store_true', help='Inverse the result of the test')
 	async def execute_if_http(self, scope, command, options, lines, **kwargs):
 		"""
 		Perform tests on URLs. Used with `endif`.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('url', help='First values', metavar='VALUE')
-		parser.add_argument('--valid', action='store_true', help='Test if the URL is valid.')
-		parser.add_argument('--not', dest='inverse', action='store_true', help='Inverse the result of the test')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -218,20 +229,18 @@ class HTTPPlugin(praxisbot.Plugin):
 
 	@praxisbot.command
 	@praxisbot.permission_script
+	@praxisbot.argument('url', help='URL to download')
+	@praxisbot.argument('--pdf', action="store_true", help='Send result as a pdf file (if possible)')
+	@praxisbot.argument('--filename', help='Filename sent in Discord')
+	@praxisbot.argument('--var', help='Variable that will contains the file')
+	@praxisbot.argument('--cookie', help='Name of a cookie to send with the request.', exclusive_group="cookies")
+	@praxisbot.argument('--cookies_group', '-cg', type=str, help='Name of a goup of cookies to send with the request.', exclusive_group="cookies")
 	async def execute_download(self, scope, command, options, lines, **kwargs):
 		"""
 		Download from an URL.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser_group = parser.add_mutually_exclusive_group()
-		parser.add_argument('url', help='URL to download')
-		parser.add_argument('--pdf', action="store_true", help='Send result as a pdf file (if possible)')
-		parser.add_argument('--filename', help='Filename sent in Discord')
-		parser.add_argument('--var', help='Variable that will contains the file')
-		parser_group.add_argument('--cookie', help='Name of a cookie to send with the request.')
-		parser_group.add_argument('--cookies_group', '-cg', type=str, help='Name of a goup of cookies to send with the request.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 		
@@ -239,30 +248,30 @@ class HTTPPlugin(praxisbot.Plugin):
 		result = None
 		cookies = {}
 		if args.cookie:
-			cookieData = scope.shell.get_sql_data("cookies", ["name", "content", "filter"], {"discord_sid": scope.guild.id, "nameid": str(args.cookie)})
+			cookieData = await scope.shell.get_sql_data("cookies", ["name", "content", "filter"], {"discord_sid": scope.guild.id, "nameid": str(args.cookie)}, scope=scope)
 			if not cookieData:
 				await scope.shell.print_error(scope, "Cookie `{}` not found.".format(args.cookie))
 				return
-			if not re.fullmatch(cookieData[2], url):
+			if not await praxisbot.regex_cache.fullmatch(cookieData[2], url):
 				await scope.shell.print_error(scope, "This cookie can't be used with this URL.")
 				return
 
 			cookies[cookieData[0]] = cookieData[1]
-			print("Using cookies {}".format(cookies))
+			self.log.debug("Using cookies %s", list(cookies), extra={"guild": scope.guild.id})
 		elif args.cookies_group:
-			cookiesID = scope.shell.get_sql_data("cookies_groups", ["nameid"], {"discord_sid": scope.guild.id, "name": args.cookies_group},True)
+			cookiesID = await scope.shell.get_sql_data("cookies_groups", ["nameid"], {"discord_sid": scope.guild.id, "name": args.cookies_group},True, scope=scope)
 			for id in cookiesID:
 				nameid = id[0]
-				cookieData = scope.shell.get_sql_data("cookies", ["name", "content", "filter"], {"discord_sid": scope.guild.id, "nameid": nameid})
+				cookieData = await scope.shell.get_sql_data("cookies", ["name", "content", "filter"], {"discord_sid": scope.guild.id, "nameid": nameid}, scope=scope)
 				if not cookieData:
 					await scope.shell.print_error(scope, "Cookie `{}` not found.".format(nameid))
 					return
-				if not re.fullmatch(cookieData[2], url):
+				if not await praxisbot.regex_cache.fullmatch(cookieData[2], url):
 					await scope.shell.print_error(scope, "This cookie can't be used with this URL.")
 					return
 				
 				cookies[cookieData[0]] = cookieData[1]
-			print("Using cookies {}".format(cookies))
+			self.log.debug("Using cookies %s", list(cookies), extra={"guild": scope.guild.id})
 
 		try:
 			result = requests.get(url, allow_redirects=True, cookies=cookies, stream=True)
@@ -293,15 +302,14 @@ class HTTPPlugin(praxisbot.Plugin):
 
 
 	@praxisbot.command
+	@praxisbot.argument('data', help='Data that will be contains in the file')
+	@praxisbot.argument('--filename', help='Name of the file that will be uploaded')
 	async def execute_upload(self, scope, command, options, lines, **kwargs):
 		"""
 		Upload files on Discord.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('data', help='Data that will be contains in the file')
-		parser.add_argument('--filename', help='Name of the file that will be uploaded')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -314,17 +322,16 @@ class HTTPPlugin(praxisbot.Plugin):
 
 	@praxisbot.command
 	@praxisbot.permission_script
+	@praxisbot.argument('css_selector', help='The css selector (start with `.` for a class ; start with `#` for an id).')
+	@praxisbot.argument('--var', help='Variable that will contains the HTML element.')
+	@praxisbot.argument('--html_var', help='Variable with the HTML content where the HTML element is.')
+	@praxisbot.argument('--index', help='[Defaut=0] the index to find le HTML element from the cssselect returned list')
 	async def execute_css_selector(self, scope, command, options, lines, **kwargs):
 		"""
 		Get a HTML element, given a css selector
 		"""
 	
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('css_selector', help='The css selector (start with `.` for a class ; start with `#` for an id).')
-		parser.add_argument('--var', help='Variable that will contains the HTML element.')
-		parser.add_argument('--html_var', help='Variable with the HTML content where the HTML element is.')
-		parser.add_argument('--index', help='[Defaut=0] the index to find le HTML element from the cssselect returned list')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -344,16 +351,15 @@ class HTTPPlugin(praxisbot.Plugin):
 	
 	@praxisbot.command
 	@praxisbot.permission_script
+	@praxisbot.argument('attribute', help="Attribute to get from the HTML element")
+	@praxisbot.argument('--var', help='Variable that will contains the text of the attribute.')
+	@praxisbot.argument('--element_var', help='Variable containing the HTML element.')
 	async def execute_extract_attribute(self, scope, command, options, lines, **kwargs):
 		"""
 		Get an attribute, given an HTML element
 		"""
 		
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('attribute', help="Attribute to get from the HTML element")
-		parser.add_argument('--var', help='Variable that will contains the text of the attribute.')
-		parser.add_argument('--element_var', help='Variable containing the HTML element.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 			
@@ -368,15 +374,14 @@ class HTTPPlugin(praxisbot.Plugin):
 	
 	@praxisbot.command
 	@praxisbot.permission_script
+	@praxisbot.argument('--var', help='Variable that will contains the text of the attribute.')
+	@praxisbot.argument('--element_var', help='Variable containing the HTML element.')
 	async def execute_extract_text(self, scope, command, options, lines, **kwargs):
 		"""
 		Get an attribute, given an HTML element
 		"""
 		
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('--var', help='Variable that will contains the text of the attribute.')
-		parser.add_argument('--element_var', help='Variable containing the HTML element.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 			
@@ -356,25 +356,24 @@ $
 			await scope.shell.client.send_file(scope.channel, stream, filename="math.png")
 			stream.close()
 		except:
-			print(traceback.format_exc())
+			self.log.debug("LaTeX rendering failed", exc_info=True, extra={"guild": scope.guild.id})
 			await scope.shell.print_error(scope, "Invalid latex expression")
 			return
 
 	@praxisbot.command
+	@praxisbot.argument('--title', help='Plot title')
+	@praxisbot.argument('--xlabel', help='X axis label')
+	@praxisbot.argument('--ylabel', help='Y axis label')
+	@praxisbot.argument('--bluecurve', nargs='+', help='Plot a blue curve', metavar='VALUE')
+	@praxisbot.argument('--redcurve', nargs='+', help='Plot a red curve', metavar='VALUE')
+	@praxisbot.argument('--orangecurve', nargs='+', help='Plot a orange curve', metavar='VALUE')
+	@praxisbot.argument('--greencurve', nargs='+', help='Plot a green curve', metavar='VALUE')
 	async def execute_xkcd_plot(self, scope, command, options, lines, **kwargs):
 		"""
 		Plot curves with xkcd style.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('--title', help='Plot title')
-		parser.add_argument('--xlabel', help='X axis label')
-		parser.add_argument('--ylabel', help='Y axis label')
-		parser.add_argument('--bluecurve', nargs='+', help='Plot a blue curve', metavar='VALUE')
-		parser.add_argument('--redcurve', nargs='+', help='Plot a red curve', metavar='VALUE')
-		parser.add_argument('--orangecurve', nargs='+', help='Plot a orange curve', metavar='VALUE')
-		parser.add_argument('--greencurve', nargs='+', help='Plot a green curve', metavar='VALUE')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -454,6 +453,6 @@ $
 			await scope.shell.client.send_file(scope.channel, stream, filename="plot.png")
 			stream.close()
 		except:
-			print(traceback.format_exc())
+			self.log.debug("Plot generation failed", exc_info=True, extra={"guild": scope.guild.id})
 			await scope.shell.print_error(scope, "Plot generation failed")
 			return
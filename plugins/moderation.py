@@ -42,12 +42,27 @@ class ModerationPlugin(praxisbot.Plugin):
 
 	name = "Moderation"
 
+	migrations = [
+		[
+			praxisbot.SQLTable("mod_levels", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "name TEXT", "priority INTEGER", "type INTEGER", "value TEXT", "ban_timelimit INTEGER", "ban_prioritylimit INTEGER", "purge INTEGER"]),
+			praxisbot.SQLTable("ban_time", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "discord_uid INTEGER", "last_time DATETIME"])
+		],
+		[
+			praxisbot.SQLIndex("mod_levels", ["discord_sid", "priority"]),
+			praxisbot.SQLIndex("mod_levels", ["discord_sid", "name"]),
+			praxisbot.SQLIndex("ban_time", ["discord_sid", "discord_uid"], unique=True)
+		]
+	]
+
+	queries = [
+		("mod_levels", ["discord_sid", "name"]),
+		("mod_levels", ["discord_sid"]),
+		("ban_time", ["discord_sid", "discord_uid"])
+	]
+
 	def __init__(self, shell):
 		super().__init__(shell)
 
-		self.shell.create_sql_table("mod_levels", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "name TEXT", "priority INTEGER", "type INTEGER", "value TEXT", "ban_timelimit INTEGER", "ban_prioritylimit INTEGER", "purge INTEGER"])
-		self.shell.create_sql_table("ban_time", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "discord_uid INTEGER", "last_time DATETIME"])
-
 		self.add_command("ban", self.execute_ban)
 		self.add_command("preban", self.execube_preban)
 		self.add_command("last_bans", self.execute_last_bans)
@@ -60,7 +75,7 @@ class ModerationPlugin(praxisbot.Plugin):
 		self.add_command("set_mod_options", self.execute_set_mod_options)
 		self.add_command("purge", self.execute_purge)
 
-	def get_mod_level(self, member):
+	async def get_mod_level(self, member):
 		if not member:
 			return {
 				"name":"no mod level",
@@ -70,39 +85,37 @@ class ModerationPlugin(praxisbot.Plugin):
 				"purge":False
 			}
 
-		with self.shell.dbcon:
-			c = self.shell.dbcon.cursor()
-			for row in c.execute("SELECT type, value, name, priority, ban_timelimit, ban_prioritylimit, purge FROM {} WHERE discord_sid = {} ORDER BY priority DESC".format(self.shell.dbtable("mod_levels"),member.guild.id)):
-				res = {
-					"name":row[2],
-					"priority":row[3],
-					"ban_timelimit":row[4],
-					"ban_prioritylimit":row[5],
-					"purge":row[6]
-				}
-
-				if not row[4] or row[4] < 0:
-					res["ban_timelimit"] = 0
-				if not row[5] or row[5] < 0:
-					res["ban_prioritylimit"] = res["priority"]-1
-				elif row[5] > res["priority"]:
-					res["ban_prioritylimit"] = res["priority"]
-				if row[6] and row[6] != 0:
-					res["purge"] = 1
-				else:
-					res["purge"] = 0
+		for row in await self.shell.db.fetchall("SELECT type, value, name, priority, ban_timelimit, ban_prioritylimit, purge FROM {} WHERE discord_sid = ? ORDER BY priority DESC".format(self.shell.dbtable("mod_levels")), [int(member.guild.id)]):
+			res = {
+				"name":row[2],
+				"priority":row[3],
+				"ban_timelimit":row[4],
+				"ban_prioritylimit":row[5],
+				"purge":row[6]
+			}
 
-				if row[0] == ModLevelType.User:
-					if member.id == int(row[1]):
-						return res
-				elif row[0] == ModLevelType.Role:
-					for r in member.roles:
-						if r.id == int(row[1]):
-							return res
-				elif row[0] == ModLevelType.Channel:
-					chan = self.shell.find_channel("<#{}>".format(row[1]),member.guild)
-					if chan and chan.permissions_for(member).send_messages:
+			if not row[4] or row[4] < 0:
+				res["ban_timelimit"] = 0
+			if not row[5] or row[5] < 0:
+				res["ban_prioritylimit"] = res["priority"]-1
+			elif row[5] > res["priority"]:
+				res["ban_prioritylimit"] = res["priority"]
+			if row[6] and row[6] != 0:
+				res["purge"] = 1
+			else:
+				res["purge"] = 0
+
+			if row[0] == ModLevelType.User:
+				if member.id == int(row[1]):
+					return res
+			elif row[0] == ModLevelType.Role:
+				for r in member.roles:
+					if r.id == int(row[1]):
 						return res
+			elif row[0] == ModLevelType.Channel:
+				chan = self.shell.find_channel("<#{}>".format(row[1]),member.guild)
+				if chan and chan.permissions_for(member).send_messages:
+					return res
 
 		return {
 			"name":"no mod level",
@@ -115,43 +128,40 @@ class ModerationPlugin(praxisbot.Plugin):
 	async def dump(self, server):
 		text = []
 
-		with self.shell.dbcon:
-			c = self.shell.dbcon.cursor()
-			for row in c.execute("SELECT name, priority, type, value, ban_timelimit, ban_prioritylimit, purge FROM "+self.ctx.dbprefix+"mod_levels WHERE discord_sid = ? ORDER BY priority DESC", [int(server.id)]):
-				option = ""
-				if row[2] == ModLevelType.User:
-					option = " --user <@"+row[3]+">"
-				elif row[2] == ModLevelType.Role:
-					r = self.shell.find_role(row[3], server)
-					if r:
-						option = " --role \""+r.name+"\""
-					else:
-						option = " --role <@&"+row[3]+">"
-				elif row[2] == ModLevelType.Channel:
-					c = self.shell.find_channel(row[3], server)
-					if c:
-						option = " --channel \""+c.name+"\""
-					else:
-						option = " --channel <#"+row[3]+">"
-				text.append("create_mod_level \""+row[0]+"\" "+str(row[1])+option)
-
-				if row[6] and row[6] != 0:
-					purge = 1
+		for row in await self.shell.db.fetchall("SELECT name, priority, type, value, ban_timelimit, ban_prioritylimit, purge FROM "+self.shell.dbtable("mod_levels")+" WHERE discord_sid = ? ORDER BY priority DESC", [int(server.id)]):
+			option = ""
+			if row[2] == ModLevelType.User:
+				option = " --user <@"+row[3]+">"
+			elif row[2] == ModLevelType.Role:
+				r = self.shell.find_role(row[3], server)
+				if r:
+					option = " --role \""+r.name+"\""
 				else:
-					purge = 0
-				text.append("set_mod_options \""+row[0]+"\" --banpriority "+str(row[4])+" --bantime "+str(row[5])+" --purge "+str(purge))
+					option = " --role <@&"+row[3]+">"
+			elif row[2] == ModLevelType.Channel:
+				c = self.shell.find_channel(row[3], server)
+				if c:
+					option = " --channel \""+c.name+"\""
+				else:
+					option = " --channel <#"+row[3]+">"
+			text.append("create_mod_level \""+row[0]+"\" "+str(row[1])+option)
+
+			if row[6] and row[6] != 0:
+				purge = 1
+			else:
+				purge = 0
+			text.append("set_mod_options \""+row[0]+"\" --banpriority "+str(row[4])+" --bantime "+str(row[5])+" --purge "+str(purge))
 
 		return text
 
 	@praxisbot.command
+	@praxisbot.argument('--user', help='List channels from the point of view of this user.')
 	async def execute_list_channels(self, scope, command, options, lines, **kwargs):
 		"""
 		List all channels of the server.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('--user', help='List channels from the point of view of this user.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -196,23 +206,21 @@ class ModerationPlugin(praxisbot.Plugin):
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('name', help='Name of the moderator level.')
+	@praxisbot.argument('priority', help='Priority of the moderator level.')
+	@praxisbot.argument('--channel', help='All members that can write in this channel.', exclusive_group="target")
+	@praxisbot.argument('--role', help='All members of this role.', exclusive_group="target")
+	@praxisbot.argument('--user', help='A specific user.', exclusive_group="target")
 	async def execute_create_mod_level(self, scope, command, options, lines, **kwargs):
 		"""
 		Create a moderator level.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser_group = parser.add_mutually_exclusive_group()
-		parser.add_argument('name', help='Name of the moderator level.')
-		parser.add_argument('priority', help='Priority of the moderator level.')
-		parser_group.add_argument('--channel', help='All members that can write in this channel.')
-		parser_group.add_argument('--role', help='All members of this role.')
-		parser_group.add_argument('--user', help='A specific user.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
-		modData = scope.shell.get_sql_data("mod_levels", ["id"], {"discord_sid": int(scope.guild.id), "name": str(args.name)})
+		modData = await scope.shell.get_sql_data("mod_levels", ["id"], {"discord_sid": int(scope.guild.id), "name": str(args.name)}, scope=scope)
 		if modData:
 			await scope.shell.print_error(scope, "The moderator level `"+args.name+"` already exists.")
 			return
@@ -223,7 +231,7 @@ class ModerationPlugin(praxisbot.Plugin):
 				await scope.shell.print_error(scope, "Channel not found.")
 				return
 
-			scope.shell.add_sql_data("mod_levels", {"name": str(args.name), "discord_sid": int(scope.guild.id), "type": ModLevelType.Channel, "value": int(chan.id), "priority": int(args.priority), "ban_timelimit": 0, "ban_prioritylimit": -1, "purge": 0, })
+			await scope.shell.add_sql_data("mod_levels", {"name": str(args.name), "discord_sid": int(scope.guild.id), "type": ModLevelType.Channel, "value": int(chan.id), "priority": int(args.priority), "ban_timelimit": 0, "ban_prioritylimit": -1, "purge": 0, }, scope=scope)
 
 		elif args.role:
 			role = scope.shell.find_role(args.role, scope.guild)
@@ -231,7 +239,7 @@ class ModerationPlugin(praxisbot.Plugin):
 				await scope.shell.print_error(scope, "Role not found.")
 				return
 
-			scope.shell.add_sql_data("mod_levels", {"name": str(args.name), "discord_sid": int(scope.guild.id), "type": ModLevelType.Role, "value": int(role.id), "priority": int(args.priority), "ban_timelimit": 0, "ban_prioritylimit": -1, "purge": 0, })
+			await scope.shell.add_sql_data("mod_levels", {"name": str(args.name), "discord_sid": int(scope.guild.id), "type": ModLevelType.Role, "value": int(role.id), "priority": int(args.priority), "ban_timelimit": 0, "ban_prioritylimit": -1, "purge": 0, }, scope=scope)
 
 		elif args.user:
 			user = scope.shell.find_member(args.user, scope.guild)
@@ -239,29 +247,28 @@ class ModerationPlugin(praxisbot.Plugin):
 				await scope.shell.print_error(scope, "User not found.")
 				return
 
-			scope.shell.add_sql_data("mod_levels", {"name": str(args.name), "discord_sid": int(scope.guild.id), "type": ModLevelType.User, "value": int(user.id), "priority": int(args.priority), "ban_timelimit": 0, "ban_prioritylimit": -1, "purge": 0, })
+			await scope.shell.add_sql_data("mod_levels", {"name": str(args.name), "discord_sid": int(scope.guild.id), "type": ModLevelType.User, "value": int(user.id), "priority": int(args.priority), "ban_timelimit": 0, "ban_prioritylimit": -1, "purge": 0, }, scope=scope)
 
 		await scope.shell.print_success(scope, "Moderator level created.")
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('name', help='Name of the moderator level.')
 	async def execute_delete_mod_level(self, scope, command, options, lines, **kwargs):
 		"""
 		Delete a moderator level.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('name', help='Name of the moderator level.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
-		modData = scope.shell.get_sql_data("mod_levels", ["id"], {"discord_sid": int(scope.guild.id), "name": str(args.name)})
+		modData = await scope.shell.get_sql_data("mod_levels", ["id"], {"discord_sid": int(scope.guild.id), "name": str(args.name)}, scope=scope)
 		if not modData:
 			await scope.shell.print_error(scope, "Moderator level `"+args.name+"` not found.")
 			return
 
-		scope.shell.delete_sql_data("mod_levels", {"id": modData[0]})
+		await scope.shell.delete_sql_data("mod_levels", {"id": modData[0]}, scope=scope)
 		await scope.shell.print_success(scope, "Moderator level deleted.")
 
 	@praxisbot.command
@@ -270,46 +277,42 @@ class ModerationPlugin(praxisbot.Plugin):
 		List all moderator levels.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return scope
 
 		stream = praxisbot.MessageStream(scope)
 		await stream.send("**__List of moderator levels__**\n")
 
-		with scope.shell.dbcon:
-			c = scope.shell.dbcon.cursor()
-			for row in c.execute("SELECT name, priority, ban_timelimit, ban_prioritylimit, purge FROM {} WHERE discord_sid = {} ORDER BY priority DESC".format(scope.shell.dbtable("mod_levels"),scope.guild.id)):
-				await stream.send("\n:label: **"+row[0]+"**")
-				await stream.send("\n   - Priority: "+str(row[1]))
-				if not row[2] or row[2] < 0:
-					tlimit = 0
-				else:
-					tlimit = row[2]
-				await stream.send("\n   - Duration bewteen two bans: "+str(tlimit)+"h")
-				if not row[3] or row[3] < 0:
-					plimit = row[1]-1
-				else:
-					plimit = min(row[3], row[1])
-				await stream.send("\n   - Maximum priority that can be banned: "+str(plimit))
-				if not row[4] or row[4] <= 0:
-					purge = "Can't use purge command"
-				else:
-					purge = "Can use purge command"
-				await stream.send("\n   - "+purge)
+		for row in await scope.db.fetchall("SELECT name, priority, ban_timelimit, ban_prioritylimit, purge FROM {} WHERE discord_sid = ? ORDER BY priority DESC".format(scope.shell.dbtable("mod_levels")), [int(scope.guild.id)]):
+			await stream.send("\n:label: **"+row[0]+"**")
+			await stream.send("\n   - Priority: "+str(row[1]))
+			if not row[2] or row[2] < 0:
+				tlimit = 0
+			else:
+				tlimit = row[2]
+			await stream.send("\n   - Duration bewteen two bans: "+str(tlimit)+"h")
+			if not row[3] or row[3] < 0:
+				plimit = row[1]-1
+			else:
+				plimit = min(row[3], row[1])
+			await stream.send("\n   - Maximum priority that can be banned: "+str(plimit))
+			if not row[4] or row[4] <= 0:
+				purge = "Can't use purge command"
+			else:
+				purge = "Can use purge command"
+			await stream.send("\n   - "+purge)
 
 		await stream.finish()
 
 	@praxisbot.command
+	@praxisbot.argument('member', help='A member of the server.')
 	async def execute_get_mod_level(self, scope, command, options, lines, **kwargs):
 		"""
 		Give the highest moderator level of a member.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('member', help='A member of the server.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -318,17 +321,16 @@ class ModerationPlugin(praxisbot.Plugin):
 			await scope.shell.print_error(scope, "User not found.")
 			return
 
-		userLevel = self.get_mod_level(member)
+		userLevel = await self.get_mod_level(member)
 
 		await scope.shell.print_info(scope, member.name+"#"+member.discriminator+" moderator level is: "+userLevel["name"]+".")
 
+	@praxisbot.argument('member', help='Name of the member to '+action_name+'.')
+	@praxisbot.argument('--reason', help='Reason for the '+action_name+'.')
 	async def execute_kick_or_ban(self, scope, command, options, lines, **kwargs):
 		action_name = kwargs["action_name"]
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('member', help='Name of the member to '+action_name+'.')
-		parser.add_argument('--reason', help='Reason for the '+action_name+'.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -341,14 +343,14 @@ class ModerationPlugin(praxisbot.Plugin):
 			await scope.shell.print_error(scope, "You can't {} yourself.".format(action_name))
 			return
 
-		userLevel = self.get_mod_level(scope.user)
-		targetLevel = self.get_mod_level(u)
+		userLevel = await self.get_mod_level(scope.user)
+		targetLevel = await self.get_mod_level(u)
 
 		if targetLevel["priority"] > userLevel["ban_prioritylimit"]:
 			await scope.shell.print_error(scope, "You can't {} {} with your level. You're permission level is : {} and you should be > {}. You are using mod level : {}".format(action_name,u.display_name,userLevel["ban_prioritylimit"],targetLevel["priority"],userLevel["name"]))
 			return
 
-		banData = scope.shell.get_sql_data("ban_time", ["id", "last_time as 'last_time_ [timestamp]'"], {"discord_sid": scope.guild.id, "discord_uid": scope.user.id})
+		banData = await scope.shell.get_sql_data("ban_time", ["id", "last_time as 'last_time_ [timestamp]'"], {"discord_sid": scope.guild.id, "discord_uid": scope.user.id}, scope=scope)
 		if banData:
 
 			last_time = timezone('UTC').localize(banData[1])
@@ -376,7 +378,7 @@ class ModerationPlugin(praxisbot.Plugin):
 
 		last_time = datetime.datetime.now(timezone('UTC'))
 
-		scope.shell.set_sql_data("ban_time", {"last_time": str(last_time)}, {"discord_sid": int(scope.guild.id), "discord_uid": scope.user.id})
+		await scope.shell.set_sql_data("ban_time", {"last_time": str(last_time)}, {"discord_sid": int(scope.guild.id), "discord_uid": scope.user.id}, scope=scope)
 		if action_name == "ban":
 			await scope.shell.print_success(scope, ""+u.display_name+" banned.")
 		else:
@@ -392,15 +394,14 @@ class ModerationPlugin(praxisbot.Plugin):
 		await self.execute_kick_or_ban(scope, command, options, lines, action_name="ban", **kwargs)
 
 	@praxisbot.command
+	@praxisbot.argument('user_id', help='Id of the user to preban.')
+	@praxisbot.argument('--reason', help='Reason for the preban.')
 	async def execube_preban(self, scope, command, options, lines, **kwargs):
 		"""
 		Preban a user.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('user_id', help='Id of the user to preban.')
-		parser.add_argument('--reason', help='Reason for the preban.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 		try:
@@ -416,13 +417,13 @@ class ModerationPlugin(praxisbot.Plugin):
 			await scope.shell.print_error(scope, "You can't preban yourself.")
 			return
 
-		userLevel = self.get_mod_level(scope.user)
+		userLevel = await self.get_mod_level(scope.user)
 
 		if 0 > userLevel["ban_prioritylimit"]:
 			await scope.shell.print_error(scope, "You can't {} {} with your level. You're permission level is : {} and you should be > {}. You are using mod level : {}".format(action_name,u.display_name,userLevel["ban_prioritylimit"],0,userLevel["name"]))
 			return
 
-		banData = scope.shell.get_sql_data("ban_time", ["id", "last_time as 'last_time_ [timestamp]'"], {"discord_sid": scope.guild.id, "discord_uid": scope.user.id})
+		banData = await scope.shell.get_sql_data("ban_time", ["id", "last_time as 'last_time_ [timestamp]'"], {"discord_sid": scope.guild.id, "discord_uid": scope.user.id}, scope=scope)
 		if banData:
 
 			last_time = timezone('UTC').localize(banData[1])
@@ -447,7 +448,7 @@ class ModerationPlugin(praxisbot.Plugin):
 
 		last_time = datetime.datetime.now(timezone('UTC'))
 
-		scope.shell.set_sql_data("ban_time", {"last_time": str(last_time)}, {"discord_sid": int(scope.guild.id), "discord_uid": scope.user.id})
+		await scope.shell.set_sql_data("ban_time", {"last_time": str(last_time)}, {"discord_sid": int(scope.guild.id), "discord_uid": scope.user.id}, scope=scope)
 
 		await scope.shell.print_success(scope, ""+u.display_name+" banned.")
 		scope.deletecmd = True
@@ -467,8 +468,7 @@ class ModerationPlugin(praxisbot.Plugin):
 		List last bans.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return scope
 
@@ -497,21 +497,20 @@ class ModerationPlugin(praxisbot.Plugin):
 		await stream.finish()
 
 	@praxisbot.command
+	@praxisbot.argument('name', help='Name of moderation level.')
+	@praxisbot.argument('--bantime', help='Minimum duration between two bans in hours.')
+	@praxisbot.argument('--banpriority', help='Maximum level priority than can be banned.')
+	@praxisbot.argument('--purge', help='Enable or disable purge command.')
 	async def execute_set_mod_options(self, scope, command, options, lines, **kwargs):
 		"""
 		Configure options for a moderation level.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('name', help='Name of moderation level.')
-		parser.add_argument('--bantime', help='Minimum duration between two bans in hours.')
-		parser.add_argument('--banpriority', help='Maximum level priority than can be banned.')
-		parser.add_argument('--purge', help='Enable or disable purge command.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
-		modLevel = scope.shell.get_sql_data("mod_levels", ["id", "ban_timelimit", "ban_prioritylimit", "purge"], {"discord_sid":int(scope.guild.id), "name": str(args.name)})
+		modLevel = await scope.shell.get_sql_data("mod_levels", ["id", "ban_timelimit", "ban_prioritylimit", "purge"], {"discord_sid":int(scope.guild.id), "name": str(args.name)}, scope=scope)
 		if not modLevel:
 			await scope.shell.print_error(scope, "Mod level `"+str(args.name)+"` not found.")
 			return
@@ -528,9 +527,9 @@ class ModerationPlugin(praxisbot.Plugin):
 		if args.purge:
 			newPurge = int(args.purge)
 
-		scope.shell.set_sql_data("mod_levels", {"ban_timelimit": newBanTime, "ban_prioritylimit": newBanPriority, "purge": newPurge}, {"id":modLevel[0]})
+		await scope.shell.set_sql_data("mod_levels", {"ban_timelimit": newBanTime, "ban_prioritylimit": newBanPriority, "purge": newPurge}, {"id":modLevel[0]}, scope=scope)
 
-		row = scope.shell.get_sql_data("mod_levels", ["name", "priority", "ban_timelimit", "ban_prioritylimit", "purge"], {"id":modLevel[0]})
+		row = await scope.shell.get_sql_data("mod_levels", ["name", "priority", "ban_timelimit", "ban_prioritylimit", "purge"], {"id":modLevel[0]}, scope=scope)
 
 		text = "Mod level `"+str(args.name)+"` edited."
 		text = text+"\n:label: **"+row[0]+"**"
@@ -554,24 +553,23 @@ class ModerationPlugin(praxisbot.Plugin):
 		await scope.shell.print_success(scope, text)
 
 	@praxisbot.command
+	@praxisbot.argument('num', help='Number of messages to purge.')
+	@praxisbot.argument('--all', action='store_true', help='Remove all messages, including pinned messages.')
+	@praxisbot.argument('--before', help='Remove only messages before a specific message.')
+	@praxisbot.argument('--after', help='Remove only messages after a specific message.')
+	@praxisbot.argument('--onebyone', action='store_true', help='Remove messages one by one. Useful to bypass Discord limitations.')
 	async def execute_purge(self, scope, command, options, lines, **kwargs):
 		"""
 		Purge last messages in a channel.
 		"""
 
 		if scope.permission < praxisbot.UserPermission.Script:
-			userLevel = self.get_mod_level(scope.user)
+			userLevel = await self.get_mod_level(scope.user)
 			if userLevel["purge"] == 0:
 				await scope.shell.print_permission(scope, "You can't purge messages with your level.")
 				return
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('num', help='Number of messages to purge.')
-		parser.add_argument('--all', action='store_true', help='Remove all messages, including pinned messages.')
-		parser.add_argument('--before', help='Remove only messages before a specific message.')
-		parser.add_argument('--after', help='Remove only messages after a specific message.')
-		parser.add_argument('--onebyone', action='store_true', help='Remove messages one by one. Useful to bypass Discord limitations.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
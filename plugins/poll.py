@@ -43,30 +43,50 @@ class PollPlugin(praxisbot.Plugin):
 
 	name = "Poll"
 
+	migrations = [
+		[
+			praxisbot.SQLTable("polls", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "discord_cid INTEGER", "discord_mid INTEGER", "end_time DATETIME", "description TEXT", "type INTEGER"]),
+			praxisbot.SQLTable("poll_choices", ["id INTEGER PRIMARY KEY", "poll INTEGER", "emoji TEXT", "description TEXT"]),
+			praxisbot.SQLTable("votes", ["id INTEGER PRIMARY KEY", "poll INTEGER", "discord_uid INTEGER", "choice INTEGER", "vote_time DATETIME"])
+		],
+		[
+			praxisbot.SQLIndex("polls", ["discord_sid", "discord_mid"]),
+			praxisbot.SQLIndex("poll_choices", ["poll"]),
+			praxisbot.SQLIndex("votes", ["poll", "discord_uid"], unique=True),
+			praxisbot.SQLIndex("votes", ["poll", "choice"])
+		]
+	]
+
+	queries = [
+		("polls", ["discord_sid", "discord_mid"]),
+		("polls", ["discord_sid"]),
+		("poll_choices", ["poll"]),
+		("votes", ["poll", "discord_uid"]),
+		("votes", ["poll", "choice"]),
+		("votes", ["poll"])
+	]
+
 	def __init__(self, shell):
 		super().__init__(shell)
 
-		self.shell.create_sql_table("polls", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "discord_cid INTEGER", "discord_mid INTEGER", "end_time DATETIME", "description TEXT", "type INTEGER"])
-		self.shell.create_sql_table("poll_choices", ["id INTEGER PRIMARY KEY", "poll INTEGER", "emoji TEXT", "description TEXT"])
-		self.shell.create_sql_table("votes", ["id INTEGER PRIMARY KEY", "poll INTEGER", "discord_uid INTEGER", "choice INTEGER", "vote_time DATETIME"])
-
 		self.add_command("start_poll", self.execute_start_poll)
 		self.add_command("close_poll", self.execute_close_poll)
 		self.add_command("polls", self.execute_polls)
-		
-		self.pollKillers = {}
 
 	def check_emoji(self, reaction, emoji):
 		e = str(reaction.emoji)
 		return e.startswith(emoji)
 		
-	async def poll_autokiller(self, scope, poll_id, time):
-		print("Je vais supprimer la poll {}_{} dans {} secondes".format(scope.guild.id,poll_id,time))
-		await asyncio.sleep(time)
-		await self.end_poll(scope,poll_id)
-		
+	def schedule_poll_end(self, guild, poll_id, end_time, scope=None):
+		self.log.debug("Poll %s_%s will be closed at %s", guild.id, poll_id, end_time)
+		self.schedule(guild, "poll_{}".format(poll_id), lambda scope: self.end_poll(scope, poll_id), due=end_time.timestamp(), scope=scope)
+
 	async def end_poll(self, scope, poll_id):
-		poll = scope.shell.get_sql_data("polls", ["id","discord_cid", "discord_mid", "description"], {"discord_sid":int(scope.guild.id), "id":int(poll_id)})
+		poll = await scope.shell.get_sql_data("polls", ["id","discord_cid", "discord_mid", "description"], {"discord_sid":int(scope.guild.id), "id":int(poll_id)}, scope=scope)
+		if not poll:
+			return
+		self.unschedule(scope.guild, "poll_{}".format(poll_id), scope=scope)
+		scope.shell.remove_reaction_listener(poll[2], self)
 		chan = scope.shell.find_channel(str(poll[1]), scope.guild)
 		msg = None
 		if chan:
@@ -76,125 +96,130 @@ class PollPlugin(praxisbot.Plugin):
 				pass
 		if msg:
 			text = poll[3]+"\n\n**Results:**"
-			choices = scope.shell.get_sql_data("poll_choices",["id","emoji","description"], {"poll":poll[0]},True)
+			choices = await scope.shell.get_sql_data("poll_choices",["id","emoji","description"], {"poll":poll[0]},True, scope=scope)
 			if choices:
 				for choice in choices: #c1.execute("SELECT id, emoji, description FROM {} WHERE poll = {}".format(scope.shell.dbtable("poll_choices"),poll[0])):
-					counter = scope.shell.get_sql_data("votes", ["COUNT(id)"], {"poll": poll[0], "choice": choice[0]})
+					counter = await scope.shell.get_sql_data("votes", ["COUNT(id)"], {"poll": poll[0], "choice": choice[0]}, scope=scope)
 					text = text+"\n\n{} {} : {}".format(choice[1],choice[2],counter[0])
 
 			await msg.edit(content=text)
 			await msg.clear_reactions()
 			
-		scope.shell.delete_sql_data("votes", {"poll": poll[0]})
-		scope.shell.delete_sql_data("poll_choices", {"poll": poll[0]})
-		scope.shell.delete_sql_data("polls", {"id": poll[0]})
-		key = "{}_{}".format(scope.guild.id,poll_id)
-		if key in self.pollKillers.keys():
-			self.pollKillers.pop(key)
-		
-	async def on_reaction(self, scope, reaction=None):
-		print("Reaction")
-		with scope.shell.dbcon:
-			if reaction:
-				print("Reaction added on a message : {}".format(reaction.message.id))
-				polls = scope.shell.get_sql_data("polls",["id","discord_cid","discord_mid","description","end_time as 'end_time_ [timestamp]'","type"],{"discord_sid":scope.guild.id,"discord_mid":reaction.message.id},True)
+		await scope.shell.delete_sql_data("votes", {"poll": poll[0]}, scope=scope)
+		await scope.shell.delete_sql_data("poll_choices", {"poll": poll[0]}, scope=scope)
+		await scope.shell.delete_sql_data("polls", {"id": poll[0]}, scope=scope)
+
+	async def register_vote(self, scope, poll, choices, msg, reaction, user):
+		"""
+		Record the vote of user for the choice matching reaction, then remove the reaction. Return True if the results changed
+		"""
+		choice_id = None
+		for c in choices:
+			if self.check_emoji(reaction, choices[c][0]):
+				choice_id = c
+				break
+
+		if not choice_id:
+			await msg.remove_reaction(reaction.emoji, user)
+			return False
+
+		choice_emoji = choices[choice_id][0]
+		choice_desc = choices[choice_id][1]
+		try:
+			await msg.remove_reaction(reaction.emoji, user)
+			vote = await scope.shell.get_sql_data("votes", ["id", "choice"], {"poll": poll[0], "discord_uid": int(user.id)}, scope=scope)
+			if vote:
+				previous_choice_emoji = choices[vote[1]][0]
+				previous_choice_desc = choices[vote[1]][1]
+			if not vote: #Si c'est le premier vote de voter
+				await scope.shell.add_sql_data("votes", {"poll": poll[0], "discord_uid": int(user.id), "choice":choice_id}, scope=scope)
+				await user.send("Your vote on the server \"{}\" is confirmed.\n – Vote added: {} : {}".format(scope.guild.name,choice_emoji,choice_desc))
+				return True
+			elif choice_emoji != previous_choice_emoji: #Sinon si le vote est différent du précédent
+				await scope.shell.update_sql_data("votes", {"choice":choice_id}, {"id": vote[0]}, scope=scope)
+				await user.send("Your vote on the server \"{}\" is confirmed.\n – Vote removed: {} : {}\n – Vote added: {} : {}".format(scope.guild.name,previous_choice_emoji,previous_choice_desc,choice_emoji,choice_desc))
+				return True
 			else:
-				polls = scope.shell.get_sql_data("polls",["id","discord_cid","discord_mid","description","end_time as 'end_time_ [timestamp]'","type"],{"discord_sid":scope.guild.id},True)
-			for poll in polls:
-				if reaction:
-					msg = reaction.message
-				else:
-					print("No Reaction !")
-					chan = scope.shell.find_channel(str(poll[1]), scope.guild)
-					msg = None
-					if chan:
-						try:
-							msg = await chan.fetch_message(int(poll[2]))
-						except:
-							pass
-				if msg:
-					changes = False
-					choices = {}
-					reaction_already_added = []
-					
-					entries = scope.shell.get_sql_data("poll_choices",["id","emoji","description"],{"poll":poll[0]},True)
-					for entry in entries:
-						choices[entry[0]] = [entry[1],entry[2]]
-
-					for r in msg.reactions:
-						choice_id = None
-						for c in choices:
-							if self.check_emoji(r, choices[c][0]):
-								choice_id = c
-								break
-
-						async for ru in r.users():
-							choice_id = choice_id
-							choice_emoji = choices[choice_id][0]
-							choice_desc = choices[choice_id][1]
-							if not choice_id:
-								await msg.remove_reaction(r.emoji, ru)
-							elif ru.id == scope.shell.client.user.id:
-								reaction_already_added.append(choice_emoji)
-							else:
-								try:
-									await msg.remove_reaction(r.emoji, ru)
-									vote_time = datetime.datetime.now(timezone('UTC'))
-									vote = scope.shell.get_sql_data("votes", ["id", "choice"], {"poll": poll[0], "discord_uid": int(ru.id)})
-									if vote:
-										previous_choice_emoji = choices[vote[1]][0]
-										previous_choice_desc = choices[vote[1]][1]
-									if not vote: #Si c'est le premier vote de voter
-										scope.shell.add_sql_data("votes", {"poll": poll[0], "discord_uid": int(ru.id), "choice":choice_id})
-										await ru.send("Your vote on the server \"{}\" is confirmed.\n – Vote added: {} : {}".format(scope.guild.name,choice_emoji,choice_desc))
-										changes = True
-									elif choice_emoji != previous_choice_emoji: #Sinon si le vote est différent du précédent
-										scope.shell.update_sql_data("votes", {"choice":choice_id}, {"id": vote[0]})
-										await ru.send("Your vote on the server \"{}\" is confirmed.\n – Vote removed: {} : {}\n – Vote added: {} : {}".format(scope.guild.name,previous_choice_emoji,previous_choice_desc,choice_emoji,choice_desc))
-										changes = True
-									else:
-										await ru.send("Your vote on the server \"{}\" is confirmed.".format(scope.guild.name))
-								except:
-									print(traceback.format_exc())
-									await ru.send(":no_entry: Your vote on the server \"{}\" was lost due to a technical issue.".format(scope.guild.name))
-
-					print("I'll add not already added reactions")
-					for c in choices:
-						if choices[c] not in reaction_already_added:
-							await msg.add_reaction(choices[c][0])
-							
-					if changes:
-						text = poll[3]
-						end_time_readable = poll[4].astimezone(timezone('Europe/Paris'))
-						print("Text :\n{}".format(text))
-						if poll[5] != PollType.Short:
-							text = text+"\n\n**Poll closing at {}.\nTo vote, please click on one of the following reactions:**".format(end_time_readable.strftime("%Y-%m-%d %H:%M:%S"))
-						
-						choices = self.shell.get_sql_data("poll_choices",["id","emoji","description"],{"poll":poll[0]},True)
-						for choice in choices:
-							if poll[5] != PollType.Short:
-								text = text+"\n\n{} : {}".format(choice[1],choice[2])
-							if poll[5] == PollType.Live:
-								counter = scope.shell.get_sql_data("votes", ["COUNT(id)"], {"poll": poll[0], "choice": choice[0]})
-								text = text+" ({})".format(counter[0])
-
-						if poll[5] != PollType.Short:
-							counter = scope.shell.get_sql_data("votes", ["COUNT(id)"], {"poll": poll[0]})
-							text = text+"\n\nVoters: {}".format(counter[0])
-						await msg.edit(content=text)
-	
+				await user.send("Your vote on the server \"{}\" is confirmed.".format(scope.guild.name))
+		except:
+			self.log.exception("Vote on poll %s lost", poll[0], extra={"guild": scope.guild.id})
+			await user.send(":no_entry: Your vote on the server \"{}\" was lost due to a technical issue.".format(scope.guild.name))
+		return False
+
+	async def update_poll_message(self, scope, poll, msg):
+		text = poll[3]
+		end_time_readable = poll[4].astimezone(timezone('Europe/Paris'))
+		if poll[5] != PollType.Short:
+			text = text+"\n\n**Poll closing at {}.\nTo vote, please click on one of the following reactions:**".format(end_time_readable.strftime("%Y-%m-%d %H:%M:%S"))
+
+		choices = await self.shell.get_sql_data("poll_choices",["id","emoji","description"],{"poll":poll[0]},True, scope=scope)
+		for choice in choices:
+			if poll[5] != PollType.Short:
+				text = text+"\n\n{} : {}".format(choice[1],choice[2])
+			if poll[5] == PollType.Live:
+				counter = await scope.shell.get_sql_data("votes", ["COUNT(id)"], {"poll": poll[0], "choice": choice[0]}, scope=scope)
+				text = text+" ({})".format(counter[0])
+
+		if poll[5] != PollType.Short:
+			counter = await scope.shell.get_sql_data("votes", ["COUNT(id)"], {"poll": poll[0]}, scope=scope)
+			text = text+"\n\nVoters: {}".format(counter[0])
+		await msg.edit(content=text)
+
+	async def get_choices(self, scope, poll):
+		choices = {}
+		for entry in await scope.shell.get_sql_data("poll_choices",["id","emoji","description"],{"poll":poll[0]},True, scope=scope):
+			choices[entry[0]] = [entry[1],entry[2]]
+		return choices
+
+	async def on_reaction(self, scope, reaction=None):
+		"""
+		Count the vote of a new reaction, or without reaction, the votes left on all polls of the guild (e.g. while the bot was offline)
+		"""
+		if reaction:
+			self.log.debug("Reaction added on message %s", reaction.message_id, extra={"guild": scope.guild.id})
+			polls = await scope.shell.get_sql_data("polls",["id","discord_cid","discord_mid","description","end_time as 'end_time_ [timestamp]'","type"],{"discord_sid":scope.guild.id,"discord_mid":reaction.message_id},True, scope=scope)
+			for poll in polls or []:
+				msg = await reaction.fetch_message()
+				if await self.register_vote(scope, poll, await self.get_choices(scope, poll), msg, reaction, reaction.member):
+					await self.update_poll_message(scope, poll, msg)
+			return
+
+		polls = await scope.shell.get_sql_data("polls",["id","discord_cid","discord_mid","description","end_time as 'end_time_ [timestamp]'","type"],{"discord_sid":scope.guild.id},True, scope=scope)
+		for poll in polls:
+			chan = scope.shell.find_channel(str(poll[1]), scope.guild)
+			msg = None
+			if chan:
+				try:
+					msg = await chan.fetch_message(int(poll[2]))
+				except:
+					pass
+			if msg:
+				changes = False
+				reaction_already_added = []
+				choices = await self.get_choices(scope, poll)
+
+				for r in msg.reactions:
+					async for ru in r.users():
+						if ru.id == scope.shell.client.user.id:
+							reaction_already_added.append(str(r.emoji))
+						elif await self.register_vote(scope, poll, choices, msg, r, ru):
+							changes = True
+
+				for c in choices:
+					if choices[c][0] not in reaction_already_added:
+						await msg.add_reaction(choices[c][0])
+
+				if changes:
+					await self.update_poll_message(scope, poll, msg)
+
 	async def on_ready(self, scope):
-		print("Poll plugin getting ready")
-		polls = scope.shell.get_sql_data("polls",["id","discord_cid","discord_mid","description","end_time as 'end_time_ [timestamp]'","type"],{"discord_sid":scope.guild.id},True)
-		print("Il y a {} polls dans la guilde {}".format(len(polls),scope.guild.id))
+		polls = await scope.shell.get_sql_data("polls",["id","discord_cid","discord_mid","description","end_time as 'end_time_ [timestamp]'","type"],{"discord_sid":scope.guild.id},True, scope=scope)
+		self.log.debug("%d polls in guild %s", len(polls), scope.guild.id, extra={"guild": scope.guild.id})
 		for poll in polls:
-			print("Poll suivante {}".format(poll))
 			chan = scope.shell.find_channel(poll[1], scope.guild)
-			print("Je viens de chercher le salon")
 			msg = None
 			if chan:
 				try:
-					print("Je suis dans un salon : {}".format(chan.name))
 					msg = await chan.fetch_message(int(poll[2]))
 				except:
 					pass
@@ -202,34 +227,28 @@ class PollPlugin(praxisbot.Plugin):
 			end_time = timezone('UTC').localize(poll[4])
 			end_time_readable = end_time.astimezone(timezone('Europe/Paris'))
 			current_time = datetime.datetime.now(timezone('UTC'))
-			task_key = "{}_{}".format(scope.guild.id,poll[0])
 			if current_time > end_time:
-				print("Je dois terminé la poll {}_{}".format(scope.guild.id,poll[0]))
+				self.log.debug("Poll %s_%s has expired", scope.guild.id, poll[0])
 				await self.end_poll(scope, poll[0])
-			elif not task_key in self.pollKillers.keys():
-				remaining_time = end_time - current_time
-				remaining_seconds = int(remaining_time.total_seconds())
-				print("Dans {} secondes, la poll {}_{} doit mourir.".format(remaining_seconds,scope.guild.id,poll[0]))
-				self.pollKillers[task_key] = asyncio.create_task(self.poll_autokiller(scope,poll[0],remaining_seconds))
 			else:
-				print("Tout est en ordre")
+				scope.shell.add_reaction_listener(poll[2], self)
+				self.schedule_poll_end(scope.guild, poll[0], end_time)
 			#await scope.guild.me.fetch_message(poll[2])
 		await self.on_reaction(scope)
 
 	@praxisbot.command
+	@praxisbot.argument('--duration', help='Duration of the poll in hours.')
+	@praxisbot.argument('--description', help='Description of the poll.')
+	@praxisbot.argument('--channel', help='Channel where the poll will be created.')
+	@praxisbot.argument('--short', action='store_true', help='Remove all explanations except the description.')
+	@praxisbot.argument('--live', action='store_true', help='Display results in real time.')
+	@praxisbot.argument('--choices', nargs='*', help='List of emoji and decriptions. Ex: `👎 "No" 🤷 "Neutral" 👍 "Yes".`', default=["👎", "I disagree", "🤷", "Neutral", "👍", "I agree"])
 	async def execute_start_poll(self, scope, command, options, lines, **kwargs):
 		"""
 		Start a poll.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('--duration', help='Duration of the poll in hours.')
-		parser.add_argument('--description', help='Description of the poll.')
-		parser.add_argument('--channel', help='Channel where the poll will be created.')
-		parser.add_argument('--short', action='store_true', help='Remove all explanations except the description.')
-		parser.add_argument('--live', action='store_true', help='Display results in real time.')
-		parser.add_argument('--choices', nargs='*', help='List of emoji and decriptions. Ex: `👎 "No" 🤷 "Neutral" 👍 "Yes".`', default=["👎", "I disagree", "🤷", "Neutral", "👍", "I agree"])
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -305,30 +324,28 @@ class PollPlugin(praxisbot.Plugin):
 				await scope.shell.print_error(scope, "\"{}\" is not a valid emoji.".format(c["emoji"]))
 				return
 
-		poll_id = scope.shell.add_sql_data("polls", {"discord_sid": int(msg.guild.id), "discord_cid": int(chan.id), "discord_mid": int(msg.id), "description": description, "end_time": str(end_time), "type":int(poll_type)})
-		remaining_time = end_time - current_time
-		remaining_seconds = int(remaining_time.total_seconds())
-		task_key = "{}_{}".format(scope.guild.id,poll_id)
-		self.pollKillers[task_key] = asyncio.create_task(self.poll_autokiller(scope,poll_id,remaining_seconds))
+		poll_id = await scope.shell.add_sql_data("polls", {"discord_sid": int(msg.guild.id), "discord_cid": int(chan.id), "discord_mid": int(msg.id), "description": description, "end_time": str(end_time), "type":int(poll_type)}, scope=scope, return_id=True)
+		scope.shell.add_reaction_listener(msg.id, self)
+		scope.on_rollback(lambda: scope.shell.remove_reaction_listener(msg.id, self))
+		self.schedule_poll_end(scope.guild, poll_id, end_time, scope=scope)
 
 		for c in choices:
-			scope.shell.add_sql_data("poll_choices", {"poll": poll_id, "emoji": c["emoji"], "description": c["description"]})
+			await scope.shell.add_sql_data("poll_choices", {"poll": poll_id, "emoji": c["emoji"], "description": c["description"]}, scope=scope)
 
 	@praxisbot.command
+	@praxisbot.argument('poll', help='ID of the poll to close.')
 	async def execute_close_poll(self, scope, command, options, lines, **kwargs):
 		"""
 		Close a poll.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('poll', help='ID of the poll to close.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		self.ensure_object_id("Poll ID", args.poll)
 
-		poll = scope.shell.get_sql_data("polls", ["id"], {"discord_sid":int(scope.guild.id), "id":int(args.poll)})
+		poll = await scope.shell.get_sql_data("polls", ["id"], {"discord_sid":int(scope.guild.id), "id":int(args.poll)}, scope=scope)
 		if not poll:
 			await scope.shell.print_error(scope, "Poll #"+args.poll+"not found.")
 			return
@@ -342,36 +359,32 @@ class PollPlugin(praxisbot.Plugin):
 		List all current polls.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		stream = praxisbot.MessageStream(scope)
 		await stream.send("__**List of polls**__")
 
-		with scope.shell.dbcon:
-			c0 = scope.shell.dbcon.cursor()
-			c1 = scope.shell.dbcon.cursor()
-			for row in c0.execute("SELECT id, description, discord_cid, end_time as 'end_time_ [timestamp]' FROM "+scope.shell.dbtable("polls")+" WHERE discord_sid = ? ORDER BY end_time", [int(scope.guild.id)]):
-				chan = scope.shell.find_channel(str(row[2]), scope.guild)
-				chan_name = "an unknown channel"
-				if chan:
-					chan_name = chan.mention
-
-				end_time = timezone('UTC').localize(row[3])
-				end_time = end_time.astimezone(timezone('Europe/Paris'))
-
-				counter = scope.shell.get_sql_data("votes", ["COUNT(id)"], {"poll": row[0]})
-
-				await stream.send("\n\n:bar_chart: **Poll #"+str(row[0])+" in "+chan_name+"**")
-				await stream.send("\n - Closing time: "+end_time.strftime("%Y-%m-%d %H:%M:%S"))
-				choices = []
-				for choice in c1.execute("SELECT emoji, description FROM "+scope.shell.dbtable("poll_choices")+" WHERE poll = ?", [row[0]]):
-					choices.append(choice[0]+" "+choice[1])
-				await stream.send("\n - Voters: "+str(counter[0]))
-				await stream.send("\n - Choices: "+", ".join(choices))
-				if len(row[1]) > 0:
-					description = "```\n"+row[1]+"\n```"
+		for row in await scope.db.fetchall("SELECT id, description, discord_cid, end_time as 'end_time_ [timestamp]' FROM "+scope.shell.dbtable("polls")+" WHERE discord_sid = ? ORDER BY end_time", [int(scope.guild.id)]):
+			chan = scope.shell.find_channel(str(row[2]), scope.guild)
+			chan_name = "an unknown channel"
+			if chan:
+				chan_name = chan.mention
+
+			end_time = timezone('UTC').localize(row[3])
+			end_time = end_time.astimezone(timezone('Europe/Paris'))
+
+			counter = await scope.shell.get_sql_data("votes", ["COUNT(id)"], {"poll": row[0]}, scope=scope)
+
+			await stream.send("\n\n:bar_chart: **Poll #"+str(row[0])+" in "+chan_name+"**")
+			await stream.send("\n - Closing time: "+end_time.strftime("%Y-%m-%d %H:%M:%S"))
+			choices = []
+			for choice in await scope.db.fetchall("SELECT emoji, description FROM "+scope.shell.dbtable("poll_choices")+" WHERE poll = ?", [row[0]]):
+				choices.append(choice[0]+" "+choice[1])
+			await stream.send("\n - Voters: "+str(counter[0]))
+			await stream.send("\n - Choices: "+", ".join(choices))
+			if len(row[1]) > 0:
+				description = "```\n"+row[1]+"\n```"
 
 		await stream.finish()
@@ -39,17 +39,42 @@ class RoleListPlugin(praxisbot.Plugin):
 
 	name = "RoleList"
 
+	migrations = [
+		[
+			praxisbot.SQLTable("role_options", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "discord_rid INTEGER", "description TEXT", "type INTEGER", "autosort INTEGER", "autosync INTEGER"])
+		],
+		[
+			praxisbot.SQLIndex("role_options", ["discord_sid", "discord_rid"], unique=True)
+		]
+	]
+
+	queries = [
+		("role_options", ["discord_sid", "discord_rid"]),
+		("role_options", ["discord_sid"])
+	]
+
 	def __init__(self, shell):
 		super().__init__(shell)
 
-		self.shell.create_sql_table("role_options", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "discord_rid INTEGER", "description TEXT", "type INTEGER", "autosort INTEGER", "autosync INTEGER"])
-
 		self.add_command("edit_role", self.execute_edit_role)
 		self.add_command("role_info", self.execute_role_info)
 		self.add_command("role_members", self.execute_role_members)
 		self.add_command("roles", self.execute_roles)
 
-	async def on_loop(self, scope):
+	async def on_ready(self, scope):
+		await self.schedule_autosort(scope)
+
+	async def schedule_autosort(self, scope):
+		"""
+		Sort roles every 5 seconds, only in guilds with a separator in autosort mode
+		"""
+		row = await scope.db.fetchone("SELECT 1 FROM "+scope.shell.dbtable("role_options")+" WHERE discord_sid = ? AND type = ? AND autosort = 1 LIMIT 1", [int(scope.guild.id), int(RoleType.Separator)])
+		if not row:
+			self.unschedule(scope.guild, "autosort", scope=scope)
+		elif not self.scheduled(scope.guild, "autosort"):
+			self.schedule(scope.guild, "autosort", self.execute_autosort, interval=5, scope=scope)
+
+	async def execute_autosort(self, scope):
 		roles = {}
 
 		for r in scope.guild.roles:
@@ -66,14 +91,12 @@ class RoleListPlugin(praxisbot.Plugin):
 				"object":r
 			}
 
-		with scope.shell.dbcon:
-			c = scope.shell.dbcon.cursor()
-			for row in c.execute("SELECT discord_rid, type, autosync, autosort FROM "+scope.shell.dbtable("role_options")+" WHERE discord_sid = ?", [int(scope.guild.id)]):
-				rid = str(row[0])
-				if rid in roles:
-					roles[rid]["type"] = row[1]
-					roles[rid]["autosync"] = row[2]
-					roles[rid]["autosort"] = row[3]
+		for row in await scope.db.fetchall("SELECT discord_rid, type, autosync, autosort FROM "+scope.shell.dbtable("role_options")+" WHERE discord_sid = ?", [int(scope.guild.id)]):
+			rid = str(row[0])
+			if rid in roles:
+				roles[rid]["type"] = row[1]
+				roles[rid]["autosync"] = row[2]
+				roles[rid]["autosort"] = row[3]
 
 		sorted_roles = sorted(roles.values(), key=lambda a: a["position"], reverse=True)
 
@@ -99,28 +122,27 @@ class RoleListPlugin(praxisbot.Plugin):
 			while i < len(sorted_subroles):
 				if sorted_subroles[i]["position"] != current_position:
 					await scope.shell.client.move_role(scope.guild, sorted_subroles[i]["object"], current_position)
-					return #To only one modification each on_loop iteration
+					return #To only one modification each run
 				current_position = current_position-1
 				i = i+1
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('role', help='Role to edit.')
+	@praxisbot.argument('--name', help='Name of the role.')
+	@praxisbot.argument('--mentionable', help='Set if the role can be mentioned. 0 or 1.')
+	@praxisbot.argument('--onlinelist', help='Set if the role must be displayed in the online list. 0 or 1.')
+	@praxisbot.argument('--description', help='Description of the role.')
+	@praxisbot.argument('--normal', action='store_true', help='Set this role as a normal role.')
+	@praxisbot.argument('--separator', action='store_true', help='Set this role as a separator.')
+	@praxisbot.argument('--autosort', help='Sort all sub-roles. For separators only. 0 or 1.')
+	@praxisbot.argument('--autosync', help='Sync permissions of all sub-roles. For separators only. 0 or 1.')
 	async def execute_edit_role(self, scope, command, options, lines, **kwargs):
 		"""
 		Edit role.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('role', help='Role to edit.')
-		parser.add_argument('--name', help='Name of the role.')
-		parser.add_argument('--mentionable', help='Set if the role can be mentioned. 0 or 1.')
-		parser.add_argument('--onlinelist', help='Set if the role must be displayed in the online list. 0 or 1.')
-		parser.add_argument('--description', help='Description of the role.')
-		parser.add_argument('--normal', action='store_true', help='Set this role as a normal role.')
-		parser.add_argument('--separator', action='store_true', help='Set this role as a separator.')
-		parser.add_argument('--autosort', help='Sort all sub-roles. For separators only. 0 or 1.')
-		parser.add_argument('--autosync', help='Sync permissions of all sub-roles. For separators only. 0 or 1.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -157,7 +179,7 @@ class RoleListPlugin(praxisbot.Plugin):
 		autosort = 0
 		autosync = 0
 
-		options = scope.shell.get_sql_data("role_options", ["description", "type", "autosort", "autosync"], {"discord_sid": int(scope.guild.id), "discord_rid":int(r.id)})
+		options = await scope.shell.get_sql_data("role_options", ["description", "type", "autosort", "autosync"], {"discord_sid": int(scope.guild.id), "discord_rid":int(r.id)}, scope=scope)
 		if options:
 			description = options[0]
 			type = options[1]
@@ -200,19 +222,19 @@ class RoleListPlugin(praxisbot.Plugin):
 				await scope.shell.print_error(scope, "The role "+r.name+" can't be edited.")
 				return
 
-		scope.shell.set_sql_data("role_options", {"description":description, "type":type, "autosort":autosort, "autosync":autosync}, {"discord_sid": int(scope.guild.id), "discord_rid":int(r.id)})
+		await scope.shell.set_sql_data("role_options", {"description":description, "type":type, "autosort":autosort, "autosync":autosync}, {"discord_sid": int(scope.guild.id), "discord_rid":int(r.id)}, scope=scope)
+		await self.schedule_autosort(scope)
 
 		await scope.shell.print_success(scope, "Role edited.")
 
 	@praxisbot.command
+	@praxisbot.argument('role', help='Role to edit.')
 	async def execute_role_info(self, scope, command, options, lines, **kwargs):
 		"""
 		Display information about a role.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('role', help='Role to edit.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -234,7 +256,7 @@ class RoleListPlugin(praxisbot.Plugin):
 		if role.colour.value != 0:
 			e.colour = role.colour
 
-		options = scope.shell.get_sql_data("role_options", ["description", "type", "autosort", "autosync"], {"discord_sid": int(scope.guild.id), "discord_rid":int(role.id)})
+		options = await scope.shell.get_sql_data("role_options", ["description", "type", "autosort", "autosync"], {"discord_sid": int(scope.guild.id), "discord_rid":int(role.id)}, scope=scope)
 		if options:
 			e.description = options[0]
 
@@ -264,14 +286,13 @@ class RoleListPlugin(praxisbot.Plugin):
 		await scope.channel.send("", embed=e)
 
 	@praxisbot.command
+	@praxisbot.argument('role', help='Role to edit.')
 	async def execute_role_members(self, scope, command, options, lines, **kwargs):
 		"""
 		Display members of a role.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('role', help='Role to edit.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -302,8 +323,7 @@ class RoleListPlugin(praxisbot.Plugin):
 		List all roles.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -332,15 +352,13 @@ class RoleListPlugin(praxisbot.Plugin):
 				if r.id in roles:
 					roles[r.id]["members"] = roles[r.id]["members"]+1
 
-		with scope.shell.dbcon:
-			c = scope.shell.dbcon.cursor()
-			for row in c.execute("SELECT discord_rid, type, description, autosync, autosort FROM "+scope.shell.dbtable("role_options")+" WHERE discord_sid = ?", [int(scope.guild.id)]):
-				rid = str(row[0])
-				if rid in roles:
-					roles[rid]["type"] = row[1]
-					roles[rid]["description"] = row[2]
-					roles[rid]["autosync"] = row[3]
-					roles[rid]["autosort"] = row[4]
+		for row in await scope.db.fetchall("SELECT discord_rid, type, description, autosync, autosort FROM "+scope.shell.dbtable("role_options")+" WHERE discord_sid = ?", [int(scope.guild.id)]):
+			rid = str(row[0])
+			if rid in roles:
+				roles[rid]["type"] = row[1]
+				roles[rid]["description"] = row[2]
+				roles[rid]["autosync"] = row[3]
+				roles[rid]["autosort"] = row[4]
 
 		sorted_roles = sorted(roles.values(), key=lambda a: a["position"], reverse=True)
 
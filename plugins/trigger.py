@@ -24,11 +24,80 @@ import argparse
 import re
 import asyncio
 import datetime
+import time
 import copy
 import io
 from pytz import timezone
 import praxisbot
 
+class CronSchedule:
+	"""
+	Cron expression "minute hour day month weekday", evaluated in Paris time
+	"""
+
+	fields = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+	def __init__(self, expression):
+		parts = expression.split()
+		if len(parts) != 5:
+			raise ValueError(expression)
+
+		self.minutes, self.hours, self.days, self.months, self.weekdays = [self.parse_field(f, low, high) for f, (low, high) in zip(parts, self.fields)]
+		if 7 in self.weekdays:
+			self.weekdays.add(0)
+		self.any_day = parts[2] == "*"
+		self.any_weekday = parts[4] == "*"
+
+	@staticmethod
+	def parse_field(field, low, high):
+		values = set()
+		for item in field.split(","):
+			step = 1
+			if "/" in item:
+				item, step = item.split("/", 1)
+				step = int(step)
+				if step < 1:
+					raise ValueError(field)
+			if item == "*":
+				start, end = low, high
+			elif "-" in item:
+				start, end = [int(v) for v in item.split("-", 1)]
+			else:
+				start = int(item)
+				end = high if step > 1 else start
+			if start < low or end > high or start > end:
+				raise ValueError(field)
+			values.update(range(start, end+1, step))
+		return values
+
+	def match_day(self, t):
+		day = t.day in self.days
+		weekday = t.isoweekday()%7 in self.weekdays
+		#As in cron, a restricted day and weekday match if either one does
+		if self.any_day or self.any_weekday:
+			return day and weekday
+		return day or weekday
+
+	def next(self, after):
+		"""
+		First time strictly after the aware datetime after, in UTC, or None if the expression never matches
+		"""
+		tz = timezone('Europe/Paris')
+		t = after.astimezone(tz).replace(tzinfo=None, second=0, microsecond=0)+datetime.timedelta(minutes=1)
+		limit = t+datetime.timedelta(days=366*5)
+		while t < limit:
+			if t.month not in self.months:
+				t = datetime.datetime(t.year+t.month//12, t.month%12+1, 1)
+			elif not self.match_day(t):
+				t = t.replace(hour=0, minute=0)+datetime.timedelta(days=1)
+			elif t.hour not in self.hours:
+				t = t.replace(minute=0)+datetime.timedelta(hours=1)
+			elif t.minute not in self.minutes:
+				t = t+datetime.timedelta(minutes=1)
+			else:
+				return tz.localize(t).astimezone(timezone('UTC'))
+		return None
+
 class TriggerPlugin(praxisbot.Plugin):
 	"""
 	Trigger commands
@@ -36,14 +105,35 @@ class TriggerPlugin(praxisbot.Plugin):
 
 	name = "Trigger"
 
+	migrations = [
+		[
+			praxisbot.SQLTable("triggers", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "command TEXT", "script TEXT"]),
+			praxisbot.SQLTable("time_triggers", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "script TEXT", "start_time DATETIME", "num_iterations INTEGER"]),
+			praxisbot.SQLTable("message_triggers", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "regex TEXT", "script TEXT"])
+		],
+		[
+			praxisbot.SQLIndex("triggers", ["discord_sid", "command"], unique=True),
+			praxisbot.SQLIndex("time_triggers", ["discord_sid", "start_time"]),
+			praxisbot.SQLIndex("message_triggers", ["discord_sid"])
+		],
+		[
+			praxisbot.SQLTable("time_triggers", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "script TEXT", "start_time DATETIME", "num_iterations INTEGER", "repeat_interval INTEGER", "cron TEXT"])
+		]
+	]
+
+	queries = [
+		("triggers", ["discord_sid", "command"]),
+		("triggers", ["discord_sid"]),
+		("time_triggers", ["discord_sid"]),
+		("time_triggers", ["discord_sid", "id"]),
+		("message_triggers", ["discord_sid"])
+	]
+
 	def __init__(self, shell):
 		super().__init__(shell)
 
 		self.time_triggers = {}
-
-		self.shell.create_sql_table("triggers", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "command TEXT", "script TEXT"])
-		self.shell.create_sql_table("time_triggers", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "script TEXT", "start_time DATETIME", "num_iterations INTEGER"])
-		self.shell.create_sql_table("message_triggers", ["id INTEGER PRIMARY KEY", "discord_sid INTEGER", "regex TEXT", "script TEXT"])
+		self.message_matchers = {}
 
 		self.add_command("create_trigger", self.execute_create_trigger)
 		self.add_command("edit_trigger", self.execute_edit_trigger)
@@ -55,6 +145,16 @@ class TriggerPlugin(praxisbot.Plugin):
 		self.add_command("create_message_trigger", self.execute_create_message_trigger)
 		self.add_command("message_triggers", self.execute_message_triggers)
 
+		self.load_trigger_names()
+
+	def load_trigger_names(self):
+		"""
+		Register the names of all triggers, so unknown names are rejected without any query
+		"""
+		rows = self.shell.db.run_sync(lambda dbcon: dbcon.execute("SELECT discord_sid, command FROM "+self.shell.dbtable("triggers")).fetchall())
+		for row in rows:
+			self.shell.register_custom_command(row[0], row[1], self)
+
 	async def execute_unregistered_command(self, scope, command, options, lines):
 		return await self.execute_trigger_script(scope, command, options, lines)
 
@@ -62,42 +162,95 @@ class TriggerPlugin(praxisbot.Plugin):
 		if command_found:
 			return
 
-		with scope.shell.dbcon:
-			c = scope.shell.dbcon.cursor()
-			for row in c.execute("SELECT regex, script FROM "+scope.shell.dbtable("message_triggers")+" WHERE discord_sid = ?", [int(scope.guild.id)]):
-				try:
-					if re.search(row[0], message.content):
-						subScope = scope.create_subscope()
-						subScope.prefixes = [""]
-						subScope.user = message.author
-						subScope.channel = message.channel
-						subScope.vars["params"] = message.content
-						subScope.verbose = 1
-						await scope.shell.execute_script(subScope, row[1])
-				except:
-					pass
+		matcher = await self.get_message_matcher(scope)
+		for trigger_id, script in await matcher.search(message.content):
+			try:
+				subScope = scope.create_subscope()
+				subScope.prefixes = [""]
+				subScope.user = message.author
+				subScope.channel = message.channel
+				subScope.vars["params"] = message.content
+				subScope.verbose = 1
+				await scope.shell.execute_script(subScope, script, cached=True)
+			except:
+				pass
+
+	async def get_message_matcher(self, scope):
+		"""
+		Compiled matcher of the message triggers of the guild, built on first use after a change
+		"""
+		matcher = self.message_matchers.get(scope.guild.id)
+		if not matcher:
+			rows = await scope.db.fetchall("SELECT regex, id, script FROM "+scope.shell.dbtable("message_triggers")+" WHERE discord_sid = ? ORDER BY id", [int(scope.guild.id)])
+			matcher = praxisbot.RegexMatcher([(row[0], (row[1], row[2])) for row in rows])
+			self.message_matchers[scope.guild.id] = matcher
+		return matcher
 
+	def invalidate_message_matcher(self, scope):
+		#The matcher is built again from the database, also if the change is rolled back
+		self.message_matchers.pop(scope.guild.id, None)
+		scope.on_rollback(lambda: self.message_matchers.pop(scope.guild.id, None))
 
-	async def on_loop(self, scope):
 
-		triggersToUpdate = {}
+	async def on_ready(self, scope):
+		await self.load_time_triggers(scope)
 
-		c = scope.shell.dbcon.cursor()
-		for row in c.execute("SELECT id, script, num_iterations, start_time, datetime('now') FROM "+scope.shell.dbtable("time_triggers")+" WHERE discord_sid = ? AND start_time < datetime('now')", [int(scope.guild.id)]):
-			triggersToUpdate[row[0]] = row[2]
+	async def load_time_triggers(self, scope):
+		"""
+		Schedule every time trigger of the guild at its due time
+		"""
+		for row in await scope.db.fetchall("SELECT id, start_time FROM "+scope.shell.dbtable("time_triggers")+" WHERE discord_sid = ?", [int(scope.guild.id)]):
+			self.schedule_time_trigger(scope.guild, row[0], self.time_trigger_due(row[1]))
 
-			subScope = scope.create_subscope()
-			subScope.prefixes = [""]
-			await scope.shell.execute_script(subScope, row[1])
+	def schedule_time_trigger(self, guild, trigger_id, due, scope=None):
+		self.schedule(guild, "time_trigger_{}".format(trigger_id), lambda scope: self.execute_time_trigger(scope, trigger_id), due=due, scope=scope)
 
+	def unschedule_time_trigger(self, guild, trigger_id, scope=None):
+		self.unschedule(guild, "time_trigger_{}".format(trigger_id), scope=scope)
 
-		for t in triggersToUpdate:
-			if triggersToUpdate[t] <= 1:
-				scope.shell.delete_sql_data("time_triggers", {"id": t})
-			else:
-				scope.shell.update_sql_data("time_triggers", {"num_iterations": int(triggersToUpdate[t]-1)}, {"id": t})
+	def time_trigger_due(self, start_time):
+		#start_time is stored in UTC
+		start_time = datetime.datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S").replace(tzinfo=datetime.timezone.utc)
+		return start_time.timestamp()
 
-		return
+	def next_time_trigger_run(self, previous, repeat_interval, cron):
+		"""
+		Next run of a recurring trigger after the run due at previous (UTC), skipping runs already missed. None for a one-time trigger
+		"""
+		now = datetime.datetime.now(timezone('UTC'))
+		if repeat_interval:
+			missed = max(int((now-previous).total_seconds()//repeat_interval)+1, 1)
+			return previous+datetime.timedelta(seconds=repeat_interval*missed)
+		if cron:
+			return CronSchedule(cron).next(max(previous, now))
+		return None
+
+	async def execute_time_trigger(self, scope, trigger_id):
+		trigger = await scope.shell.get_sql_data("time_triggers", ["script", "num_iterations", "start_time", "repeat_interval", "cron"], {"discord_sid": int(scope.guild.id), "id": int(trigger_id)}, scope=scope)
+		if not trigger:
+			return
+
+		subScope = scope.create_subscope()
+		subScope.prefixes = [""]
+		await scope.shell.execute_script(subScope, trigger[0], cached=True)
+
+		previous = timezone('UTC').localize(datetime.datetime.strptime(trigger[2], "%Y-%m-%d %H:%M:%S"))
+		next_time = self.next_time_trigger_run(previous, trigger[3], trigger[4])
+		if next_time:
+			#Recurring trigger: the row is kept and moved to its next run. num_iterations counts the runs left, 0 for no limit
+			if trigger[1] == 1:
+				await scope.shell.delete_sql_data("time_triggers", {"id": trigger_id}, scope=scope)
+				return
+
+			next_time = next_time.strftime("%Y-%m-%d %H:%M:%S")
+			await scope.shell.update_sql_data("time_triggers", {"start_time": next_time, "num_iterations": max(int(trigger[1] or 0)-1, 0)}, {"id": trigger_id}, scope=scope)
+			self.schedule_time_trigger(scope.guild, trigger_id, self.time_trigger_due(next_time))
+		elif trigger[1] <= 1:
+			await scope.shell.delete_sql_data("time_triggers", {"id": trigger_id}, scope=scope)
+		else:
+			await scope.shell.update_sql_data("time_triggers", {"num_iterations": int(trigger[1]-1)}, {"id": trigger_id}, scope=scope)
+			#Iterations left: run again in 5 seconds, as the former polling loop did
+			self.schedule_time_trigger(scope.guild, trigger_id, time.time()+5)
 
 	async def on_member_join(self, scope):
 		await self.execute_trigger_script(scope, "@join", "", [])
@@ -116,7 +269,10 @@ class TriggerPlugin(praxisbot.Plugin):
 		return True
 
 	async def execute_trigger_script(self, scope, command, options, lines, **kwargs):
-		script = scope.shell.get_sql_data("triggers", ["script"], {"discord_sid":int(scope.guild.id), "command":command})
+		if scope.shell.find_custom_command_plugin(scope.guild, command) != self:
+			return False
+
+		script = await scope.shell.get_sql_data("triggers", ["script"], {"discord_sid":int(scope.guild.id), "command":command}, scope=scope)
 		if not script:
 			return False
 
@@ -125,22 +281,21 @@ class TriggerPlugin(praxisbot.Plugin):
 		subScope.vars["params"] = options.strip()
 		subScope.permission = praxisbot.UserPermission.Script
 		subScope.verbose = 1
-		await scope.shell.execute_script(subScope, script[0])
+		await scope.shell.execute_script(subScope, script[0], cached=True)
 		scope.continue_from_subscope(subScope)
 		return True
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('command', help='Name of the trigger or ID of the message and time triggers.')
+	@praxisbot.argument('--message', '-m', action='store_true', help='Edit a message trigger.')
+	@praxisbot.argument('--time', '-t', action='store_true', help='Edit a time trigger.')
 	async def execute_edit_trigger(self, scope, command, options, lines, **kwargs):
 		"""
 		Edit the script associated to a trigger. The script must be written on the line after the command.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('command', help='Name of the trigger or ID of the message and time triggers.')
-		parser.add_argument('--message', '-m', action='store_true', help='Edit a message trigger.')
-		parser.add_argument('--time', '-t', action='store_true', help='Edit a time trigger.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -151,100 +306,102 @@ class TriggerPlugin(praxisbot.Plugin):
 		if args.message:
 			self.ensure_object_id("Message trigger ID", args.command)
 
-			trigger = scope.shell.get_sql_data("message_triggers", ["id"], {"discord_sid":int(scope.guild.id), "id":int(args.command)})
+			trigger = await scope.shell.get_sql_data("message_triggers", ["id"], {"discord_sid":int(scope.guild.id), "id":int(args.command)}, scope=scope)
 			if not trigger:
 				await scope.shell.print_error(scope, "Message trigger #"+args.command+" not found. Please check existing message triggers with `message_triggers`.")
 				return
 
-			scope.shell.set_sql_data("message_triggers", {"script": "\n".join(lines)}, {"id":trigger[0]})
+			await scope.shell.set_sql_data("message_triggers", {"script": "\n".join(lines)}, {"id":trigger[0]}, scope=scope)
+			self.invalidate_message_matcher(scope)
 			await scope.shell.print_success(scope, "Message trigger #"+args.command+" edited.")
 		elif args.time:
 			self.ensure_object_id("Time trigger ID", args.command)
 
-			trigger = scope.shell.get_sql_data("time_triggers", ["id"], {"discord_sid":int(scope.guild.id), "id":int(args.command)})
+			trigger = await scope.shell.get_sql_data("time_triggers", ["id"], {"discord_sid":int(scope.guild.id), "id":int(args.command)}, scope=scope)
 			if not trigger:
 				await scope.shell.print_error(scope, "Time trigger #"+args.command+" not found. Please check existing time triggers with `time_triggers`.")
 				return
 
-			scope.shell.set_sql_data("time_triggers", {"script": "\n".join(lines)}, {"id":trigger[0]})
+			await scope.shell.set_sql_data("time_triggers", {"script": "\n".join(lines)}, {"id":trigger[0]}, scope=scope)
 			await scope.shell.print_success(scope, "Time trigger #"+args.command+" edited.")
 		else:
 			if args.command not in ["@join", "@leave", "@ban", "@unban"]:
 				self.ensure_object_name("Command name", args.command)
 
-			trigger = scope.shell.get_sql_data("triggers", ["id"], {"discord_sid":int(scope.guild.id), "command":str(args.command)})
+			trigger = await scope.shell.get_sql_data("triggers", ["id"], {"discord_sid":int(scope.guild.id), "command":str(args.command)}, scope=scope)
 			if not trigger:
 				await scope.shell.print_error(scope, "Trigger `"+args.command+"` not found.")
 				return
 
-			scope.shell.set_sql_data("triggers", {"script": "\n".join(lines)}, {"id":trigger[0]})
+			await scope.shell.set_sql_data("triggers", {"script": "\n".join(lines)}, {"id":trigger[0]}, scope=scope)
 			await scope.shell.print_success(scope, "Trigger `"+args.command+"` edited.")
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('command', help='Name of the trigger or ID of the message and time triggers.')
+	@praxisbot.argument('--message', '-m', action='store_true', help='Delete a message trigger.')
+	@praxisbot.argument('--time', '-t', action='store_true', help='Delete a time trigger.')
 	async def execute_delete_trigger(self, scope, command, options, lines, **kwargs):
 		"""
 		Delete a trigger.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('command', help='Name of the trigger or ID of the message and time triggers.')
-		parser.add_argument('--message', '-m', action='store_true', help='Delete a message trigger.')
-		parser.add_argument('--time', '-t', action='store_true', help='Delete a time trigger.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		if args.message:
 			self.ensure_object_id("Message trigger ID", args.command)
 
-			trigger = scope.shell.get_sql_data("message_triggers", ["id"], {"discord_sid":int(scope.guild.id), "id":int(args.command)})
+			trigger = await scope.shell.get_sql_data("message_triggers", ["id"], {"discord_sid":int(scope.guild.id), "id":int(args.command)}, scope=scope)
 			if not trigger:
 				await scope.shell.print_error(scope, "Message trigger #"+args.command+" not found. Please check existing message triggers with `message_triggers`.")
 				return
 
-			scope.shell.delete_sql_data("message_triggers", {"id":trigger[0]})
+			await scope.shell.delete_sql_data("message_triggers", {"id":trigger[0]}, scope=scope)
+			self.invalidate_message_matcher(scope)
 			await scope.shell.print_success(scope, "Message trigger #"+args.command+" deleted.")
 		elif args.time:
 			self.ensure_object_id("Time trigger ID", args.command)
 
-			trigger = scope.shell.get_sql_data("time_triggers", ["id"], {"discord_sid":int(scope.guild.id), "id":int(args.command)})
+			trigger = await scope.shell.get_sql_data("time_triggers", ["id"], {"discord_sid":int(scope.guild.id), "id":int(args.command)}, scope=scope)
 			if not trigger:
 				await scope.shell.print_error(scope, "Time trigger #"+args.command+" not found. Please check existing time triggers with `time_triggers`.")
 				return
 
-			scope.shell.delete_sql_data("time_triggers", {"id":trigger[0]})
+			await scope.shell.delete_sql_data("time_triggers", {"id":trigger[0]}, scope=scope)
+			self.unschedule_time_trigger(scope.guild, trigger[0], scope=scope)
 			await scope.shell.print_success(scope, "Time trigger #"+args.command+" deleted.")
 		else:
 			if args.command not in ["@join", "@leave", "@ban", "@unban"]:
 				self.ensure_object_name("Command name", args.command)
 
-			trigger = scope.shell.get_sql_data("triggers", ["id"], {"discord_sid":int(scope.guild.id), "command":str(args.command)})
+			trigger = await scope.shell.get_sql_data("triggers", ["id"], {"discord_sid":int(scope.guild.id), "command":str(args.command)}, scope=scope)
 			if not trigger:
 				await scope.shell.print_error(scope, "Trigger `"+args.command+"` not found.")
 				return
 
-			scope.shell.delete_sql_data("triggers", {"id":trigger[0]})
+			await scope.shell.delete_sql_data("triggers", {"id":trigger[0]}, scope=scope)
+			scope.shell.unregister_custom_command(scope.guild.id, args.command, scope=scope)
 			await scope.shell.print_success(scope, "Trigger `"+args.command+"` deleted.")
 
 	@praxisbot.command
+	@praxisbot.argument('command', help='Name of the trigger or ID of the message and time triggers.')
+	@praxisbot.argument('--message', '-m', action='store_true', help='Show a message trigger.')
+	@praxisbot.argument('--time', '-t', action='store_true', help='Show a time trigger.')
 	async def execute_show_trigger(self, scope, command, options, lines, **kwargs):
 		"""
 		Show the script associated to a trigger.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('command', help='Name of the trigger or ID of the message and time triggers.')
-		parser.add_argument('--message', '-m', action='store_true', help='Show a message trigger.')
-		parser.add_argument('--time', '-t', action='store_true', help='Show a time trigger.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		if args.message:
 			self.ensure_object_id("Message trigger ID", args.command)
 
-			trigger = scope.shell.get_sql_data("message_triggers", ["script"], {"discord_sid":int(scope.guild.id), "id":int(args.command)})
+			trigger = await scope.shell.get_sql_data("message_triggers", ["script"], {"discord_sid":int(scope.guild.id), "id":int(args.command)}, scope=scope)
 			if not trigger:
 				await scope.shell.print_error(scope, "Message trigger #"+args.command+" not found. Please check existing message triggers with `message_triggers`.")
 				return
@@ -253,7 +410,7 @@ class TriggerPlugin(praxisbot.Plugin):
 		elif args.time:
 			self.ensure_object_id("Time trigger ID", args.command)
 
-			trigger = scope.shell.get_sql_data("time_triggers", ["script"], {"discord_sid":int(scope.guild.id), "id":int(args.command)})
+			trigger = await scope.shell.get_sql_data("time_triggers", ["script"], {"discord_sid":int(scope.guild.id), "id":int(args.command)}, scope=scope)
 			if not trigger:
 				await scope.shell.print_error(scope, "Time trigger #"+args.command+" not found. Please check existing time triggers with `time_triggers`.")
 				return
@@ -263,7 +420,7 @@ class TriggerPlugin(praxisbot.Plugin):
 			if args.command not in ["@join", "@leave", "@ban", "@unban"]:
 				self.ensure_object_name("Command name", args.command)
 
-			trigger = scope.shell.get_sql_data("triggers", ["script"], {"discord_sid":int(scope.guild.id), "command":str(args.command)})
+			trigger = await scope.shell.get_sql_data("triggers", ["script"], {"discord_sid":int(scope.guild.id), "command":str(args.command)}, scope=scope)
 			if not trigger:
 				await scope.shell.print_error(scope, "Trigger `"+args.command+"` not found.")
 				return
@@ -272,15 +429,14 @@ class TriggerPlugin(praxisbot.Plugin):
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('command', help='Name of the trigger')
+	@praxisbot.argument('--force', '-f', action='store_true', help='Replace the trigger if it already exists')
 	async def execute_create_trigger(self, scope, command, options, lines, **kwargs):
 		"""
 		Associate a script to a trigger. The script must be written on the line after the command.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('command', help='Name of the trigger')
-		parser.add_argument('--force', '-f', action='store_true', help='Replace the trigger if it already exists')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -291,12 +447,13 @@ class TriggerPlugin(praxisbot.Plugin):
 		if args.command not in ["@join", "@leave", "@ban", "@unban"]:
 			self.ensure_object_name("Command name", args.command)
 
-		trigger = scope.shell.get_sql_data("triggers", ["id"], {"discord_sid":int(scope.guild.id), "command":str(args.command)})
+		trigger = await scope.shell.get_sql_data("triggers", ["id"], {"discord_sid":int(scope.guild.id), "command":str(args.command)}, scope=scope)
 		if trigger and not args.force:
 			await scope.shell.print_error(scope, "Trigger `"+args.command+"` already exists. Please use --force to replace it.")
 			return
 
-		scope.shell.set_sql_data("triggers", {"script": "\n".join(lines)}, {"discord_sid":int(scope.guild.id), "command":str(args.command)})
+		await scope.shell.set_sql_data("triggers", {"script": "\n".join(lines)}, {"discord_sid":int(scope.guild.id), "command":str(args.command)}, scope=scope)
+		scope.shell.register_custom_command(scope.guild.id, args.command, self, scope=scope)
 		if trigger:
 			await scope.shell.print_success(scope, "Trigger `{}` edited.".format(args.command))
 		else:
@@ -309,49 +466,82 @@ class TriggerPlugin(praxisbot.Plugin):
 		List all custom commands.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		stream = praxisbot.MessageStream(scope)
 		await stream.send("__**List of commands**__\n")
 
-		with scope.shell.dbcon:
-			c = scope.shell.dbcon.cursor()
-			for row in c.execute("SELECT command FROM "+scope.shell.dbtable("triggers")+" WHERE discord_sid = ? ORDER BY command", [int(scope.guild.id)]):
-				if row[0].find("@") != 0:
-					await stream.send("\n - "+row[0])
+		for row in await scope.db.fetchall("SELECT command FROM "+scope.shell.dbtable("triggers")+" WHERE discord_sid = ? ORDER BY command", [int(scope.guild.id)]):
+			if row[0].find("@") != 0:
+				await stream.send("\n - "+row[0])
 
 		await stream.finish()
 
 	@praxisbot.command
 	@praxisbot.permission_script
+	@praxisbot.argument('time', nargs='?', help='Date and time. Must be in the format "YYYY-MM-DD HH-MM-SS".')
+	@praxisbot.argument('--command', help='Command to execute.')
+	@praxisbot.argument('--every', exclusive_group='repeat', help='Run the script again at this interval. Must be in the format "HH:MM:SS" or "D HH:MM:SS", at least one minute.')
+	@praxisbot.argument('--cron', exclusive_group='repeat', help='Run the script at the times matching this cron expression "minute hour day month weekday", in Paris time. Ex.: "0 9 * * 1-5".')
+	@praxisbot.argument('--iterations', help='Number of runs of a recurring trigger. No limit by default.')
 	async def execute_create_time_trigger(self, scope, command, options, lines, **kwargs):
 		"""
-		Execute a script at a specified time.
+		Execute a script at a specified time, once or repeatedly.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('time', nargs='?', help='Date and time. Must be in the format "YYYY-MM-DD HH-MM-SS".')
-		parser.add_argument('--command', help='Command to execute.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		num_iterations = 1
+		repeat_interval = None
+		cron = None
 		try:
 			if args.time:
 				start_time = datetime.datetime.strptime(args.time, "%Y-%m-%d %H:%M:%S")
 				start_time = timezone('Europe/Paris').localize(start_time)
 				start_time_utc = start_time.astimezone(timezone('UTC'))
 			else:
-				start_time_utc = datetime.datetime.now(timezone('UTC'))
-				start_time = start_time_utc.astimezone(timezone('Europe/Paris'))
+				start_time_utc = None
 		except ValueError:
 			await scope.shell.print_error(scope, "Date and time must be in the format \"yyyy-mm-dd HH:MM:SS\". Ex.: 2018-06-19 20:01:56.")
 			return
 
+		if args.every:
+			r = re.fullmatch("(?:([0-9]+) )?([0-9]+):([0-9]+):([0-9]+)", args.every.strip())
+			if r:
+				repeat_interval = int(r.group(1) or 0)*86400+int(r.group(2))*3600+int(r.group(3))*60+int(r.group(4))
+			if not r or repeat_interval < 60:
+				await scope.shell.print_error(scope, "Interval must be in the format \"HH:MM:SS\" or \"D HH:MM:SS\", and be at least one minute. Ex.: 1 00:00:00.")
+				return
+			if not start_time_utc:
+				start_time_utc = datetime.datetime.now(timezone('UTC'))+datetime.timedelta(seconds=repeat_interval)
+		elif args.cron:
+			try:
+				cron = args.cron.strip()
+				first_time = CronSchedule(cron).next((start_time_utc or datetime.datetime.now(timezone('UTC')))-datetime.timedelta(minutes=1))
+			except ValueError:
+				first_time = None
+			if not first_time:
+				await scope.shell.print_error(scope, "`{}` is not a valid cron expression \"minute hour day month weekday\". Ex.: 0 9 * * 1-5.".format(args.cron))
+				return
+			start_time_utc = first_time
+
+		if not start_time_utc:
+			start_time_utc = datetime.datetime.now(timezone('UTC'))
+		start_time = start_time_utc.astimezone(timezone('Europe/Paris'))
+
+		if repeat_interval or cron:
+			num_iterations = 0
+			if args.iterations:
+				self.ensure_integer("Number of iterations", args.iterations)
+				num_iterations = int(args.iterations)
+				if num_iterations < 1:
+					await scope.shell.print_error(scope, "Number of iterations must be at least 1.")
+					return
+
 		if args.command:
 			script = args.command
 		elif len(lines) > 0:
@@ -360,8 +550,13 @@ class TriggerPlugin(praxisbot.Plugin):
 			await scope.shell.print_error(scope, "Missing script. Please write the script in the same message, just the line after the command. Ex.:```\ncreate_time_trigger \"2018-06-19 20:01:56\"\nsay \"Hi {{@user}}!\"\nsay \"How are you?\"```")
 			return
 
-		scope.shell.add_sql_data("time_triggers", {"discord_sid": int(scope.guild.id), "script": script,  "start_time": start_time_utc.strftime("%Y-%m-%d %H:%M:%S"),  "num_iterations": num_iterations})
-		await scope.shell.print_success(scope, "The script will be executed "+str(num_iterations)+" time at "+start_time.strftime("%Y-%m-%d %H:%M:%S")+".")
+		trigger_id = await scope.shell.add_sql_data("time_triggers", {"discord_sid": int(scope.guild.id), "script": script,  "start_time": start_time_utc.strftime("%Y-%m-%d %H:%M:%S"),  "num_iterations": num_iterations, "repeat_interval": repeat_interval, "cron": cron}, scope=scope, return_id=True)
+		self.schedule_time_trigger(scope.guild, trigger_id, self.time_trigger_due(start_time_utc.strftime("%Y-%m-%d %H:%M:%S")), scope=scope)
+		if repeat_interval or cron:
+			runs = "repeatedly" if num_iterations == 0 else str(num_iterations)+" times"
+			await scope.shell.print_success(scope, "The script will be executed "+runs+" from "+start_time.strftime("%Y-%m-%d %H:%M:%S")+".")
+		else:
+			await scope.shell.print_success(scope, "The script will be executed "+str(num_iterations)+" time at "+start_time.strftime("%Y-%m-%d %H:%M:%S")+".")
 
 	@praxisbot.command
 	async def execute_time_triggers(self, scope, command, options, lines, **kwargs):
@@ -369,34 +564,38 @@ class TriggerPlugin(praxisbot.Plugin):
 		List all time triggers.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		stream = praxisbot.MessageStream(scope)
 		await stream.send("__**List of time triggers**__")
 
-		with scope.shell.dbcon:
-			c = scope.shell.dbcon.cursor()
-			for row in c.execute("SELECT id, script, start_time as 'start_time_ [timestamp]' FROM "+scope.shell.dbtable("time_triggers")+" WHERE discord_sid = ? ORDER BY start_time", [int(scope.guild.id)]):
-				start_time = timezone('UTC').localize(row[2])
-				start_time = start_time.astimezone(timezone('Europe/Paris'))
+		for row in await scope.db.fetchall("SELECT id, script, start_time as 'start_time_ [timestamp]', num_iterations, repeat_interval, cron FROM "+scope.shell.dbtable("time_triggers")+" WHERE discord_sid = ? ORDER BY start_time", [int(scope.guild.id)]):
+			start_time = timezone('UTC').localize(row[2])
+			start_time = start_time.astimezone(timezone('Europe/Paris'))
+
+			repeat = ""
+			if row[4]:
+				repeat = " every "+str(datetime.timedelta(seconds=row[4]))
+			elif row[5]:
+				repeat = " cron `"+row[5]+"`"
+			if repeat and row[3]:
+				repeat = repeat+", "+str(row[3])+" runs left"
 
-				await stream.send("\n\n:timer: **Time trigger #"+str(row[0])+":** `"+start_time.strftime("%Y-%m-%d %H:%M:%S")+"`\n```\n"+row[1]+"\n```")
+			await stream.send("\n\n:timer: **Time trigger #"+str(row[0])+":** `"+start_time.strftime("%Y-%m-%d %H:%M:%S")+"`"+repeat+"\n```\n"+row[1]+"\n```")
 
 		await stream.finish()
 
 	@praxisbot.command
 	@praxisbot.permission_admin
+	@praxisbot.argument('regex', help='Regular expression to filter messages.')
 	async def execute_create_message_trigger(self, scope, command, options, lines, **kwargs):
 		"""
 		Execute a script when a message match a regular expression.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		parser.add_argument('regex', help='Regular expression to filter messages.')
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
@@ -408,7 +607,8 @@ class TriggerPlugin(praxisbot.Plugin):
 
 		script = "\n".join(lines)
 
-		scope.shell.add_sql_data("message_triggers", {"discord_sid": int(scope.guild.id), "script": script,  "regex": str(args.regex)})
+		await scope.shell.add_sql_data("message_triggers", {"discord_sid": int(scope.guild.id), "script": script,  "regex": str(args.regex)}, scope=scope)
+		self.invalidate_message_matcher(scope)
 
 		await scope.shell.print_success(scope, "Message trigger created.")
 
@@ -418,18 +618,15 @@ class TriggerPlugin(praxisbot.Plugin):
 		List all message triggers.
 		"""
 
-		parser = argparse.ArgumentParser(description=kwargs["description"], prog=command)
-		args = await self.parse_options(scope, parser, options)
+		args = await self.parse_options(scope, kwargs["parser"], options)
 		if not args:
 			return
 
 		stream = praxisbot.MessageStream(scope)
 		await stream.send("__**List of message triggers**__")
 
-		with scope.shell.dbcon:
-			c = scope.shell.dbcon.cursor()
-			for row in c.execute("SELECT id, script, regex FROM "+scope.shell.dbtable("message_triggers")+" WHERE discord_sid = ?", [int(scope.guild.id)]):
+		for row in await scope.db.fetchall("SELECT id, script, regex FROM "+scope.shell.dbtable("message_triggers")+" WHERE discord_sid = ?", [int(scope.guild.id)]):
 
-				await stream.send("\n\n**:scroll: Message trigger #"+str(row[0])+":** `"+row[2]+"`\n```\n"+row[1]+"\n```")
+			await stream.send("\n\n**:scroll: Message trigger #"+str(row[0])+":** `"+row[2]+"`\n```\n"+row[1]+"\n```")
 
 		await stream.finish()
@@ -32,6 +32,7 @@ import inspect
 import datetime
 from pytz import timezone
 import sqlite3
+import logging
 import praxisbot
 from plugins.core import CorePlugin
 from plugins.trigger import TriggerPlugin
@@ -56,6 +57,13 @@ if len(sys.argv) < 2:
 
 botToken = sys.argv[1]
 
+#Level of the logs, and JSON lines output (with event, guild, plugin and duration fields) for log shipping
+logLevel = logging.INFO
+logJson = False
+praxisbot.setup_logging(logLevel, logJson)
+
+log = logging.getLogger("praxisbot.events")
+
 ########################################################################
 # Human
 
@@ -65,7 +73,7 @@ class PraxisHuman(discord.Client):
 	"""
 
 	async def on_ready(self):
-		print("Human logged on as {0}".format(self.user))
+		log.info("Human logged on as %s", self.user)
 
 
 ########################################################################
@@ -82,14 +90,28 @@ class PraxisBot(discord.Client):
 		self.mode = "testing"
 		self.dbprefix = "pb_"
 		self.dbfile = "databases/praxisbot-{}.db".format(self.mode)
-		self.dbcon = sqlite3.connect(self.dbfile, detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
+		self.dbcon = sqlite3.connect(self.dbfile, detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES, check_same_thread=False)
 		self.banned_members = {}
 
-		with self.dbcon:
-			#Server list
-			self.dbcon.execute("CREATE TABLE IF NOT EXISTS "+self.dbprefix+"servers(discord_sid INTEGER PRIMARY KEY, command_prefix TEXT)");
+		#Write-behind: commit writes in groups every write_behind_interval seconds (0 commits each write).
+		#Writes still queued are lost if the process crashes.
+		self.write_behind_interval = 0
+		self.write_behind_max_rows = 256
+
+		#Regular expressions of users run in sandbox processes, stopped after regex_timeout seconds, except the ones without quantifiers or backreferences (0 runs them all in the bot process)
+		#The processes are forked here, before the database thread starts
+		self.regex_timeout = 2.0
+		if self.regex_timeout > 0:
+			praxisbot.regex_cache.enable_sandbox(self.regex_timeout)
 
 		self.shell = praxisbot.Shell(self, self.dbprefix, self.dbcon, self.dbfile)
+		if self.write_behind_interval > 0:
+			self.shell.db.enable_write_behind(self.write_behind_interval, self.write_behind_max_rows)
+		self.shell.load_command_prefixes()
+
+		#Events are queued per guild and handled by a pool of workers, at most guild_concurrency at a time for one guild (1 keeps them in order)
+		self.shell.events.workers = 8
+		self.shell.events.guild_concurrency = 1
 
 		self.loopstarted = False
 
@@ -108,76 +130,95 @@ class PraxisBot(discord.Client):
 		self.shell.load_plugin(MathPlugin)
 		#self.shell.load_plugin(ComicPlugin)
 
+	async def close(self):
+		await self.shell.close()
+		await super().close()
+
 	async def on_ready(self):
-		print("Bot logged on as {0}".format(self.user))
+		log.info("Bot logged on as %s", self.user)
 
 		self.load_all_plugins()
+		self.shell.check_query_plans()
 		if self.mode == "testing":
 			await self.get_channel(461819232884097054).send("Je suis prêt")
 
 		if not self.loopstarted:
 			self.loopstarted = True
-			prevTime = time.time()
-			for p in self.shell.plugins:
-				for g in self.guilds:
-					scope = self.shell.create_scope(g, [""])
-					scope.channel = self.shell.get_default_channel(g)
-					scope.user = g.me
-					scope.permission = praxisbot.UserPermission.Script
-					
-					try:
-						await p.on_ready(scope)
-					except:
-						pass
-
-			while True:
-				currTime = time.time()
-				sleepDuration = 5 - (currTime - prevTime)
-				prevTime = currTime
-				if sleepDuration > 0:
-					await asyncio.sleep(sleepDuration)
-
-				for p in self.shell.plugins:
-					for s in self.guilds:
-						scope = self.shell.create_scope(s, [""])
-						scope.channel = self.shell.get_default_channel(s)
-						scope.user = s.me
-						scope.permission = praxisbot.UserPermission.Script
-
-						try:
-							await p.on_loop(scope)
-						except:
-							print(traceback.format_exc())
-							pass
-	
+			for g in self.guilds:
+				await self.prepare_guild(g)
+
+	async def prepare_guild(self, guild):
+		"""
+		Let plugins load the state of a guild and schedule its timed jobs
+		"""
+		for p in self.shell.plugins:
+			scope = self.shell.create_scope(guild, [""])
+			scope.channel = self.shell.get_default_channel(guild)
+			scope.user = guild.me
+			scope.permission = praxisbot.UserPermission.Script
+
+			try:
+				await p.on_ready(scope)
+				await scope.commit()
+			except:
+				scope.rollback()
+				log.exception("Plugin %s not ready", p.name, extra={"event": "ready", "guild": guild.id, "plugin": p.name})
+
+	async def call_plugins(self, scope, event, hook, *args):
+		"""
+		Call a hook of every plugin. The writes of a plugin that fails are rolled back, the ones of the others are kept
+		"""
+		for p in self.shell.plugins:
+			savepoint = scope.savepoint()
+			try:
+				await getattr(p, hook)(scope, *args)
+			except:
+				scope.rollback(savepoint)
+				log.exception("Plugin %s failed on %s", p.name, event, extra={"event": event, "guild": scope.guild.id, "plugin": p.name})
+
+	def log_event(self, event, guild, start):
+		"""
+		Log at debug level how long an event took to be handled
+		"""
+		if log.isEnabledFor(logging.DEBUG):
+			duration = time.perf_counter() - start
+			log.debug("Event %s handled in %.3fs", event, duration, extra={"event": event, "guild": guild.id, "duration": duration})
+
 	async def on_raw_reaction_add(self, payload):
-		try:
-			chan = self.get_channel(payload.channel_id)
-			message = await chan.fetch_message(payload.message_id)
-			for r in message.reactions:
-				async for u in r.users():
-					await self.on_reaction_add(r,u)
-		except AttributeError:
-			pass
-		
-	async def on_reaction_add(self, reaction, user):
-		if type(reaction.message.channel) == discord.DMChannel:
+		#Reactions of the gateway are handled as they come, without fetching the message or the other reactions
+		if not payload.guild_id or not payload.member:
+			return
+		if payload.member.bot:
 			return
-		if user.__class__ != discord.Member:
+
+		#Most reactions are on messages no plugin is waiting on
+		plugins = self.shell.find_reaction_listeners(payload.message_id, payload.channel_id, payload.user_id)
+		if not plugins:
 			return
-		if user.bot:
+
+		channel = payload.member.guild.get_channel(payload.channel_id)
+		if not channel:
 			return
 
-		scope = self.shell.create_scope(reaction.message.guild, [""])
-		scope.channel = reaction.message.channel
-		scope.user = user
+		self.shell.events.submit(channel.guild, self.handle_reaction, praxisbot.RawReaction(channel, payload), plugins)
+
+	async def handle_reaction(self, reaction, plugins):
+		start = time.perf_counter()
+		scope = self.shell.create_scope(reaction.guild, [""])
+		scope.channel = reaction.channel
+		scope.user = reaction.member
 		scope.permission = praxisbot.UserPermission.Script
 
-		for p in self.shell.plugins:
+		for p in plugins:
+			savepoint = scope.savepoint()
 			try:
 				await p.on_reaction(scope, reaction)
 			except:
-				pass
+				scope.rollback(savepoint)
+				log.debug("Reaction handler of plugin %s failed", p.name, exc_info=True, extra={"event": "reaction", "guild": scope.guild.id, "plugin": p.name})
+
+		await scope.commit()
+		self.log_event("reaction", scope.guild, start)
 
 	async def on_message(self, message):
 		if type(message.channel) == discord.DMChannel:
@@ -187,13 +228,11 @@ class PraxisBot(discord.Client):
 		if message.author.bot:
 			return
 
-		prefixes = ["-"]
+		self.shell.events.submit(message.guild, self.handle_message, message)
 
-		customCommandPrefix = self.shell.get_sql_data("servers", ["command_prefix"], {"discord_sid": int(message.guild.id)})
-		if customCommandPrefix:
-			prefixes.append(customCommandPrefix[0])
-
-		scope = self.shell.create_scope(message.guild, prefixes)
+	async def handle_message(self, message):
+		start = time.perf_counter()
+		scope = self.shell.create_scope(message.guild, self.shell.get_command_prefixes(message.guild))
 		scope.channel = message.channel
 		scope.user = message.author
 		if message.author.id == message.guild.owner.id:
@@ -203,19 +242,26 @@ class PraxisBot(discord.Client):
 
 		command_found = await self.shell.execute_command(scope, message.content)
 
-		for p in self.shell.plugins:
-			await p.on_message(scope, message, command_found)
+		await self.call_plugins(scope, "message", "on_message", message, command_found)
+
+		await scope.commit()
+		self.log_event("message", message.guild, start)
 
 		if command_found and scope.deletecmd:
 			try:
 				await message.delete()
 			except:
-				print("Attempt to delete command message failed")
+				log.warning("Attempt to delete command message failed", extra={"event": "message", "guild": message.guild.id})
 				raise discord.DiscordException()
 				pass
 
 
 	async def on_member_join(self, member):
+		self.shell.update_entity_index(member.guild, "members", after=member)
+		self.shell.events.submit(member.guild, self.handle_member_join, member)
+
+	async def handle_member_join(self, member):
+		start = time.perf_counter()
 		try:
 			scope = self.shell.create_scope(member.guild, [""])
 			scope.channel = self.shell.get_default_channel(member.guild)
@@ -223,14 +269,17 @@ class PraxisBot(discord.Client):
 			scope.permission = praxisbot.UserPermission.Script
 			scope.vars["target"] = member.name+"#"+member.discriminator
 
-			for p in self.shell.plugins:
-				await p.on_member_join(scope) #Ask for each script to do its command on_member_join -> Trigger
+			await self.call_plugins(scope, "member_join", "on_member_join") #Ask for each script to do its command on_member_join -> Trigger
+
+			await scope.commit()
+			self.log_event("member_join", member.guild, start)
 
 		except:
-			print(traceback.format_exc())
-			pass
+			log.exception("Event member_join failed", extra={"event": "member_join", "guild": member.guild.id})
 
 	async def on_member_remove(self, member):
+		self.shell.update_entity_index(member.guild, "members", before=member)
+
 		reason = "leave"
 
 		if member.id in self.banned_members:
@@ -238,6 +287,10 @@ class PraxisBot(discord.Client):
 			if self.banned_members[member.id] > accepted_time:
 				reason = "ban"
 
+		self.shell.events.submit(member.guild, self.handle_member_remove, member, reason)
+
+	async def handle_member_remove(self, member, reason):
+		start = time.perf_counter()
 		try:
 			scope = self.shell.create_scope(member.guild, [""])
 			scope.channel = self.shell.get_default_channel(member.guild)
@@ -246,12 +299,13 @@ class PraxisBot(discord.Client):
 			scope.vars["target"] = member.name+"#"+member.discriminator
 			scope.vars["reason"] = reason
 
-			for p in self.shell.plugins:
-				await p.on_member_leave(scope)
+			await self.call_plugins(scope, "member_leave", "on_member_leave")
+
+			await scope.commit()
+			self.log_event("member_leave", member.guild, start)
 
 		except:
-			print(traceback.format_exc())
-			pass
+			log.exception("Event member_leave failed", extra={"event": "member_leave", "guild": member.guild.id})
 
 	async def on_member_ban(self, guild, member):
 		self.banned_members[member.id] = datetime.datetime.now()
@@ -294,9 +348,12 @@ class PraxisBot(discord.Client):
 						ban_found_in_logs = True
 						break
 		except:
-			print(traceback.format_exc())
-			pass
+			log.exception("Ban of %s not found in audit logs", member.id, extra={"event": "ban", "guild": guild.id})
 
+		self.shell.events.submit(guild, self.handle_member_ban, guild, member, ban_user, ban_reason)
+
+	async def handle_member_ban(self, guild, member, ban_user, ban_reason):
+		start = time.perf_counter()
 		try:
 			scope = self.shell.create_scope(guild, [""])
 			scope.channel = self.shell.get_default_channel(guild)
@@ -306,14 +363,19 @@ class PraxisBot(discord.Client):
 			scope.vars["user"] = ban_user
 			scope.vars["target"] = member.name+"#"+member.discriminator
 
-			for p in self.shell.plugins:
-				await p.on_ban(scope)
+			await self.call_plugins(scope, "ban", "on_ban")
+
+			await scope.commit()
+			self.log_event("ban", guild, start)
 
 		except:
-			print(traceback.format_exc())
-			pass
+			log.exception("Event ban failed", extra={"event": "ban", "guild": guild.id})
 
 	async def on_member_unban(self, server, user):
+		self.shell.events.submit(server, self.handle_member_unban, server, user)
+
+	async def handle_member_unban(self, server, user):
+		start = time.perf_counter()
 		try:
 			scope = self.shell.create_scope(server, [""])
 			scope.channel = self.shell.get_default_channel(server)
@@ -321,12 +383,58 @@ class PraxisBot(discord.Client):
 			scope.permission = praxisbot.UserPermission.Script
 			scope.vars["target"] = user.name+"#"+user.discriminator
 
-			for p in self.shell.plugins:
-				await p.on_unban(scope)
+			await self.call_plugins(scope, "unban", "on_unban")
+
+			await scope.commit()
+			self.log_event("unban", server, start)
 
 		except:
-			print(traceback.format_exc())
-			pass
+			log.exception("Event unban failed", extra={"event": "unban", "guild": server.id})
+
+	async def on_member_update(self, before, after):
+		self.shell.update_entity_index(after.guild, "members", before, after)
+
+	async def on_user_update(self, before, after):
+		for g in self.guilds:
+			member = g.get_member(after.id)
+			if member:
+				self.shell.update_entity_index(g, "members", before, member)
+
+	async def on_guild_channel_create(self, channel):
+		self.shell.update_entity_index(channel.guild, "channels", after=channel)
+
+	async def on_guild_channel_delete(self, channel):
+		self.shell.update_entity_index(channel.guild, "channels", before=channel)
+
+	async def on_guild_channel_update(self, before, after):
+		self.shell.update_entity_index(after.guild, "channels", before, after)
+
+	async def on_guild_role_create(self, role):
+		self.shell.update_entity_index(role.guild, "roles", after=role)
+
+	async def on_guild_role_delete(self, role):
+		self.shell.update_entity_index(role.guild, "roles", before=role)
+
+	async def on_guild_role_update(self, before, after):
+		self.shell.update_entity_index(after.guild, "roles", before, after)
+
+	async def on_guild_emojis_update(self, guild, before, after):
+		for e in before:
+			self.shell.update_entity_index(guild, "emojis", before=e)
+		for e in after:
+			self.shell.update_entity_index(guild, "emojis", after=e)
+
+	async def on_guild_join(self, guild):
+		if self.loopstarted:
+			await self.prepare_guild(guild)
+
+	async def on_guild_available(self, guild):
+		#The guild was unavailable, its entities may have changed without events
+		self.shell.drop_entity_index(guild)
+
+	async def on_guild_remove(self, guild):
+		self.shell.drop_entity_index(guild)
+		self.shell.jobs.cancel_guild(guild)
 
 ########################################################################
 # Execute
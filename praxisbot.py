@@ -21,32 +21,32 @@ along with PraxisBot.  If not, see <http://www.gnu.org/licenses/>.
 
 import sys
 import io
+import argparse
 import traceback
 import shlex
 import copy
 import inspect
 import re
+try:
+	import re._parser as sre_parse
+except ImportError:
+	import sre_parse
 import random
 import sqlite3
 import discord
 import datetime
+import collections
+import heapq
+import itertools
+import asyncio
+import threading
+import concurrent.futures
+import multiprocessing
+import time
+import json
+import logging
 from pytz import timezone
-from functools import wraps
-
-class RedirectOutput():
-	def __init__(self, destout, desterr):
-		self.destout = destout
-		self.desterr = desterr
-		self.old_stdout = sys.stdout
-		self.old_stderr = sys.stderr
-
-	def __enter__(self):
-		sys.stdout = self.destout
-		sys.stderr = self.desterr
-
-	def __exit__(self, *args):
-		sys.stdout = self.old_stdout
-		sys.stderr = self.old_stderr
+from functools import wraps, lru_cache
 
 ################################################################################
 # Exceptions
@@ -90,18 +90,97 @@ class RegexError(Error):
 	def __init__(self, regex):
 		self.regex = regex
 
+class RegexTimeoutError(Error):
+	def __init__(self, regex):
+		self.regex = regex
+
+class OptionsError(Error):
+	def __init__(self, message, usage):
+		self.message = message
+		self.usage = usage
+
+class OptionsHelp(Error):
+	def __init__(self, text):
+		self.text = text
+
+################################################################################
+# Logging
+################################################################################
+
+log = logging.getLogger("praxisbot")
+shell_log = logging.getLogger("praxisbot.shell")
+sql_log = logging.getLogger("praxisbot.sql")
+
+class JsonFormatter(logging.Formatter):
+	"""
+	Format each record as one JSON object per line, with the event/guild/plugin/duration fields given through extra
+	"""
+
+	fields = ["event", "guild", "plugin", "duration"]
+
+	def format(self, record):
+		entry = {
+			"time": self.formatTime(record),
+			"level": record.levelname,
+			"logger": record.name,
+			"message": record.getMessage()
+		}
+		for f in self.fields:
+			value = getattr(record, f, None)
+			if value is not None:
+				entry[f] = value
+		if record.exc_info:
+			entry["exception"] = self.formatException(record.exc_info)
+		return json.dumps(entry, default=str)
+
+class PluginLogAdapter(logging.LoggerAdapter):
+	"""
+	Logger of a plugin: adds the plugin field to every record, merged with the extra of the call
+	"""
+
+	def process(self, msg, kwargs):
+		kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+		return msg, kwargs
+
+def setup_logging(level=logging.INFO, json_output=False, stream=None):
+	"""
+	Install a handler on the praxisbot logger. With json_output, records are emitted as JSON lines for log shipping
+	"""
+	handler = logging.StreamHandler(stream)
+	if json_output:
+		handler.setFormatter(JsonFormatter())
+	else:
+		handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+	log.addHandler(handler)
+	log.setLevel(level)
+	return handler
+
 ################################################################################
 # Decorators
 ################################################################################
 
 def command(func):
+	d = inspect.getdoc(func)
+
 	@wraps(func)
 	def wrapper(self, scope, command, options, lines, **kwargs):
-		d = inspect.getdoc(func)
-		return func(self, scope, command, options, lines, description=d, **kwargs)
+		return func(self, scope, command, options, lines, description=d, parser=self.parsers.get(command), **kwargs)
 
 	return wrapper
 
+def argument(*args, **kwargs):
+	"""
+	Declare an option of a command, with the parameters of ArgumentParser.add_argument.
+	Options sharing the same exclusive_group are mutually exclusive.
+	"""
+	def decorator(func):
+		if not hasattr(func, "arguments"):
+			func.arguments = []
+		func.arguments.insert(0, (args, kwargs))
+		return func
+
+	return decorator
+
 def permission_admin(func):
 	@wraps(func)
 	def wrapper(self, scope, command, options, lines, **kwargs):
@@ -118,46 +197,174 @@ def permission_script(func):
 		return func(self, scope, command, options, lines, **kwargs)
 	return wrapper
 
+################################################################################
+# Templates
+################################################################################
+
+class TemplateTag:
+	"""
+	A {{tag}} of a template, with its override and its kind resolved once
+	"""
+	overrides = [
+		("user", re.compile('([*@#]?user(?:_time|_avatar)?)=(.*)')),
+		("channel", re.compile('([*#]?channel)=(.*)')),
+		("role", re.compile('([*@]?role)=(.*)'))
+	]
+
+	renderers = {
+		"server": lambda scope, u, c, r: scope.guild.name if scope.guild else None,
+		"*server": lambda scope, u, c, r: scope.guild.id if scope.guild else None,
+		"n": lambda scope, u, c, r: "\n",
+		"now": lambda scope, u, c, r: datetime.datetime.now(timezone('Europe/Paris')).strftime("%Y-%m-%d %H:%M:%S"),
+		"channel": lambda scope, u, c, r: c.name if c else None,
+		"#channel": lambda scope, u, c, r: c.mention if c else None,
+		"*channel": lambda scope, u, c, r: c.id if c else None,
+		"role": lambda scope, u, c, r: r.name if r else None,
+		"@role": lambda scope, u, c, r: r.mention if r else None,
+		"*role": lambda scope, u, c, r: r.id if r else None,
+		"#user": lambda scope, u, c, r: "{}#{}".format(u.name,u.discriminator) if u else None,
+		"@user": lambda scope, u, c, r: u.mention if u else None,
+		"*user": lambda scope, u, c, r: u.id if u else None,
+		"user": lambda scope, u, c, r: u.display_name if u else None,
+		"user_time": lambda scope, u, c, r: str(u.created_at) if u else None,
+		"user_avatar": lambda scope, u, c, r: str(u.avatar_url_as(format="png")) if u else None
+	}
+
+	def __init__(self, tag):
+		self.override = None
+		self.argument = None
+		for o in self.overrides:
+			m = o[1].fullmatch(tag)
+			if m:
+				self.override = o[0]
+				self.argument = m.group(2).strip()
+				tag = m.group(1)
+				break
+
+		self.tag = tag
+		self.renderer = self.renderers.get(tag.lower())
+
+	def render(self, scope):
+		u = scope.user
+		c = scope.channel
+		r = None
+		if self.override == "user":
+			subUser = self.argument
+			if subUser in scope.vars:
+				subUser = scope.vars[subUser].strip()
+			u = scope.shell.find_member(subUser, scope.guild)
+		elif self.override == "channel":
+			subChan = self.argument
+			if subChan in scope.vars:
+				subChan = scope.vars[subChan]
+			c = scope.shell.find_channel(subChan, scope.guild)
+		elif self.override == "role":
+			subRole = self.argument
+			if subRole in scope.vars:
+				subRole = scope.vars[subRole]
+			r = scope.shell.find_role(subRole, scope.guild)
+
+		if self.renderer:
+			output = self.renderer(scope, u, c, r)
+			if output != None:
+				return output
+
+		tag = self.tag
+		if tag[0:1] == "*" and tag[1:] in scope.vars:
+			if len(scope.vars[tag[1:]].strip()) == 0:
+				return 0
+			return str(len(scope.vars[tag[1:]].split("\n")))
+		elif tag[0:1] == "," and tag[1:] in scope.vars:
+			return ", ".join(scope.vars[tag[1:]].split("\n"))
+		elif tag in scope.vars:
+			return scope.vars[tag]
+		return tag
+
+class TemplateChoice:
+	"""
+	A {{a|b|c}} tag: one of the alternatives is picked at each rendering
+	"""
+	def __init__(self, tag):
+		self.alternatives = [TemplateTag(t) for t in tag.split("|")]
+
+	def render(self, scope):
+		return random.choice(self.alternatives).render(scope)
+
+class Template:
+	"""
+	A text parsed into literal strings and tags
+	"""
+	tag_regex = re.compile("\\{\\{([^\\}]+)\\}\\}")
+
+	def __init__(self, text):
+		self.segments = []
+
+		textIter = 0
+		for m in self.tag_regex.finditer(text):
+			if m.start() > textIter:
+				self.segments.append(text[textIter:m.start()])
+			textIter = m.end()
+
+			tag = m.group(1).strip()
+			if tag.find('|') >= 0:
+				self.segments.append(TemplateChoice(tag))
+			else:
+				self.segments.append(TemplateTag(tag))
+
+		if textIter < len(text):
+			self.segments.append(text[textIter:])
+
+	def render(self, scope):
+		return "".join([s if type(s) == str else str(s.render(scope)) for s in self.segments])
+
+@lru_cache(maxsize=4096)
+def compile_template(text):
+	return Template(text)
+
 ################################################################################
 # Scope
 ################################################################################
 
 class ExecutionBlockIf:
+	keywords = ("else", "endif")
+
 	def __init__(self, e):
 		self.execute = e
 		self.terminated = False
 
-	async def execute_script(self, scope, command, commandline):
-		if command == "endif":
+	async def execute_script(self, scope, instruction):
+		if instruction.command == "endif":
 			self.terminated = True
 			return
 
-		if command == "else":
+		if instruction.command == "else":
 			self.execute = not self.execute
 			return
 
 		if self.execute:
-			await scope.shell.execute_command(scope, commandline)
+			await scope.shell.execute_instruction(scope, instruction)
 
 class ExecutionBlockFor:
+	keywords = (None, "endfor")
+
 	def __init__(self, var, list):
 		self.var = var
 		self.list = list
 		self.cmds = []
 		self.terminated = False
 
-	async def execute_script(self, scope, command, commandline):
-		if command == "endfor":
+	async def execute_script(self, scope, instruction):
+		if instruction.command == "endfor":
 			self.terminated = True
 			for i in self.list:
 				scope.vars[self.var] = i
 				for c in self.cmds:
-					await scope.shell.execute_command(scope, c)
+					await scope.shell.execute_instruction(scope, c)
 					if scope.abort:
 						return
 
 		elif len(self.list):
-			self.cmds.append(commandline)
+			self.cmds.append(instruction)
 
 class ExecutionScope:
 	def __init__(self, shell, guild, prefixes):
@@ -170,23 +377,58 @@ class ExecutionScope:
 		self.permission = UserPermission.Member
 
 		self.iter = 0
-		self.vars = {}
+		#Variables are layered: script-local, event-local, session and guild-global.
+		#Reads fall through the layers, writes only touch the top one.
 		self.session_vars = {}
+		self.vars = collections.ChainMap({}, self.session_vars)
 		self.blocks = []
 		self.abort = False
+		#Set with abort when an instruction failed, so that the script drops its writes
+		self.failed = False
 		self.deletecmd = False
 		self.verbose = 2
+		self.work = None
+
+	@property
+	def db(self):
+		"""
+		Unit of work collecting the writes of the event, or the database if there is none
+		"""
+		return self.work if self.work != None else self.shell.db
+
+	async def commit(self):
+		if self.work != None:
+			await self.work.commit()
+
+	def savepoint(self):
+		if self.work != None:
+			return self.work.savepoint()
+		return None
+
+	def rollback(self, savepoint=None):
+		"""
+		Drop the writes not committed yet, or only the ones done since savepoint
+		"""
+		if self.work != None:
+			self.work.rollback(savepoint)
+
+	def on_rollback(self, func):
+		"""
+		Call func if the writes done until now are rolled back, to restore state kept in memory
+		"""
+		if self.work != None:
+			self.work.on_rollback(func)
 
-	async def execute_script(self, command, commandline):
+	async def execute_script(self, instruction):
 		"""
 		Take care of conditions (if, for, ...). Return True if the command must not be executed
 		"""
 		if not len(self.blocks):
-			await self.shell.execute_command(self, commandline)
+			await self.shell.execute_instruction(self, instruction)
 			return
 
 		b = self.blocks[len(self.blocks)-1]
-		await b.execute_script(self, command, commandline)
+		await b.execute_script(self, instruction)
 		if b.terminated:
 			self.blocks.pop()
 
@@ -199,120 +441,1120 @@ class ExecutionScope:
 		subScope.permission = self.permission
 
 		subScope.iter = self.iter
-		subScope.vars = self.vars
+		subScope.vars = self.vars.new_child()
 		subScope.session_vars = self.session_vars
 		subScope.blocks = self.blocks
 		subScope.abort = self.abort
 		subScope.deletecmd = self.deletecmd
+		subScope.work = self.work
 
 		return subScope
 
+	def set_session_vars(self, session_vars):
+		"""
+		Replace the session layer of the variables
+		"""
+		maps = [session_vars if m is self.session_vars else m for m in self.vars.maps]
+		self.vars = collections.ChainMap(*maps)
+		self.session_vars = session_vars
+
 	def continue_from_subscope(self, subScope):
 		self.iter = subScope.iter
-		self.vars = subScope.vars
+		if len(subScope.vars.maps) > 1 and subScope.vars.maps[1] is self.vars.maps[0] and subScope.session_vars is self.session_vars:
+			self.vars.maps[0].update(subScope.vars.maps[0])
+		else:
+			self.vars = subScope.vars
 		self.session_vars = subScope.session_vars
 		self.abort = subScope.abort
+		self.failed = subScope.failed
 		self.deletecmd = subScope.deletecmd
 
 	def format_text(self, text):
 		if not text:
 			return ""
 
-		p = re.compile("\{\{([^\}]+)\}\}")
+		return compile_template(text).render(self)
 
-		formatedText = ""
-		textIter = 0
-		mi = p.finditer(text)
-		for m in mi:
-			formatedText = formatedText + text[textIter:m.start()]
-			textIter = m.end()
+################################################################################
+# Script compiler
+################################################################################
 
-			#Process tag
-			tag = m.group(1).strip()
-			tagOutput = m.group()
+class CommandOptions(str):
+	"""
+	Options of a command, split into shell tokens only once
+	"""
+	def __new__(cls, text):
+		options = super().__new__(cls, text)
+		try:
+			options.tokens = shlex.split(text)
+		except ValueError:
+			options.tokens = None
+		return options
 
-			if tag.find('|') >= 0:
-				tag = random.choice(tag.split("|"))
-				tagOutput = tag
-
-			u = self.user
-			user_chk = re.fullmatch('([*@#]?user(?:_time|_avatar)?)=(.*)', tag)
-			if user_chk:
-				subUser = user_chk.group(2).strip()
-				if subUser in self.vars:
-					subUser = self.vars[subUser].strip()
-				u = self.shell.find_member(subUser, self.guild)
-				tag = user_chk.group(1)
-
-			c = self.channel
-			channel_chk = re.fullmatch('([*#]?channel)=(.*)', tag)
-			if channel_chk:
-				subChan = channel_chk.group(2).strip()
-				if subChan in self.vars:
-					subChan = self.vars[subChan]
-				c = self.shell.find_channel(subChan, self.guild)
-				tag = channel_chk.group(1)
-
-			r = None
-			role_chk = re.fullmatch('([*@]?role)=(.*)', tag)
-			if role_chk:
-				subRole = role_chk.group(2).strip()
-				if subRole in self.vars:
-					subRole = self.vars[subRole]
-				r = self.shell.find_role(subRole, self.guild)
-				tag = role_chk.group(1)
-
-			if tag.lower() == "server" and self.guild:
-				tagOutput = self.guild.name
-			elif tag.lower() == "*server" and self.guild:
-				tagOutput = self.guild.id
-			elif tag.lower() == "n":
-				tagOutput = "\n"
-			elif tag.lower() == "now":
-				d = datetime.datetime.now(timezone('Europe/Paris'))
-				tagOutput = d.strftime("%Y-%m-%d %H:%M:%S")
-			elif tag.lower() == "channel" and c:
-				tagOutput = c.name
-			elif tag.lower() == "#channel" and c:
-				tagOutput = c.mention
-			elif tag.lower() == "*channel" and c:
-				tagOutput = c.id
-			elif tag.lower() == "role" and r:
-				tagOutput = r.name
-			elif tag.lower() == "@role" and r:
-				tagOutput = r.mention
-			elif tag.lower() == "*role" and r:
-				tagOutput = r.id
-			elif tag.lower() == "#user" and u:
-				tagOutput = "{}#{}".format(u.name,u.discriminator)
-			elif tag.lower() == "@user" and u:
-				tagOutput = u.mention
-			elif tag.lower() == "*user" and u:
-				tagOutput = u.id
-			elif tag.lower() == "user" and u:
-				tagOutput = u.display_name
-			elif tag.lower() == "user_time" and u:
-				tagOutput = str(u.created_at)
-			elif tag.lower() == "user_avatar" and u:
-				tagOutput = str(u.avatar_url_as(format="png"))
-			elif tag[0] == "*" and tag[1:] in self.vars:
-				if len(self.vars[tag[1:]].strip()) == 0:
-					tagOutput = 0
-				else:
-					s = self.vars[tag[1:]].split("\n")
-					tagOutput = str(len(s))
-			elif tag[0] == "," and tag[1:] in self.vars:
-				s = self.vars[tag[1:]].split("\n")
-				tagOutput = ", ".join(s)
-			elif tag in self.vars:
-				tagOutput = self.vars[tag]
+class ScriptInstruction:
+	"""
+	A command line parsed and bound to the plugin that handles it
+	"""
+	def __init__(self, command, options, lines, commandline, plugin):
+		self.command = command
+		self.options = CommandOptions(options)
+		self.lines = lines
+		self.commandline = commandline
+		self.plugin = plugin
+		self.block = None
+		self.block_else = None
+		self.block_end = None
+
+class CompiledScript:
+	"""
+	Intermediate form of a script: instructions and the structure of their blocks
+	"""
+	def __init__(self, source, prefixes, instructions):
+		self.source = source
+		self.prefixes = prefixes
+		self.instructions = instructions
+
+################################################################################
+# Entity index
+################################################################################
+
+class EntityMap:
+	"""
+	Discord objects of one kind, by unique keys (id, mention) and by name
+	"""
+	def __init__(self, keys, name):
+		self.keys = keys
+		self.name = name
+		self.by_key = {}
+		self.by_name = {}
+
+	def add(self, obj):
+		for k in self.keys(obj):
+			self.by_key[k] = obj
+
+		objects = self.by_name.setdefault(self.name(obj), [])
+		for o in objects:
+			if o.id == obj.id:
+				return
+		objects.append(obj)
+
+	def remove(self, obj):
+		for k in self.keys(obj):
+			if k in self.by_key and self.by_key[k].id == obj.id:
+				del self.by_key[k]
+
+		n = self.name(obj)
+		if n in self.by_name:
+			self.by_name[n] = [o for o in self.by_name[n] if o.id != obj.id]
+			if not len(self.by_name[n]):
+				del self.by_name[n]
+
+	def find(self, key):
+		obj = self.by_key.get(key)
+		if obj:
+			return obj
+
+		objects = self.by_name.get(key)
+		if objects:
+			return objects[0]
+
+		return None
+
+class EntityIndex:
+	"""
+	Members, channels, roles and emojis of a guild, indexed for find_* lookups
+	"""
+	def __init__(self, guild):
+		self.members = EntityMap(lambda m: [str(m.id), "<@{}>".format(m.id), "<@!{}>".format(m.id)], lambda m: "{}#{}".format(m.name,m.discriminator))
+		self.channels = EntityMap(lambda c: [str(c.id), "<#{}>".format(c.id), "#{}".format(c.id)], lambda c: c.name)
+		self.roles = EntityMap(lambda r: [str(r.id), "<@&{}>".format(r.id)], lambda r: r.name)
+		self.emojis = EntityMap(lambda e: [str(e.id), "<:{}:{}>".format(e.name,e.id)], lambda e: e.name)
+		#Built before all the members were received, see Shell.get_entity_index
+		self.chunked = guild.chunked
+
+		for m in guild.members:
+			self.members.add(m)
+		for c in guild.channels:
+			self.channels.add(c)
+		for r in guild.roles:
+			self.roles.add(r)
+		for e in guild.emojis:
+			self.emojis.add(e)
+
+################################################################################
+# Regular expressions
+################################################################################
+
+regex_log = logging.getLogger("praxisbot.regex")
+
+class RegexMatch:
+	"""
+	Result of a search run in a sandbox process, with the parts of re.Match used by commands
+	"""
+
+	def __init__(self, group0, groups):
+		self.group0 = group0
+		self.subgroups = groups
+
+	def group(self, index=0):
+		if index == 0:
+			return self.group0
+		return self.subgroups[index-1]
+
+	def groups(self):
+		return self.subgroups
+
+def regex_worker(conn):
+	while True:
+		try:
+			op, pattern, flags, text = conn.recv()
+		except EOFError:
+			return
+		#Replies are tagged: ("match", group0, groups), ("none",) or ("error", message)
+		try:
+			m = getattr(re.compile(pattern, flags), op)(text)
+			conn.send(("match", m.group(0), m.groups()) if m else ("none",))
+		except Exception as e:
+			conn.send(("error", str(e)))
+
+class RegexSandbox:
+	"""
+	Processes evaluating untrusted patterns. A process still busy after timeout seconds is killed and replaced
+	"""
+
+	def __init__(self, processes, timeout):
+		#Fork: spawned processes would import the main script again
+		self.context = multiprocessing.get_context("fork")
+		self.processes = processes
+		self.timeout = timeout
+		self.idle = None
+		self.workers = []
+
+	def start(self):
+		"""
+		Fork the processes. Call it before the bot starts any thread: only a worker stopped by a timeout is forked later
+		"""
+		self.idle = asyncio.Queue()
+		for i in range(self.processes):
+			self.idle.put_nowait(self.start_worker())
+
+	def start_worker(self):
+		conn, child_conn = self.context.Pipe()
+		process = self.context.Process(target=regex_worker, args=(child_conn,), daemon=True)
+		process.start()
+		child_conn.close()
+		worker = (process, conn)
+		self.workers.append(worker)
+		return worker
+
+	def stop_worker(self, worker):
+		process, conn = worker
+		process.kill()
+		process.join()
+		conn.close()
+		self.workers.remove(worker)
+
+	def call(self, worker, request):
+		process, conn = worker
+		conn.send(request)
+		if not conn.poll(self.timeout):
+			return None, True
+		return conn.recv(), False
+
+	async def run(self, op, pattern, flags, text):
+		if not self.idle:
+			self.start()
+
+		worker = await self.idle.get()
+		try:
+			result, timeout = await asyncio.get_event_loop().run_in_executor(None, self.call, worker, (op, pattern, flags, text))
+			if timeout:
+				self.stop_worker(worker)
+				worker = self.start_worker()
+				raise RegexTimeoutError(pattern)
+		finally:
+			self.idle.put_nowait(worker)
+
+		if result[0] == "error":
+			raise re.error(result[1])
+		if result[0] == "match":
+			return RegexMatch(result[1], result[2])
+		return None
+
+	def close(self):
+		for worker in list(self.workers):
+			self.stop_worker(worker)
+		self.idle = None
+
+def safe_pattern(pattern):
+	"""
+	Whether pattern is proven to run in linear time: literals, character sets and alternatives, without any quantified atom or backreference
+	"""
+	try:
+		parsed = sre_parse.parse(pattern)
+	except:
+		return False
+
+	leaves = (sre_parse.LITERAL, sre_parse.NOT_LITERAL, sre_parse.IN, sre_parse.ANY, sre_parse.AT)
+	def walk(items):
+		for op, av in items:
+			if op in leaves:
+				continue
+			if op == sre_parse.SUBPATTERN:
+				if not walk(av[3]):
+					return False
+			elif op == sre_parse.BRANCH:
+				if not all(walk(b) for b in av[1]):
+					return False
+			elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+				if not walk(av[1]):
+					return False
+			elif op == getattr(sre_parse, "ATOMIC_GROUP", None):
+				if not walk(av):
+					return False
+			else:
+				#Repeats, backreferences and anything unknown
+				return False
+		return True
+
+	return walk(parsed)
+
+class RegexEntry:
+	def __init__(self, pattern, flags, compiled):
+		self.pattern = pattern
+		self.flags = flags
+		self.compiled = compiled
+		#Evaluated in the bot process even if there is a sandbox
+		self.inline = safe_pattern(pattern)
+		self.hits = 0
+		self.runs = 0
+		self.matches = 0
+		self.total_time = 0.0
+		self.max_time = 0.0
+		self.timeouts = 0
+
+class RegexCache:
+	"""
+	Process-wide bounded LRU of compiled user patterns, with the use and evaluation time of each pattern.
+	With a sandbox, every pattern not proven safe is evaluated in other processes and stopped after timeout seconds
+	"""
+
+	def __init__(self, size=1024, slow_threshold=0.05):
+		self.size = size
+		self.slow_threshold = slow_threshold
+		self.patterns = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.sandbox = None
+
+	def enable_sandbox(self, timeout, processes=2):
+		"""
+		Start the sandbox processes. Call it before the bot starts any thread
+		"""
+		self.close()
+		self.sandbox = RegexSandbox(processes, timeout)
+		self.sandbox.start()
+
+	def entry(self, pattern, flags=0):
+		key = (pattern, flags)
+		entry = self.patterns.get(key)
+		if entry:
+			self.patterns.move_to_end(key)
+			self.hits = self.hits+1
+			entry.hits = entry.hits+1
+			return entry
+
+		self.misses = self.misses+1
+		entry = RegexEntry(pattern, flags, re.compile(pattern, flags))
+		self.patterns[key] = entry
+		if len(self.patterns) > self.size:
+			self.patterns.popitem(last=False)
+		return entry
+
+	def compile(self, pattern, flags=0):
+		"""
+		Compiled pattern, raising re.error if it is invalid
+		"""
+		return self.entry(pattern, flags).compiled
+
+	async def evaluate(self, op, pattern, text, flags):
+		entry = self.entry(pattern, flags)
+		start = time.perf_counter()
+		try:
+			if self.sandbox and not entry.inline:
+				result = await self.sandbox.run(op, pattern, flags, text)
+			else:
+				result = getattr(entry.compiled, op)(text)
+			if result:
+				entry.matches = entry.matches+1
+			return result
+		except RegexTimeoutError:
+			entry.timeouts = entry.timeouts+1
+			regex_log.warning("Pattern stopped after %.1fs: %.100r", self.sandbox.timeout, pattern)
+			raise
+		finally:
+			duration = time.perf_counter()-start
+			entry.runs = entry.runs+1
+			entry.total_time = entry.total_time+duration
+			entry.max_time = max(entry.max_time, duration)
+			if duration > self.slow_threshold:
+				regex_log.info("Slow pattern (%.3fs on %d characters): %.100r", duration, len(text), pattern)
+
+	async def search(self, pattern, text, flags=0):
+		return await self.evaluate("search", pattern, text, flags)
+
+	async def fullmatch(self, pattern, text, flags=0):
+		return await self.evaluate("fullmatch", pattern, text, flags)
+
+	def stats(self):
+		return {
+			"patterns": len(self.patterns),
+			"size": self.size,
+			"hits": self.hits,
+			"misses": self.misses,
+			"hit_rate": self.hits/(self.hits+self.misses) if self.hits+self.misses else 0.0,
+			"sandbox": self.sandbox != None,
+			"sandboxed": sum(1 for e in self.patterns.values() if not e.inline),
+			"timeout": self.sandbox.timeout if self.sandbox else None
+		}
+
+	def slow_patterns(self, count=10):
+		"""
+		Patterns with the slowest evaluation above the slow threshold, slowest first
+		"""
+		entries = [e for e in self.patterns.values() if e.max_time > self.slow_threshold or e.timeouts]
+		return sorted(entries, key=lambda e: (e.timeouts, e.max_time), reverse=True)[:count]
+
+	def most_used(self, count=10):
+		return sorted(self.patterns.values(), key=lambda e: e.hits, reverse=True)[:count]
+
+	def close(self):
+		if self.sandbox:
+			self.sandbox.close()
+
+regex_cache = RegexCache()
+
+def required_literal(pattern):
+	"""
+	Longest literal string that every match of pattern contains, or None if there is none that can be used as a prefilter
+	"""
+	try:
+		parsed = sre_parse.parse(pattern)
+	except:
+		return None
+	if parsed.state.flags & re.IGNORECASE:
+		return None
+
+	def walk(items):
+		best = ""
+		run = ""
+		for op, av in items:
+			if op == sre_parse.LITERAL:
+				run = run+chr(av)
+				continue
+
+			best = max(best, run, key=len)
+			run = ""
+			if op == sre_parse.SUBPATTERN and not (av[1] & re.IGNORECASE):
+				best = max(best, walk(av[3]), key=len)
+			elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+				best = max(best, walk(av[2]), key=len)
+		return max(best, run, key=len)
+
+	return walk(parsed) or None
+
+class LiteralMatcher:
+	"""
+	Aho–Corasick automaton finding in one pass which of many literal strings occur in a text
+	"""
+
+	def __init__(self):
+		self.goto = [{}]
+		self.fail = [0]
+		self.output = [[]]
+
+	def add(self, literal, value):
+		node = 0
+		for c in literal:
+			nxt = self.goto[node].get(c)
+			if nxt == None:
+				nxt = len(self.goto)
+				self.goto[node][c] = nxt
+				self.goto.append({})
+				self.fail.append(0)
+				self.output.append([])
+			node = nxt
+		self.output[node].append(value)
+
+	def build(self):
+		"""
+		Compute the failure links, breadth first. Must be called after the last add
+		"""
+		queue = collections.deque(self.goto[0].values())
+		while queue:
+			node = queue.popleft()
+			for c, nxt in self.goto[node].items():
+				queue.append(nxt)
+				f = self.fail[node]
+				while f and c not in self.goto[f]:
+					f = self.fail[f]
+				self.fail[nxt] = self.goto[f].get(c, 0)
+				self.output[nxt] = self.output[nxt]+self.output[self.fail[nxt]]
+
+	def find(self, text):
+		"""
+		Values of all literals found in text
+		"""
+		found = []
+		goto = self.goto
+		fail = self.fail
+		output = self.output
+		node = 0
+		for c in text:
+			while node and c not in goto[node]:
+				node = fail[node]
+			node = goto[node].get(c, 0)
+			if output[node]:
+				found.extend(output[node])
+		return found
+
+class RegexMatcher:
+	"""
+	Set of regular expressions searched together. Patterns whose required literal is absent from the text are skipped without running them
+	"""
+
+	def __init__(self, patterns):
+		self.literals = LiteralMatcher()
+		self.always = []
+		self.size = 0
+		for order, (pattern, value) in enumerate(patterns):
+			try:
+				regex_cache.compile(pattern)
+			except re.error:
+				continue
+			self.size = self.size+1
+			entry = (order, pattern, value)
+			literal = required_literal(pattern)
+			if literal:
+				self.literals.add(literal, entry)
+			else:
+				self.always.append(entry)
+		self.literals.build()
+
+	async def search(self, text):
+		"""
+		Values of the patterns found in text, in the order the patterns were given. Patterns stopped by the sandbox do not match
+		"""
+		candidates = set(self.literals.find(text))
+		candidates.update(self.always)
+		found = []
+		for order, pattern, value in sorted(candidates, key=lambda e: e[0]):
+			try:
+				if await regex_cache.search(pattern, text):
+					found.append(value)
+			except RegexTimeoutError:
+				pass
+		return found
+
+################################################################################
+# Database
+################################################################################
+
+class Database:
+	"""
+	SQLite connection owned by a dedicated thread, so that queries never block the event loop
+	"""
+
+	def __init__(self, dbcon):
+		self.dbcon = dbcon
+		self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="praxisbot-db")
+		self.lock = threading.Lock()
+		self.queue_depth = 0
+		self.max_queue_depth = 0
+		self.executed = 0
+		self.total_latency = 0.0
+		self.max_latency = 0.0
+
+		#Write-behind mode: writes wait in pending and are committed together
+		self.write_behind = False
+		self.write_behind_interval = 1.0
+		self.write_behind_max_rows = 256
+		self.pending = []
+		self.pending_flush = None
+		#Next id reserved for each table, see reserve_id
+		self.next_ids = {}
+		self.flushes = 0
+		self.flushed_rows = 0
+		self.total_flush_latency = 0.0
+		self.max_flush_latency = 0.0
+
+	def enable_write_behind(self, interval, max_rows):
+		"""
+		Switch to WAL and commit writes in groups, every interval seconds or once max_rows are queued
+		"""
+		self.run_sync(lambda dbcon: dbcon.execute("PRAGMA journal_mode=WAL"))
+		self.run_sync(lambda dbcon: dbcon.execute("PRAGMA synchronous=NORMAL"))
+		self.write_behind = True
+		self.write_behind_interval = interval
+		self.write_behind_max_rows = max_rows
+
+	def submit(self, func, *args):
+		"""
+		Schedule func(dbcon, *args) in a transaction on the database thread
+		"""
+		with self.lock:
+			self.queue_depth = self.queue_depth+1
+			self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+		return self.executor.submit(self.process, time.perf_counter(), func, args)
+
+	def process(self, submit_time, func, args):
+		try:
+			with self.dbcon:
+				return func(self.dbcon, *args)
+		finally:
+			latency = time.perf_counter()-submit_time
+			with self.lock:
+				self.queue_depth = self.queue_depth-1
+				self.executed = self.executed+1
+				self.total_latency = self.total_latency+latency
+				self.max_latency = max(self.max_latency, latency)
+
+	def take_pending(self):
+		"""
+		Remove the queued writes from the queue and return them
+		"""
+		if self.pending_flush:
+			self.pending_flush.cancel()
+			self.pending_flush = None
+
+		statements = self.pending
+		self.pending = []
+		return statements
+
+	async def run(self, func, *args):
+		#Queued writes are committed first, in their own transaction, so that func cannot roll them back
+		if self.pending:
+			await self.flush()
+		return await asyncio.wrap_future(self.submit(func, *args))
+
+	def run_sync(self, func, *args):
+		"""
+		Block until func has been run. Only meant for startup, when no event is handled yet
+		"""
+		statements = self.take_pending()
+		if statements:
+			self.report_failed(self.submit(execute_queued, statements).result())
+		return self.submit(func, *args).result()
+
+	async def read(self, func, statements=()):
+		"""
+		Run func(dbcon) after applying the queued writes and statements, which are rolled back afterwards, so that reads see them without committing them.
+		Once write_behind_max_rows writes are queued, they are committed first instead of being applied again
+		"""
+		if len(self.pending) >= self.write_behind_max_rows:
+			await self.flush()
+
+		statements = self.pending+list(statements)
+		if not statements:
+			return await asyncio.wrap_future(self.submit(func))
+
+		def apply(dbcon):
+			try:
+				execute_queued(dbcon, statements)
+				return func(dbcon)
+			finally:
+				dbcon.rollback()
+		return await asyncio.wrap_future(self.submit(apply))
+
+	async def execute(self, query, params=()):
+		return await self.run(lambda dbcon: dbcon.execute(query, params).lastrowid)
+
+	async def executemany(self, query, params):
+		params = list(params)
+		return await self.run(lambda dbcon: dbcon.executemany(query, params).rowcount)
+
+	async def write(self, query, params=()):
+		"""
+		Execute a query whose result is not needed. In write-behind mode, it is queued
+		"""
+		if self.write_behind:
+			self.queue_writes([(query, params)])
+		else:
+			await self.execute(query, params)
+
+	async def execute_batch(self, statements):
+		"""
+		Execute a list of (query, params) in one transaction. In write-behind mode, they are queued
+		"""
+		statements = list(statements)
+		if self.write_behind:
+			self.queue_writes(statements)
+		else:
+			await self.run(execute_statements, statements)
+
+	def queue_writes(self, statements):
+		self.pending.extend(statements)
+		if len(self.pending) >= self.write_behind_max_rows:
+			asyncio.ensure_future(self.flush())
+		else:
+			self.schedule_flush()
+
+	def schedule_flush(self):
+		if not self.pending_flush:
+			self.pending_flush = asyncio.get_event_loop().call_later(self.write_behind_interval, lambda: asyncio.ensure_future(self.flush()))
+
+	async def flush(self):
+		"""
+		Commit all queued writes in one transaction. If it fails, they are queued again for the next flush
+		"""
+		statements = self.take_pending()
+		if not statements:
+			return
+
+		start = time.perf_counter()
+		try:
+			failed = await asyncio.wrap_future(self.submit(execute_queued, statements))
+		except Exception:
+			sql_log.exception("Could not commit %d queued writes, retrying in %.1fs", len(statements), self.write_behind_interval)
+			self.pending[0:0] = statements
+			self.schedule_flush()
+			return
+		self.report_failed(failed)
+
+		latency = time.perf_counter()-start
+		self.flushes = self.flushes+1
+		self.flushed_rows = self.flushed_rows+len(statements)
+		self.total_flush_latency = self.total_flush_latency+latency
+		self.max_flush_latency = max(self.max_flush_latency, latency)
+
+	async def reserve_id(self, table, statements=()):
+		"""
+		Return an id for a row of table that is not inserted yet, so that the insert can be queued. An id is never given twice.
+		The rows inserted by statements and by the queued writes are taken into account
+		"""
+		last = await self.read(lambda dbcon: dbcon.execute("SELECT MAX(id) FROM {}".format(table)).fetchone()[0], statements)
+		rowid = max(self.next_ids.get(table, 1), (last or 0)+1)
+		self.next_ids[table] = rowid+1
+		return rowid
+
+	def report_failed(self, failed):
+		for query, params, e in failed:
+			sql_log.error("Queued write dropped (%s): %s; with %s", e, query, params)
+
+	async def fetchone(self, query, params=()):
+		return await self.read(lambda dbcon: dbcon.execute(query, params).fetchone())
+
+	async def fetchall(self, query, params=()):
+		return await self.read(lambda dbcon: dbcon.execute(query, params).fetchall())
+
+	def stats(self):
+		with self.lock:
+			return {
+				"queue_depth": self.queue_depth,
+				"max_queue_depth": self.max_queue_depth,
+				"executed": self.executed,
+				"average_latency": self.total_latency/self.executed if self.executed else 0.0,
+				"max_latency": self.max_latency,
+				"write_behind": self.write_behind,
+				"pending_writes": len(self.pending),
+				"flushes": self.flushes,
+				"rows_per_flush": self.flushed_rows/self.flushes if self.flushes else 0.0,
+				"average_flush_latency": self.total_flush_latency/self.flushes if self.flushes else 0.0,
+				"max_flush_latency": self.max_flush_latency
+			}
+
+	async def close(self):
+		"""
+		Commit queued writes and stop the database thread
+		"""
+		await self.flush()
+		if self.pending:
+			sql_log.error("%d queued writes could not be committed before closing", len(self.pending))
+		self.executor.shutdown(wait=True)
+
+def execute_statements(dbcon, statements):
+	"""
+	Execute a list of (query, params), with one executemany for each run of the same query
+	"""
+	for query, group in itertools.groupby(statements, key=lambda s: s[0]):
+		dbcon.executemany(query, [params for q, params in group])
+
+def execute_queued(dbcon, statements):
+	"""
+	Execute queued writes of several events. If one of them breaks a constraint, they are executed again one by one,
+	so that it does not roll back the others. Return the (query, params, error) of the writes that failed
+	"""
+	try:
+		execute_statements(dbcon, statements)
+		return []
+	except sqlite3.IntegrityError:
+		dbcon.rollback()
+
+	failed = []
+	for query, params in statements:
+		try:
+			dbcon.execute(query, params)
+		except sqlite3.IntegrityError as e:
+			failed.append((query, params, e))
+	return failed
+
+class UnitOfWork:
+	"""
+	Writes of one event, applied in a single transaction on commit. Reads see the
+	pending writes without committing them
+	"""
+
+	def __init__(self, db):
+		self.db = db
+		self.statements = []
+		#Callbacks undoing changes made in memory, see rollback
+		self.undo = []
+		self.closed = False
+
+	def take(self):
+		statements = self.statements
+		self.statements = []
+		self.undo = []
+		return statements
+
+	def savepoint(self):
+		return (len(self.statements), len(self.undo))
+
+	async def write(self, query, params=()):
+		"""
+		Queue a write. Once the unit of work is committed, writes go directly to the database
+		"""
+		if self.closed:
+			await self.db.write(query, params)
+		else:
+			self.statements.append((query, params))
+
+	async def reserve_id(self, table):
+		return await self.db.reserve_id(table, self.statements)
+
+	async def fetchone(self, query, params=()):
+		return await self.db.read(lambda dbcon: dbcon.execute(query, params).fetchone(), self.statements)
+
+	async def fetchall(self, query, params=()):
+		return await self.db.read(lambda dbcon: dbcon.execute(query, params).fetchall(), self.statements)
+
+	async def commit(self):
+		self.closed = True
+		statements = self.take()
+		if statements:
+			await self.db.execute_batch(statements)
+
+	def on_rollback(self, func):
+		if not self.closed:
+			self.undo.append(func)
+
+	def rollback(self, savepoint=None):
+		"""
+		Drop the writes queued since savepoint (since the start by default) and call their undo callbacks, last first
+		"""
+		statements, undo = savepoint or (0, 0)
+		del self.statements[statements:]
+		while len(self.undo) > undo:
+			self.undo.pop()()
+
+################################################################################
+# Schema
+################################################################################
+
+class SQLTable:
+	"""
+	Migration step creating a table, or adding the columns missing in an existing one
+	"""
+
+	def __init__(self, tablename, fields):
+		self.tablename = tablename
+		self.fields = fields
+
+	def apply(self, shell, dbcon):
+		table = shell.dbtable(self.tablename)
+		dbcon.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(table, ", ".join(self.fields)))
+		columns = set(row[1] for row in dbcon.execute("PRAGMA table_info({})".format(table)))
+		for f in self.fields:
+			if f.split()[0] not in columns:
+				dbcon.execute("ALTER TABLE {} ADD {}".format(table, f))
+
+class SQLIndex:
+	"""
+	Migration step creating an index. Before creating a unique index, duplicated rows are removed (the oldest one is kept)
+	"""
+
+	def __init__(self, tablename, columns, unique=False):
+		self.tablename = tablename
+		self.columns = columns
+		self.unique = unique
+
+	def apply(self, shell, dbcon):
+		table = shell.dbtable(self.tablename)
+		indexname = "{}_{}".format(table, "_".join(self.columns))
+		if dbcon.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", [indexname]).fetchone():
+			return
+		if self.unique:
+			dbcon.execute("DELETE FROM {0} WHERE rowid NOT IN (SELECT MIN(rowid) FROM {0} GROUP BY {1})".format(table, ", ".join(self.columns)))
+		dbcon.execute("CREATE {}INDEX {} ON {} ({})".format("UNIQUE " if self.unique else "", indexname, table, ", ".join(self.columns)))
+
+class SQLStatement:
+	"""
+	Migration step executing a query, where {prefix} is replaced by the prefix of tables
+	"""
+
+	def __init__(self, query):
+		self.query = query
+
+	def apply(self, shell, dbcon):
+		dbcon.execute(self.query.format(prefix=shell.dbprefix))
+
+################################################################################
+# Event scheduler
+################################################################################
+
+events_log = logging.getLogger("praxisbot.events")
+
+class EventScheduler:
+	"""
+	Per-guild FIFO queues of events, drained by a bounded pool of workers so that a busy guild does not delay the others
+	"""
+
+	def __init__(self, workers=8, guild_concurrency=1):
+		self.workers = workers
+		#Events of a guild handled at the same time. With 1, events of a guild are handled in order, one after the other
+		self.guild_concurrency = guild_concurrency
+		self.queues = {}
+		self.active = {}
+		self.ready = None
+		self.tasks = []
+		self.idle = None
+		self.closing = False
+		#Seconds close() waits for queued and running events before cancelling them
+		self.drain_timeout = 30.0
+		self.max_queue_depth = {}
+		self.handled = 0
+		self.failed = 0
+		self.total_wait = 0.0
+		self.max_wait = 0.0
+
+	def start(self):
+		self.ready = asyncio.Queue()
+		self.idle = asyncio.Event()
+		self.tasks = [asyncio.ensure_future(self.work()) for i in range(self.workers)]
+
+	def submit(self, guild, func, *args):
+		"""
+		Queue func(*args) behind the other events of guild. Events submitted while closing are dropped
+		"""
+		if self.closing:
+			events_log.debug("Event %s dropped while closing", getattr(func, "__name__", func), extra={"guild": guild.id})
+			return
+		if not self.tasks:
+			self.start()
+
+		queue = self.queues.setdefault(guild.id, collections.deque())
+		queue.append((time.perf_counter(), func, args))
+		self.max_queue_depth[guild.id] = max(self.max_queue_depth.get(guild.id, 0), len(queue))
+
+		#Each token in ready lets one worker take the next event of the guild
+		active = self.active.get(guild.id, 0)
+		if active < self.guild_concurrency:
+			self.active[guild.id] = active+1
+			self.ready.put_nowait(guild.id)
+
+	async def work(self):
+		while True:
+			gid = await self.ready.get()
+			queue = self.queues.get(gid)
+			if not queue:
+				self.release(gid)
+				continue
+
+			submit_time, func, args = queue.popleft()
+			wait = time.perf_counter()-submit_time
+			self.total_wait = self.total_wait+wait
+			self.max_wait = max(self.max_wait, wait)
+			try:
+				await func(*args)
+			except asyncio.CancelledError:
+				raise
+			except:
+				self.failed = self.failed+1
+				events_log.exception("Event %s failed", getattr(func, "__name__", func), extra={"guild": gid})
+			self.handled = self.handled+1
+
+			#Go back at the end of the ready queue, so that other guilds get their turn
+			if queue:
+				self.ready.put_nowait(gid)
 			else:
-				tagOutput = tag
-			formatedText = formatedText + str(tagOutput)
+				self.release(gid)
+
+	def release(self, gid):
+		active = self.active.get(gid, 0)-1
+		if active > 0:
+			self.active[gid] = active
+		else:
+			self.active.pop(gid, None)
+			if not self.queues.get(gid):
+				self.queues.pop(gid, None)
+			if not self.active:
+				self.idle.set()
+
+	def queue_depth(self, guild=None):
+		if guild:
+			return len(self.queues.get(guild.id, ()))
+		return sum(len(q) for q in self.queues.values())
+
+	def stats(self):
+		depths = {gid: len(q) for gid, q in self.queues.items() if q}
+		return {
+			"workers": self.workers,
+			"guild_concurrency": self.guild_concurrency,
+			"queue_depth": sum(depths.values()),
+			"busy_guilds": len(self.active),
+			"deepest_queues": sorted(depths.items(), key=lambda d: d[1], reverse=True)[:5],
+			"max_queue_depth": max(self.max_queue_depth.values(), default=0),
+			"handled": self.handled,
+			"failed": self.failed,
+			"average_wait": self.total_wait/self.handled if self.handled else 0.0,
+			"max_wait": self.max_wait
+		}
+
+	async def close(self):
+		"""
+		Stop accepting events, wait for the queued and running ones to be handled, then stop the workers.
+		Events still there after drain_timeout seconds are cancelled
+		"""
+		self.closing = True
+		if self.active:
+			self.idle.clear()
+			try:
+				await asyncio.wait_for(self.idle.wait(), self.drain_timeout)
+			except asyncio.TimeoutError:
+				events_log.warning("Running events cancelled and %d queued events dropped after waiting %.0fs", self.queue_depth(), self.drain_timeout)
+
+		for t in self.tasks:
+			t.cancel()
+		await asyncio.gather(*self.tasks, return_exceptions=True)
+		self.tasks = []
+
+class Job:
+	def __init__(self, key, guild, func, due, interval):
+		self.key = key
+		self.guild = guild
+		self.func = func
+		self.due = due
+		self.interval = interval
+		self.pending = False
+
+class JobScheduler:
+	"""
+	Timed jobs of plugins, each one for a single guild. The scheduler sleeps until the next job is due
+	"""
+
+	def __init__(self, run_job):
+		self.run_job = run_job
+		self.jobs = {}
+		self.heap = []
+		self.counter = itertools.count()
+		self.wakeup = None
+		self.task = None
+		self.runs = 0
+		self.skipped = 0
+
+	def start(self):
+		self.wakeup = asyncio.Event()
+		self.task = asyncio.ensure_future(self.run())
+
+	def schedule(self, key, guild, func, due=None, interval=None):
+		"""
+		Run func at due (a timestamp, now by default), then every interval seconds if interval is given. Replaces the job with the same key
+		"""
+		if not self.task:
+			self.start()
+
+		if due == None:
+			due = time.time()+(interval or 0)
+		job = Job(key, guild, func, due, interval)
+		self.jobs[key] = job
+		self.push(job)
+
+	def push(self, job):
+		#Entries of cancelled or rescheduled jobs stay in the heap and are skipped when popped
+		heapq.heappush(self.heap, (job.due, next(self.counter), job))
+		if self.heap[0][2] is job:
+			self.wakeup.set()
+
+	def cancel(self, key):
+		self.jobs.pop(key, None)
 
-		formatedText = formatedText + text[textIter:]
+	def restore(self, key, job):
+		"""
+		Put back job, as returned by get, for key. None cancels the job of key
+		"""
+		if not job:
+			self.cancel(key)
+			return
+		self.jobs[key] = job
+		self.push(job)
+
+	def get(self, key):
+		return self.jobs.get(key)
+
+	def cancel_guild(self, guild):
+		for key in [k for k, j in self.jobs.items() if j.guild.id == guild.id]:
+			del self.jobs[key]
+
+	def due(self, key):
+		job = self.jobs.get(key)
+		if job:
+			return job.due
+		return None
+
+	async def run(self):
+		while True:
+			now = time.time()
+			while self.heap and self.heap[0][0] <= now:
+				due, n, job = heapq.heappop(self.heap)
+				if self.jobs.get(job.key) is not job or job.due != due:
+					continue
+
+				if job.interval:
+					job.due = due+job.interval
+					if job.due <= now:
+						job.due = now+job.interval
+					self.push(job)
+				else:
+					del self.jobs[job.key]
+
+				#A job still waiting in the queue of its guild is not queued twice
+				if job.pending:
+					self.skipped = self.skipped+1
+					continue
+				job.pending = True
+				self.runs = self.runs+1
+				self.run_job(job)
+
+			self.wakeup.clear()
+			timeout = self.heap[0][0]-now if self.heap else None
+			try:
+				await asyncio.wait_for(self.wakeup.wait(), timeout)
+			except asyncio.TimeoutError:
+				pass
+
+	def stats(self):
+		return {
+			"jobs": len(self.jobs),
+			"next_due": min((j.due for j in self.jobs.values()), default=None),
+			"runs": self.runs,
+			"skipped": self.skipped
+		}
 
-		return formatedText
+	async def close(self):
+		if self.task:
+			self.task.cancel()
+			await asyncio.gather(self.task, return_exceptions=True)
+			self.task = None
 
 ################################################################################
 # Shell
@@ -325,12 +1567,37 @@ class UserPermission:
 	Owner=3
 
 class Shell:
+	#Schema of the tables used by the shell itself, see Plugin.migrations
+	migrations = [
+		[
+			SQLTable("servers", ["discord_sid INTEGER PRIMARY KEY", "command_prefix TEXT"])
+		]
+	]
+
 	def __init__(self, client, dbprefix, dbcon, dbfile):
 		self.plugins = []
+		self.commands = {}
+		self.custom_commands = {}
+		self.reaction_listeners = {}
 		self.client = client
 		self.dbprefix = dbprefix
 		self.dbcon = dbcon
 		self.dbfile = dbfile
+		self.db = Database(dbcon)
+		self.events = EventScheduler()
+		self.jobs = JobScheduler(self.run_job)
+		self.compiled_scripts = collections.OrderedDict()
+		self.compiled_scripts_max = 4096
+		self.global_vars = {}
+		self.global_vars_writes = {}
+		self.global_vars_flush = None
+		self.global_vars_flush_delay = 1.0
+		self.default_command_prefix = "-"
+		self.command_prefixes = {}
+		self.entity_indexes = {}
+
+		self.schema_versions = self.load_schema_versions()
+		self.migrate("Shell", self.migrations)
 
 	async def print_info(self, scope, msg):
 		if scope.verbose >= 2:
@@ -373,15 +1640,17 @@ class Shell:
 		Create an instance of a plugin and register it
 		"""
 		if self.is_plugin_loaded(plugin):
-			print("Plugin {} already loaded".format(plugin.name))
+			shell_log.warning("Plugin %s already loaded", plugin.name)
 			return
 		try:
+			self.migrate(plugin.name, plugin.migrations)
 			instance = plugin(self)
 			self.plugins.append(instance)
-			print("Plugin {0} loaded".format(plugin.name))
+			for name in instance.cmds:
+				self.commands.setdefault(name, instance)
+			shell_log.info("Plugin %s loaded", plugin.name)
 		except:
-			print(traceback.format_exc())
-			print("Plugin {0} can't be loaded".format(plugin.name))
+			shell_log.exception("Plugin %s can't be loaded", plugin.name, extra={"plugin": plugin.name})
 
 	def find_command_and_options(self, commandline, prefixes):
 		for prefix in prefixes:
@@ -397,29 +1666,262 @@ class Shell:
 
 	def create_scope(self, server, prefixes):
 		scope = ExecutionScope(self, server, prefixes)
-
-		with self.dbcon:
-			c = self.dbcon.cursor()
-			for row in c.execute("SELECT name, value FROM {} WHERE discord_sid = {}".format(self.dbtable("variables"),scope.guild.id)):
-				scope.vars[row[0]] = row[1]
+		scope.vars.maps.append(self.get_global_variables(server))
+		scope.work = UnitOfWork(self.db)
 
 		return scope
 
+	def run_job(self, job):
+		self.events.submit(job.guild, self.execute_job, job)
+
+	async def execute_job(self, job):
+		"""
+		Run a timed job of a plugin in a script scope of its guild
+		"""
+		try:
+			scope = self.create_scope(job.guild, [""])
+			scope.channel = self.get_default_channel(job.guild)
+			scope.user = job.guild.me
+			scope.permission = UserPermission.Script
+
+			try:
+				await job.func(scope)
+			except:
+				scope.rollback()
+				raise
+			await scope.commit()
+		finally:
+			job.pending = False
+
+	def load_command_prefixes(self):
+		"""
+		Load the custom command prefix of all guilds in memory
+		"""
+		self.command_prefixes = {}
+		rows = self.db.run_sync(lambda dbcon: dbcon.execute("SELECT discord_sid, command_prefix FROM {}".format(self.dbtable("servers"))).fetchall())
+		for row in rows:
+			if row[1]:
+				self.command_prefixes[row[0]] = [self.default_command_prefix, row[1]]
+
+	def get_command_prefixes(self, guild):
+		return self.command_prefixes.get(guild.id) or [self.default_command_prefix]
+
+	async def set_command_prefix(self, guild, prefix):
+		await self.set_sql_data("servers", {"command_prefix": str(prefix)}, {"discord_sid": int(guild.id)})
+		self.command_prefixes[guild.id] = [self.default_command_prefix, str(prefix)]
+
+	def load_global_variables(self):
+		"""
+		Load global variables of all guilds in memory. Must be called once the table exists
+		"""
+		self.global_vars = {}
+		rows = self.db.run_sync(lambda dbcon: dbcon.execute("SELECT discord_sid, name, value FROM {}".format(self.dbtable("variables"))).fetchall())
+		for row in rows:
+			self.global_vars.setdefault(row[0], {})[row[1]] = row[2]
+
+	def get_global_variables(self, guild):
+		return self.global_vars.setdefault(guild.id, {})
+
+	def set_global_variable(self, guild, name, value, scope=None):
+		"""
+		With a scope, the previous value is restored if the writes of the scope are rolled back
+		"""
+		if scope:
+			self.keep_global_variable(guild, name, scope)
+		self.get_global_variables(guild)[name] = value
+		self.queue_global_variable_write(guild.id, name, value)
+
+	def delete_global_variable(self, guild, name, scope=None):
+		if scope:
+			self.keep_global_variable(guild, name, scope)
+		self.get_global_variables(guild).pop(name, None)
+		self.queue_global_variable_write(guild.id, name, None)
+
+	def keep_global_variable(self, guild, name, scope):
+		previous = self.get_global_variables(guild).get(name)
+		if previous == None:
+			scope.on_rollback(lambda: self.delete_global_variable(guild, name))
+		else:
+			scope.on_rollback(lambda: self.set_global_variable(guild, name, previous))
+
+	def queue_global_variable_write(self, sid, name, value):
+		self.global_vars_writes[(sid, name)] = value
+		if not self.global_vars_flush:
+			self.global_vars_flush = asyncio.get_event_loop().call_later(self.global_vars_flush_delay, lambda: asyncio.ensure_future(self.flush_global_variables()))
+
+	async def flush_global_variables(self):
+		"""
+		Persist pending changes of global variables in one transaction
+		"""
+		if self.global_vars_flush:
+			self.global_vars_flush.cancel()
+			self.global_vars_flush = None
+
+		writes = self.global_vars_writes
+		self.global_vars_writes = {}
+		if not writes:
+			return
+
+		statements = []
+		for key, value in writes.items():
+			if value == None:
+				statements.append(self.sql_delete("variables", {"discord_sid": key[0], "name": key[1]}))
+			else:
+				statements.append(self.sql_upsert("variables", {"value": value}, {"discord_sid": key[0], "name": key[1]}))
+		await self.db.execute_batch(statements)
+
+	async def close(self):
+		"""
+		Stop handling events, persist pending writes and stop the database thread
+		"""
+		await self.jobs.close()
+		await self.events.close()
+		regex_cache.close()
+		for p in self.plugins:
+			await p.on_close()
+		await self.flush_global_variables()
+		await self.db.close()
+
+	def find_command_plugin(self, command):
+		return self.commands.get(command)
+
+	def register_custom_command(self, guild_id, name, plugin, scope=None):
+		"""
+		Declare a command of a guild that is not built-in, like a trigger, and the plugin executing it.
+		With a scope, the change is undone if the writes of the scope are rolled back
+		"""
+		commands = self.custom_commands.setdefault(guild_id, {})
+		if scope:
+			previous = commands.get(name)
+			scope.on_rollback(lambda: self.restore_custom_command(guild_id, name, previous))
+		commands[name] = plugin
+
+	def unregister_custom_command(self, guild_id, name, scope=None):
+		commands = self.custom_commands.get(guild_id, {})
+		if scope:
+			previous = commands.get(name)
+			scope.on_rollback(lambda: self.restore_custom_command(guild_id, name, previous))
+		commands.pop(name, None)
+
+	def restore_custom_command(self, guild_id, name, plugin):
+		if plugin:
+			self.register_custom_command(guild_id, name, plugin)
+		else:
+			self.unregister_custom_command(guild_id, name)
+
+	def add_reaction_listener(self, key, plugin):
+		"""
+		Send to plugin the reactions added on a message id, or by a user in a channel if key is (channel id, user id)
+		"""
+		listeners = self.reaction_listeners.setdefault(key, [])
+		if plugin not in listeners:
+			listeners.append(plugin)
+
+	def remove_reaction_listener(self, key, plugin):
+		listeners = self.reaction_listeners.get(key)
+		if listeners and plugin in listeners:
+			listeners.remove(plugin)
+			if not listeners:
+				del self.reaction_listeners[key]
+
+	def find_reaction_listeners(self, message_id, channel_id, user_id):
+		"""
+		Plugins interested in a reaction, in loading order
+		"""
+		listeners = self.reaction_listeners.get(message_id, []) + self.reaction_listeners.get((channel_id, user_id), [])
+		if len(listeners) < 2:
+			return listeners
+		return [p for p in self.plugins if p in listeners]
+
+	def find_custom_command_plugin(self, guild, command):
+		commands = self.custom_commands.get(guild.id)
+		if not commands:
+			return None
+		return commands.get(command)
+
+	def parse_instruction(self, commandline, prefixes):
+		parsedCommand = self.find_command_and_options(commandline, prefixes)
+		if not parsedCommand:
+			return None
+
+		plugin = self.find_command_plugin(parsedCommand[0])
+		return ScriptInstruction(parsedCommand[0], parsedCommand[1], parsedCommand[2], commandline, plugin)
+
+	def compile_script(self, script, prefixes):
+		"""
+		Parse a script once into instructions and resolve its if/else/endif and for/endfor blocks
+		"""
+		instructions = []
+		openBlocks = []
+
+		for l in script.split("\n"):
+			l = l.strip()
+
+			instruction = self.parse_instruction(l, prefixes)
+			if not instruction:
+				continue
+
+			if instruction.plugin and instruction.command in instruction.plugin.block_cmds:
+				instruction.block = instruction.plugin.block_cmds[instruction.command]
+				openBlocks.append(instruction)
+			elif len(openBlocks):
+				opener = openBlocks[len(openBlocks)-1]
+				if instruction.command == opener.block.keywords[0] and opener.block_else == None:
+					opener.block_else = len(instructions)
+				elif instruction.command == opener.block.keywords[1]:
+					opener.block_end = len(instructions)
+					if opener.block_else != None:
+						instructions[opener.block_else].block_end = opener.block_end
+					openBlocks.pop()
+
+			instructions.append(instruction)
+
+		return CompiledScript(script, prefixes, instructions)
+
+	def get_compiled_script(self, scope, script, cached):
+		"""
+		Return the compiled form of a script. Stored scripts, like the ones of triggers, are cached by source and prefixes
+		"""
+		prefixes = tuple(scope.prefixes)
+		if not cached:
+			return self.compile_script(script, prefixes)
+
+		key = (script, prefixes)
+		compiled = self.compiled_scripts.get(key)
+		if compiled:
+			self.compiled_scripts.move_to_end(key)
+			return compiled
+
+		compiled = self.compile_script(script, prefixes)
+		self.compiled_scripts[key] = compiled
+		while len(self.compiled_scripts) > self.compiled_scripts_max:
+			self.compiled_scripts.popitem(last=False)
+		return compiled
+
 	async def execute_command(self, scope, commandline):
+		instruction = self.parse_instruction(commandline, scope.prefixes)
+		if not instruction:
+			return False
+
+		return await self.execute_instruction(scope, instruction)
+
+	async def execute_instruction(self, scope, instruction):
+		savepoint = scope.savepoint()
 		try:
 			if scope.iter > 128:
 				raise TooLongExecutionError()
 
-			parsedCommand = self.find_command_and_options(commandline, scope.prefixes)
-			if not parsedCommand:
-				return False
-
-			for p in self.plugins:
-				if await p.execute_command(scope, parsedCommand[0], parsedCommand[1], parsedCommand[2]):
+			if instruction.plugin:
+				if await instruction.plugin.execute_command(scope, instruction.command, instruction.options, instruction.lines):
+					scope.iter = scope.iter+1
+					return True
+			else:
+				plugin = self.find_custom_command_plugin(scope.guild, instruction.command)
+				if plugin and await plugin.execute_unregistered_command(scope, instruction.command, instruction.options, instruction.lines):
 					scope.iter = scope.iter+1
 					return True
 
-			raise CommandNotFoundError(parsedCommand[0])
+			raise CommandNotFoundError(instruction.command)
 
 		except CommandNotFoundError as e:
 			await self.print_error(scope, "Command `{}` not found.".format(e.command))
@@ -445,32 +1947,63 @@ class Shell:
 		except RegexError as e:
 			await self.print_error(scope, "`{}` is not a valid regular expression.".format(e.regex))
 			scope.abort = True
+		except RegexTimeoutError as e:
+			await self.print_error(scope, "`{}` took too long to evaluate and was stopped.".format(e.regex))
+			scope.abort = True
 		except sqlite3.OperationalError as e:
-			print(traceback.format_exc())
-			await self.print_fatal(scope, "**SQL error.** Please contact <@203135242813440001>.\nCommand line: `{}`".format(commandline))
+			shell_log.exception("SQL error in %s", instruction.commandline, extra={"guild": scope.guild.id})
+			await self.print_fatal(scope, "**SQL error.** Please contact <@203135242813440001>.\nCommand line: `{}`".format(instruction.commandline))
 			scope.abort = True
 		except Exception as e:
-			print(traceback.format_exc())
-			await self.print_fatal(scope, "**PraxisBot Internal Error.** Please contact <@203135242813440001>.\nException: ``{}``\nCommand line: `{}`".format(type(e).__name__,commandline))
+			shell_log.exception("Internal error in %s", instruction.commandline, extra={"guild": scope.guild.id})
+			await self.print_fatal(scope, "**PraxisBot Internal Error.** Please contact <@203135242813440001>.\nException: ``{}``\nCommand line: `{}`".format(type(e).__name__,instruction.commandline))
 			scope.abort = True
 
+		#The instruction failed: drop its writes. execute_script drops the ones of the rest of the script
+		scope.rollback(savepoint)
+		scope.failed = True
 		return False
 
-	async def execute_script(self, scope, script):
-		lines = script.split("\n");
+	async def execute_script(self, scope, script, cached=False):
+		instructions = self.get_compiled_script(scope, script, cached).instructions
+		savepoint = scope.savepoint()
 
-		for l in lines:
-			l = l.strip()
-
-			parsedCommand = self.find_command_and_options(l, scope.prefixes)
-			if not parsedCommand:
-				continue
+		i = 0
+		while i < len(instructions):
+			instruction = instructions[i]
+			i = i+1
 
-			await scope.execute_script(parsedCommand[0], l)
+			numBlocks = len(scope.blocks)
+			await scope.execute_script(instruction)
 
 			if scope.abort:
+				#Writes of other scripts of the event, like other message triggers, are kept
+				if scope.failed:
+					scope.rollback(savepoint)
 				break
 
+			if instruction.block_end == None:
+				continue
+
+			#An else that switches its block off: jump to the endif
+			if instruction.block == None:
+				b = scope.blocks[len(scope.blocks)-1] if len(scope.blocks) else None
+				if type(b) == ExecutionBlockIf and not b.execute:
+					i = instruction.block_end
+				continue
+
+			if len(scope.blocks) <= numBlocks:
+				continue
+
+			#Jump over the content of the block that has just been opened
+			b = scope.blocks[len(scope.blocks)-1]
+			if type(b) == ExecutionBlockIf and not b.execute:
+				i = instruction.block_else if instruction.block_else != None else instruction.block_end
+			elif type(b) == ExecutionBlockFor:
+				if len(b.list):
+					b.cmds = instructions[i:instruction.block_end]
+				i = instruction.block_end
+
 	async def send(self, channel, text, e=None):
 		if e:
 			return await self.client.send(channel, text, embed=e)
@@ -483,68 +2016,56 @@ class Shell:
 				return s
 		return None
 
+	def get_entity_index(self, guild):
+		"""
+		Return the index of a guild, built on first use and kept current by gateway events.
+		An index built before the members of the guild were all received is built again once they are
+		"""
+		index = self.entity_indexes.get(guild.id)
+		if index and (index.chunked or not guild.chunked):
+			return index
+
+		index = EntityIndex(guild)
+		self.entity_indexes[guild.id] = index
+		return index
+
+	def update_entity_index(self, guild, kind, before=None, after=None):
+		index = self.entity_indexes.get(guild.id)
+		if not index:
+			return
+
+		entities = getattr(index, kind)
+		if before:
+			entities.remove(before)
+		if after:
+			entities.add(after)
+
+	def drop_entity_index(self, guild):
+		self.entity_indexes.pop(guild.id, None)
+
 	def find_channel(self, chan_name, server):
 		if not chan_name:
 			return None
-		print("searching for chan {}".format(chan_name))
-		chan_name = str(chan_name).strip()
-		for c in server.channels:
-			if c.name == chan_name:
-				return c
-			elif str(c.id) == chan_name:
-				return c
-			elif "<#{}>".format(c.id) == chan_name:
-				return c
-			elif "#{}".format(c.id) == chan_name:
-				return c
-		print("No chan found")
-		return None
+
+		return self.get_entity_index(server).channels.find(str(chan_name).strip())
 
 	def find_member(self, member_name, server):
 		if not member_name:
 			return None
 
-		member_name = member_name.strip()
-
-		for m in server.members:
-			if "<@{}>".format(m.id) == member_name:
-				return m
-			if "<@!{}>".format(m.id) == member_name:
-				return m
-			elif "{}#{}".format(m.name,m.discriminator) == member_name:
-				return m
-			elif m.id == member_name:
-				return m
-
-		return None
+		return self.get_entity_index(server).members.find(str(member_name).strip())
 
 	def find_role(self, role_name, server):
 		if not role_name:
 			return None
 
-		for r in server.roles:
-			if "<@&{}>".format(r.id) == role_name:
-				return r
-			elif r.id == role_name:
-				return r
-			elif r.name == role_name:
-				return r
-
-		return None
+		return self.get_entity_index(server).roles.find(str(role_name))
 
 	def find_emoji(self, emoji_name, guild):
 		if not emoji_name:
 			return None
 
-		for e in guild.emojis:
-			if "<:{}:{}>".format(e.name,e.id) == emoji_name:
-				return e
-			elif e.id == emoji_name:
-				return e
-			elif e.name == emoji_name:
-				return e
-
-		return None
+		return self.get_entity_index(guild).emojis.find(str(emoji_name))
 
 	def get_default_channel(self, guild):
 		for c in guild.channels:
@@ -588,90 +2109,204 @@ class Shell:
 	def dbtable(self, name):
 		return self.dbprefix+name
 
-	def create_sql_table(self, tablename, fields):
-		sqlQuery = "CREATE TABLE IF NOT EXISTS {} ({})".format(self.dbtable(tablename),", ".join(fields))
-		self.dbcon.execute(sqlQuery);
+	def load_schema_versions(self):
+		"""
+		Read the schema version of the shell and of every plugin
+		"""
+		def load(dbcon):
+			dbcon.execute("CREATE TABLE IF NOT EXISTS {} (name TEXT PRIMARY KEY, version INTEGER)".format(self.dbtable("schema_version")))
+			return dict(dbcon.execute("SELECT name, version FROM {}".format(self.dbtable("schema_version"))).fetchall())
 
-		for f in fields:
-			try:
-				sqlQuery = "ALTER TABLE {} ADD {}".format(self.dbtable(tablename),f)
-				self.dbcon.execute(sqlQuery);
-			except sqlite3.OperationalError:
-				pass
+		return self.db.run_sync(load)
+
+	def migrate(self, name, migrations):
+		"""
+		Apply in one transaction the migrations newer than the schema version of name. migrations[i] upgrades the schema from version i to i+1
+		"""
+		version = self.schema_versions.get(name, 0)
+		if version >= len(migrations):
+			return
+
+		def apply(dbcon):
+			dbcon.execute("BEGIN")
+			for steps in migrations[version:]:
+				for step in steps:
+					step.apply(self, dbcon)
+			dbcon.execute(*self.sql_upsert("schema_version", {"version": len(migrations)}, {"name": name}))
+
+		self.db.run_sync(apply)
+		self.schema_versions[name] = len(migrations)
+		sql_log.info("Schema of %s migrated from version %d to %d", name, version, len(migrations))
 
-	def get_sql_data(self, tablename, fields, where, array=False):
+	def check_query_plans(self):
+		"""
+		Report queries declared by plugins that SQLite still plans as a full scan
+		"""
+		def check(dbcon):
+			scans = []
+			for p in self.plugins:
+				for tablename, columns in p.queries:
+					sqlQuery, vars = self.sql_select(tablename, ["*"], dict.fromkeys(columns))
+					for row in dbcon.execute("EXPLAIN QUERY PLAN "+sqlQuery, vars):
+						if row[3].startswith("SCAN"):
+							scans.append((p.name, sqlQuery, row[3]))
+			return scans
+
+		for name, sqlQuery, detail in self.db.run_sync(check):
+			sql_log.warning("Full scan in plugin %s: %s (%s)", name, sqlQuery, detail, extra={"plugin": name})
+
+	def sql_select(self, tablename, fields, where):
 		sqlQuery = "SELECT {} FROM {}".format(", ".join(fields),self.dbtable(tablename))
 		vars = list(where.values())
 		if where:
 			sqlQuery+=" WHERE {} = ?".format(" = ? AND ".join(where.keys()))
+		return sqlQuery, vars
 
-		c = self.dbcon.cursor()
-		print("REQUEST : {}; with {}".format(sqlQuery,vars))
-		datas = c.execute(sqlQuery,vars)
-		r = c.fetchall() if array else c.fetchone()
-		if r:
-			print("RÉSULTS : {}".format(r))
-			return r
-
-		return None
-
-	def set_sql_data(self, tablename, fields, where, id="id"):
-		idFound = self.get_sql_data(tablename, [id], where)
-		db = self.dbtable(tablename)
-		if idFound:
-			sqlQuery = "UPDATE {} SET {} = ? WHERE {} = ?".format(db," = ?, ".join(fields.keys()),id)
-			vars = list(fields.values()) + list(idFound)
-			print("REQUEST : {}; with {}".format(sqlQuery,vars))
-			self.dbcon.execute(sqlQuery, vars)
-		else:
-			fnw = list(fields)+list(where)
-			sqlQuery = "INSERT INTO {} ({}) VALUES ({})".format(db,", ".join(fnw),", ".join(["?"]*len(fnw)))
-			vars = list(fields.values()) + list(where.values())
-			print("REQUEST : {}; with {}".format(sqlQuery,vars))
-			self.dbcon.execute(sqlQuery, vars)
-
-	def update_sql_data(self, tablename, fields, where):
-		db = self.dbtable(tablename)
-		sqlQuery = "UPDATE {} SET {} = ?".format(db, " = ?, ".join(fields.keys()))
+	def sql_update(self, tablename, fields, where):
+		sqlQuery = "UPDATE {} SET {} = ?".format(self.dbtable(tablename), " = ?, ".join(fields.keys()))
 		vars = list(fields.values()) + list(where.values())
-		first = True
 		if where:
 			sqlQuery += " WHERE {} = ?".format(" = ? AND ".join(where))
-		print("REQUEST : {}; with {}".format(sqlQuery,vars))
-		self.dbcon.execute(sqlQuery, vars)
+		return sqlQuery, vars
 
-	def add_sql_data(self, tablename, fields):
+	def sql_insert(self, tablename, fields):
 		sqlQuery = "INSERT INTO {} ({}) VALUES ({})".format(self.dbtable(tablename),", ".join(fields.keys()),", ".join(["?"]*len(fields)))
-		vars = list(fields.values())
-		print("REQUEST : {}; with {}".format(sqlQuery,vars))
-		c = self.dbcon.cursor()
-		c.execute(sqlQuery, vars)
-		print("RESULT : {}".format(c.lastrowid))
-		return c.lastrowid
-
-	def delete_sql_data(self, tablename, where):
+		return sqlQuery, list(fields.values())
+
+	def sql_delete(self, tablename, where):
 		sqlQuery = "DELETE FROM {} WHERE {} = ?".format(self.dbtable(tablename)," = ? AND ".join(where.keys()))
-		vars = list(where.values())
-		print("REQUEST : {}; with {}".format(sqlQuery,vars))
+		return sqlQuery, list(where.values())
 
-		self.dbcon.execute(sqlQuery, vars)
+	def sql_upsert(self, tablename, fields, where):
+		"""
+		Insert a row, or update fields if a row matching where exists. Columns of where must be a unique key of the table
+		"""
+		sqlQuery, vars = self.sql_insert(tablename, {**where, **fields})
+		sqlQuery += " ON CONFLICT({}) DO ".format(", ".join(where.keys()))
+		if fields:
+			sqlQuery += "UPDATE SET {}".format(", ".join("{0} = excluded.{0}".format(f) for f in fields))
+		else:
+			sqlQuery += "NOTHING"
+		return sqlQuery, vars
+
+	async def get_sql_data(self, tablename, fields, where, array=False, scope=None):
+		db = scope.db if scope else self.db
+		sqlQuery, vars = self.sql_select(tablename, fields, where)
+		sql_log.debug("REQUEST: %s; with %s", sqlQuery, vars)
+		if array:
+			r = await db.fetchall(sqlQuery, vars)
+		else:
+			r = await db.fetchone(sqlQuery, vars)
+		if r:
+			sql_log.debug("RESULT: %s", r)
+			return r
+
+		return None
+
+	async def set_sql_data(self, tablename, fields, where, scope=None):
+		sqlQuery, vars = self.sql_upsert(tablename, fields, where)
+		sql_log.debug("REQUEST: %s; with %s", sqlQuery, vars)
+		await (scope.db if scope else self.db).write(sqlQuery, vars)
+
+	async def update_sql_data(self, tablename, fields, where, scope=None):
+		sqlQuery, vars = self.sql_update(tablename, fields, where)
+		sql_log.debug("REQUEST: %s; with %s", sqlQuery, vars)
+		await (scope.db if scope else self.db).write(sqlQuery, vars)
+
+	async def add_sql_data(self, tablename, fields, scope=None, return_id=False):
+		"""
+		Insert a row. With a scope, the insert is queued in its unit of work. With return_id, the id of the row
+		is reserved first and returned, so that the insert can still be queued: the table must have an id primary key
+		"""
+		rowid = None
+		if return_id or self.dbtable(tablename) in self.db.next_ids:
+			#Once a table has reserved ids, all its rows take one: SQLite could give a reserved id to another row
+			rowid = await (scope.db if scope else self.db).reserve_id(self.dbtable(tablename))
+			fields = {"id": rowid, **fields}
+
+		sqlQuery, vars = self.sql_insert(tablename, fields)
+		sql_log.debug("REQUEST: %s; with %s", sqlQuery, vars)
+		if scope:
+			await scope.db.write(sqlQuery, vars)
+			return rowid
+
+		lastrowid = await self.db.execute(sqlQuery, vars)
+		sql_log.debug("RESULT: %s", lastrowid)
+		return lastrowid
+
+	async def delete_sql_data(self, tablename, where, scope=None):
+		sqlQuery, vars = self.sql_delete(tablename, where)
+		sql_log.debug("REQUEST: %s; with %s", sqlQuery, vars)
+		await (scope.db if scope else self.db).write(sqlQuery, vars)
 
 ################################################################################
 # Plugin
 ################################################################################
 
+class CommandParser(argparse.ArgumentParser):
+	"""
+	Parser of command options raising exceptions instead of writing on stdout/stderr and exiting
+	"""
+	def error(self, message):
+		raise OptionsError(message, self.format_usage())
+
+	def print_help(self, file=None):
+		raise OptionsHelp(self.format_help())
+
+	def exit(self, status=0, message=None):
+		raise OptionsError(message or "", self.format_usage())
+
 class Plugin:
 	"""
 	Base class of all plugins
 	"""
 
+	#Ordered list of migrations, each one being a list of steps (SQLTable, SQLIndex, SQLStatement). Never edit a released migration, append a new one
+	migrations = []
+
+	#Lookups done by the plugin, as (table, columns compared with =), checked against query plans at startup
+	queries = []
+
 	def __init__(self, shell):
 		self.shell = shell
 		self.cmds = {}
+		self.block_cmds = {}
+		self.parsers = {}
+		self.log = PluginLogAdapter(logging.getLogger("praxisbot.plugins."+self.name.lower()), {"plugin": self.name})
+
+	async def on_ready(self, scope):
+		return
 
-	async def on_loop(self, scope):
+	async def on_close(self):
+		"""
+		Persist the state kept in memory before the database is closed
+		"""
 		return
 
+	def schedule(self, guild, name, func, due=None, interval=None, scope=None):
+		"""
+		Run func(scope) for guild at due (a timestamp, now by default), then every interval seconds if interval is given.
+		With a scope, the previous job is put back if the writes of the scope are rolled back
+		"""
+		self.keep_job(guild, name, scope)
+		self.shell.jobs.schedule((self.name, guild.id, name), guild, func, due, interval)
+
+	def unschedule(self, guild, name, scope=None):
+		self.keep_job(guild, name, scope)
+		self.shell.jobs.cancel((self.name, guild.id, name))
+
+	def keep_job(self, guild, name, scope):
+		if scope:
+			key = (self.name, guild.id, name)
+			job = self.shell.jobs.get(key)
+			scope.on_rollback(lambda: self.shell.jobs.restore(key, job))
+
+	def scheduled(self, guild, name):
+		"""
+		Time at which the job name of guild is due, or None
+		"""
+		return self.shell.jobs.due((self.name, guild.id, name))
+
 	async def list_commands(self, server):
 		return list(self.cmds.keys())
 
@@ -701,31 +2336,47 @@ class Plugin:
 		return False
 
 	async def on_reaction(self, scope, reaction):
+		"""
+		A member added reaction, a RawReaction, in the guild of scope
+		"""
 		return False
 
-	def add_command(self, name, cmd):
+	def add_command(self, name, cmd, block=None):
 		self.cmds[name] = cmd
+		self.parsers[name] = self.create_parser(name, cmd)
+		if block:
+			self.block_cmds[name] = block
 
-	async def parse_options(self, scope, parser, options):
-		isValid = False
+	def create_parser(self, name, cmd):
+		"""
+		Build once the parser of the options declared with @praxisbot.argument
+		"""
+		parser = CommandParser(description=inspect.getdoc(cmd), prog=name)
+		groups = {}
+		for args, kwargs in getattr(cmd, "arguments", []):
+			kwargs = dict(kwargs)
+			group = kwargs.pop("exclusive_group", None)
+			if group == None:
+				parser.add_argument(*args, **kwargs)
+			else:
+				if group not in groups:
+					groups[group] = parser.add_mutually_exclusive_group()
+				groups[group].add_argument(*args, **kwargs)
+		return parser
 
-		argParseOutput = io.StringIO()
-		argParseError = io.StringIO()
+	async def parse_options(self, scope, parser, options):
 		try:
-			with RedirectOutput(argParseOutput, argParseError):
-				args = parser.parse_args(shlex.split(options))
-				return args
-		except:
-			if argParseOutput.getvalue():
-				await self.shell.print_info(scope, argParseOutput.getvalue())
-			if argParseError.getvalue():
-				text = argParseError.getvalue()
-				if text.find(parser.prog+": error:") >= 0:
-					parts = text.split(parser.prog+": error: ")
-					await self.shell.print_error(scope, parts[1]+"\n"+parts[0])
-				else:
-					await self.shell.print_error(scope, argParseError.getvalue())
-			pass
+			tokens = getattr(options, "tokens", None)
+			if tokens == None:
+				tokens = shlex.split(options)
+			return parser.parse_args(tokens)
+		except OptionsHelp as e:
+			await self.shell.print_info(scope, e.text)
+		except OptionsError as e:
+			await self.shell.print_error(scope, e.message+"\n"+e.usage)
+		except ValueError as e:
+			#Options that shlex cannot split, like unbalanced quotes
+			await self.shell.print_error(scope, str(e))
 
 		return None
 
@@ -743,10 +2394,34 @@ class Plugin:
 
 	def ensure_regex(self, regex):
 		try:
-		    re.compile(regex)
+		    regex_cache.compile(regex)
 		except re.error:
 		    raise RegexError(regex)
 
+################################################################################
+# Reactions
+################################################################################
+
+class RawReaction:
+	"""
+	Reaction added by a member, built from the gateway payload. The message is only fetched when a plugin asks for it
+	"""
+
+	def __init__(self, channel, payload):
+		self.channel = channel
+		self.guild = channel.guild
+		self.message_id = payload.message_id
+		self.user_id = payload.user_id
+		self.member = payload.member
+		#Like discord.Reaction, unicode emojis are strings
+		self.emoji = payload.emoji.name if payload.emoji.is_unicode_emoji() else payload.emoji
+		self.message = None
+
+	async def fetch_message(self):
+		if not self.message:
+			self.message = await self.channel.fetch_message(self.message_id)
+		return self.message
+
 ################################################################################
 # MessageStream
 ################################################################################